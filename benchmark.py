@@ -0,0 +1,422 @@
+"""Headless benchmark of the viewer, driving its main loop with scripted input.
+
+The real main loop runs against the dummy video driver. The script plays
+through the frames, switches configs and projects, and measures:
+    import time, time to the window and to the first frame on screen,
+    render time of every frame (p50, p95, p99), latency of frame steps,
+    config and project switches, playback jitter and peak memory.
+
+Usage:
+    python benchmark.py --output results.json
+    python benchmark.py --output new.json --compare results.json
+"""
+
+import time
+
+START = time.perf_counter()
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import math
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+from typing import Callable, Iterator, NamedTuple, Optional
+
+# timings where higher is worse, compared against the baseline
+COMPARED = [
+    ("window_s",),
+    ("startup_s",),
+    ("first_frame_s",),
+    ("render_ms", "p50"),
+    ("render_ms", "p95"),
+    ("frame_step_ms", "p50"),
+    ("folder_switch_ms", "cold", "p50"),
+    ("folder_switch_ms", "warm", "p50"),
+    ("project_switch_ms", "p50"),
+    ("playback", "jitter_ms"),
+    ("peak_rss_mb",),
+]
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    """Summarize values with nearest rank percentiles."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "max": ordered[-1],
+    }
+
+
+def peak_rss_mb() -> float:
+    """Return peak resident memory of the process plus its largest finished child."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # reported in kilobytes on Linux, in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return (own + children) * scale / 2**20
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Present(NamedTuple):
+    """What was on the screen after a display update."""
+
+    time: float
+    project: str
+    folder_name: str
+    image_idx: int
+    waiting: bool
+
+
+class Benchmark:
+    """Feed scripted input to the main loop and record what it does.
+
+    Scheduler of the viewer gets its wait_events wrapped, so every loop
+    iteration asks the script for input first. Renderer and display updates
+    are wrapped to time every frame and to know when it reached the screen.
+    """
+
+    def __init__(self, pygame, viewer, timeout: float):
+        """
+        Args:
+            pygame: imported pygame module.
+            viewer: viewer of every project.
+            timeout: longest time a single step of the script may take, in seconds.
+        """
+        self.pygame = pygame
+        self.viewer = viewer
+        self.timeout = timeout
+        self.presents: list[Present] = []
+        self.render_ms: list[float] = []
+        self.pressed = None
+        self.script: Optional[Iterator] = None
+        # wakes the loop regularly, so the script progresses even when it's idle
+        self.wake_event = pygame.event.custom_type()
+
+    def install(self, script: Iterator):
+        """Wrap the loop, so it's driven by the script."""
+        self.script = script
+        pygame = self.pygame
+        update = pygame.display.update
+        viewer = self.viewer
+        wait_events = viewer.scheduler.wait_events
+        render = viewer.renderer.render
+
+        def timed_update(*args, **kwargs):
+            result = update(*args, **kwargs)
+            scene = viewer.scene
+            self.presents.append(
+                Present(
+                    time.perf_counter(),
+                    scene.title,
+                    scene.folder_name,
+                    scene.image_idx,
+                    scene.frame_view.waiting,
+                )
+            )
+            return result
+
+        def scripted_wait_events(busy: bool = False):
+            if self.pressed is not None:
+                self.pressed.current = False
+                self.pressed = None
+            try:
+                injected = next(self.script)
+            except StopIteration:
+                return [self.pygame.event.Event(self.pygame.QUIT)]
+            # scripted input is handled right away, like input the loop woke up for
+            events = self.pygame.event.get() if injected else wait_events(busy)
+            return (injected or []) + [
+                event for event in events if event.type != self.wake_event
+            ]
+
+        def timed_render(screen, widgets):
+            presents = len(self.presents)
+            start = time.perf_counter()
+            dirty = render(screen, widgets)
+            if len(self.presents) > presents:
+                self.render_ms.append((time.perf_counter() - start) * 1000)
+            return dirty
+
+        pygame.display.update = timed_update
+        viewer.scheduler.wait_events = scripted_wait_events
+        viewer.renderer.render = timed_render
+        pygame.time.set_timer(self.wake_event, 50)
+
+    def press(self, button) -> list:
+        """Return events pressing the button with the keyboard."""
+        pygame = self.pygame
+        button.current = True
+        self.pressed = button
+        return [
+            pygame.event.Event(pygame.KEYDOWN, key=pygame.K_RETURN, mod=0, unicode=""),
+            pygame.event.Event(pygame.KEYUP, key=pygame.K_RETURN, mod=0, unicode=""),
+        ]
+
+    def key(self, key: int) -> list:
+        """Return events of a key stroke."""
+        pygame = self.pygame
+        return [
+            pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode=""),
+            pygame.event.Event(pygame.KEYUP, key=key, mod=0, unicode=""),
+        ]
+
+    def until(self, condition: Callable[[], bool]) -> Iterator:
+        """Let the loop run until the condition holds."""
+        deadline = time.perf_counter() + self.timeout
+        while not condition():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("benchmark step took too long")
+            yield None
+
+    def sleep(self, seconds: float) -> Iterator:
+        """Let the loop run for given time."""
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            yield None
+
+    def until_presented(
+        self, matches: Callable[[Present], bool], events: list
+    ) -> Iterator:
+        """Inject the events and let the loop run until a matching frame reaches the screen.
+
+        Returns:
+            time from the input until the first matching display update, in ms.
+        """
+        since = time.perf_counter()
+        checked = len(self.presents)
+        found = []
+        yield events
+
+        def condition():
+            nonlocal checked
+            found.extend(p for p in self.presents[checked:] if matches(p))
+            checked = len(self.presents)
+            return bool(found)
+
+        yield from self.until(condition)
+        return (found[0].time - since) * 1000
+
+    def switch_folders(self, scene, layout, texts: list[str], rounds: int, results):
+        """Click through checkboxes, measuring time until each frame is displayed."""
+        seen = {scene.folder_name}
+        for _ in range(rounds):
+            for text in texts:
+                if layout[text].active:
+                    continue
+                previous = scene.folder_name
+                latency = yield from self.until_presented(
+                    lambda p: p.folder_name != previous and not p.waiting,
+                    self.press(layout[text]),
+                )
+                kind = "warm" if scene.folder_name in seen else "cold"
+                results[kind].append(latency)
+                seen.add(scene.folder_name)
+
+    def scenario(self, results: dict, play_seconds: float, rounds: int) -> Iterator:
+        """Script of the benchmark, fills the results as it goes."""
+        pygame = self.pygame
+        project_checkboxes = self.viewer.project_checkboxes
+        lego = self.viewer.scenes["Sampling"]
+        mednerf = self.viewer.scenes["Mednerf"]
+        yield from self.until(lambda: bool(self.presents))
+        results["first_frame_s"] = self.presents[0].time - START
+
+        steps = []
+        for _ in range(20):
+            previous = lego.image_idx
+            steps.append(
+                (
+                    yield from self.until_presented(
+                        lambda p: p.image_idx != previous and not p.waiting,
+                        self.key(pygame.K_RIGHT),
+                    )
+                )
+            )
+        results["frame_step_ms"] = percentiles(steps)
+
+        play_start = time.perf_counter()
+        yield self.press(lego.play_button)
+        yield from self.sleep(play_seconds)
+        yield self.press(lego.play_button)
+        results["playback"] = self.playback_stats(play_start, lego.play_speed)
+
+        switches = {"cold": [], "warm": []}
+        yield from self.switch_folders(
+            lego, lego.samples_checkboxes, ["16", "32", "64", "128"], rounds, switches
+        )
+        project_switches = [
+            (
+                yield from self.until_presented(
+                    lambda p: p.project == mednerf.title and not p.waiting,
+                    self.press(project_checkboxes["Mednerf"]),
+                )
+            )
+        ]
+        yield from self.switch_folders(
+            mednerf,
+            mednerf.samples_checkboxes,
+            list(mednerf.samples_checkboxes.checkboxes),
+            rounds,
+            switches,
+        )
+        project_switches.append(
+            (
+                yield from self.until_presented(
+                    lambda p: p.project == lego.title and not p.waiting,
+                    self.press(project_checkboxes["Sampling"]),
+                )
+            )
+        )
+
+        results["folder_switch_ms"] = {
+            kind: percentiles(values) for kind, values in switches.items()
+        }
+        results["project_switch_ms"] = percentiles(project_switches)
+        results["render_ms"] = percentiles(self.render_ms)
+
+    def playback_stats(self, since: float, frame_duration: float) -> dict:
+        """Describe how regularly frames changed during playback."""
+        changes = []
+        previous = None
+        for present in self.presents:
+            if present.time < since:
+                continue
+            if previous is not None and present.image_idx != previous:
+                changes.append(present.time)
+            previous = present.image_idx
+        intervals = [(b - a) * 1000 for a, b in zip(changes, changes[1:])]
+        deviations = [interval - frame_duration * 1000 for interval in intervals]
+        return {
+            "frames": len(changes),
+            "frame_duration_ms": frame_duration * 1000,
+            "interval_ms": percentiles(intervals),
+            "jitter_ms": statistics.pstdev(deviations) if deviations else 0.0,
+            "max_late_ms": max(deviations, default=0.0),
+        }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return descriptions of timings that got worse than baseline by more than tolerance."""
+    regressions = []
+    for path in COMPARED:
+        new, old = results, baseline
+        for key in path:
+            new = new.get(key, {}) if isinstance(new, dict) else None
+            old = old.get(key, {}) if isinstance(old, dict) else None
+        if not isinstance(new, (int, float)) or not isinstance(old, (int, float)):
+            continue
+        change = (new - old) / old if old else 0.0
+        name = ".".join(path)
+        print(f"{name:<32} {old:>10.2f} -> {new:>10.2f} ({change:+.0%})")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the viewer headlessly and store results as JSON."
+    )
+    parser.add_argument("--output", default="benchmark.json", help="results file")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="relative slowdown reported as regression (default: 0.2)",
+    )
+    parser.add_argument(
+        "--play-seconds", type=float, default=3, help="how long to play frames"
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=2, help="how many times to cycle through configs"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30, help="longest step of the script"
+    )
+    parser.add_argument(
+        "--no-pack-cache",
+        action="store_true",
+        help="decode frames from images instead of frame packs",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    import pygame
+
+    import helpers
+    from telemetry import registry
+
+    results = {"import_s": time.perf_counter() - START}
+    import nerf_gui
+    from viewer import Loader
+
+    screen = nerf_gui.open_window()
+    results["window_s"] = time.perf_counter() - START
+    viewer = nerf_gui.create_viewer(screen)
+    # loading is done upfront, so it doesn't compete with the measured loop
+    Loader(viewer, packs=not args.no_pack_cache).run()
+    results["startup_s"] = time.perf_counter() - START
+
+    benchmark = Benchmark(pygame, viewer, args.timeout)
+    benchmark.install(benchmark.scenario(results, args.play_seconds, args.rounds))
+    viewer.run()
+    results["peak_rss_mb"] = peak_rss_mb()
+    results["text_cache_hit_rate"] = helpers.text_cache.hit_rate
+    results["registry"] = registry.snapshot()
+    results["meta"] = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "pack_cache": not args.no_pack_cache,
+    }
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
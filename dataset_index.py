@@ -0,0 +1,232 @@
+import os
+import re
+import struct
+import warnings
+from dataclasses import dataclass, field
+from typing import Optional
+
+import videostream
+
+FRAMES_DIR = "video_200000"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SIGNATURE = b"\xff\xd8"
+# start of frame markers, the only jpeg segments describing image dimensions
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7}
+JPEG_SOF_MARKERS |= {0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+@dataclass
+class FolderInfo:
+    """Description of a single config folder, gathered without decoding any frame."""
+
+    name: str
+    frame_paths: list[str]
+    params: dict[str, str]
+    image_format: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    first_index: Optional[int] = None
+    problems: list[str] = field(default_factory=list)
+    # set for folders storing a video instead of a directory of frames
+    video_path: Optional[str] = None
+    video: Optional[videostream.VideoIndex] = None
+
+    @property
+    def frame_count(self) -> int:
+        if self.video is not None:
+            return self.video.frame_count
+        return len(self.frame_paths)
+
+
+def read_image_header(image_path: str) -> tuple[str, int, int]:
+    """Read format and dimensions of PNG or JPEG image from its header only.
+
+    Returns:
+        (format, width, height)
+    """
+    with open(image_path, "rb") as file:
+        head = file.read(24)
+        if head.startswith(PNG_SIGNATURE):
+            # IHDR chunk always comes first
+            width, height = struct.unpack(">II", head[16:24])
+            return "png", width, height
+        if head.startswith(JPEG_SIGNATURE):
+            file.seek(2)
+            while True:
+                byte = file.read(1)
+                if not byte:
+                    break
+                if byte != b"\xff":
+                    continue
+                marker = file.read(1)
+                while marker == b"\xff":
+                    marker = file.read(1)
+                if not marker:
+                    break
+                length = struct.unpack(">H", file.read(2))[0]
+                if marker[0] in JPEG_SOF_MARKERS:
+                    height, width = struct.unpack(">xHH", file.read(5))
+                    return "jpeg", width, height
+                file.seek(length - 2, os.SEEK_CUR)
+    raise ValueError(f"{image_path} is not a PNG or JPEG image")
+
+
+def scan_video_folder(
+    folder_path: str, name: str, params: dict[str, str]
+) -> FolderInfo:
+    """Describe folder storing its frames as a single video, reading its index only."""
+    info = FolderInfo(name=name, frame_paths=[], params=params)
+    with os.scandir(folder_path) as entries:
+        video_paths = sorted(
+            entry.path
+            for entry in entries
+            if entry.is_file()
+            and entry.name.lower().endswith(videostream.VIDEO_EXTENSIONS)
+        )
+    if not video_paths:
+        info.problems.append("no frames")
+        return info
+    if len(video_paths) > 1:
+        info.problems.append(
+            f"several videos, using {os.path.basename(video_paths[0])}"
+        )
+    try:
+        video = videostream.read_index(video_paths[0])
+    except (OSError, ValueError, KeyError, struct.error) as error:
+        info.problems.append(str(error))
+        return info
+    if not video.frame_count:
+        info.problems.append("no frames")
+        return info
+    info.video_path = video_paths[0]
+    info.video = video
+    info.image_format = "video"
+    info.width, info.height = video.width, video.height
+    info.first_index = 0
+    return info
+
+
+def scan_folder(folder_path: str, name: str, params: dict[str, str]) -> FolderInfo:
+    """Describe frames of the folder and check they make up a valid sequence.
+
+    Frames have to be numbered consecutively, starting either from 0 or 1,
+    and share format and dimensions. Folder without the frames directory
+    may store the frames as a video instead.
+    """
+    frames_path = os.path.join(folder_path, FRAMES_DIR)
+    if not os.path.isdir(frames_path):
+        return scan_video_folder(folder_path, name, params)
+    with os.scandir(frames_path) as entries:
+        frame_paths = sorted(entry.path for entry in entries if entry.is_file())
+    info = FolderInfo(name=name, frame_paths=frame_paths, params=params)
+    if not frame_paths:
+        info.problems.append("no frames")
+        return info
+
+    numbers = []
+    headers = set()
+    for frame_path in frame_paths:
+        stem = os.path.splitext(os.path.basename(frame_path))[0]
+        if not stem.isdigit():
+            info.problems.append(f"{os.path.basename(frame_path)} is not numbered")
+            continue
+        numbers.append(int(stem))
+        try:
+            headers.add(read_image_header(frame_path))
+        except (OSError, ValueError, struct.error) as error:
+            info.problems.append(str(error))
+
+    if numbers:
+        info.first_index = min(numbers)
+        if info.first_index not in (0, 1):
+            info.problems.append(f"numbering starts at {info.first_index}")
+        expected = range(info.first_index, info.first_index + len(numbers))
+        if sorted(numbers) != list(expected):
+            missing = sorted(set(expected) - set(numbers))
+            info.problems.append(f"frames are not numbered consecutively {missing}")
+    if len(headers) == 1:
+        info.image_format, info.width, info.height = headers.pop()
+    elif headers:
+        info.problems.append(f"frames differ in format or size {sorted(headers)}")
+    return info
+
+
+class DatasetIndex:
+    """Index of config folders in a dataset, keyed by parameters parsed from their names.
+
+    Dataset directory is scanned once upon creation, reading only headers
+    of images and videos.
+    Full set of parameters is looked up in constant time.
+    """
+
+    def __init__(self, dataset_dir: str, pattern: Optional[str] = None) -> None:
+        """
+        Args:
+            dataset_dir: directory containing config folders.
+            pattern: regular expression with named groups, one for every
+                parameter encoded in the folder name. Folders not matching
+                it are skipped. Without pattern, folders are indexed by name only.
+        """
+        self.dataset_dir = dataset_dir
+        self.pattern = re.compile(pattern) if pattern else None
+        self.param_names = tuple(self.pattern.groupindex) if self.pattern else ()
+        self.folders: dict[str, FolderInfo] = {}
+        self.by_params: dict[tuple[str, ...], FolderInfo] = {}
+
+        with os.scandir(dataset_dir) as entries:
+            folder_entries = sorted(
+                (entry for entry in entries if entry.is_dir()), key=lambda e: e.name
+            )
+        for entry in folder_entries:
+            params = {}
+            if self.pattern:
+                match = self.pattern.fullmatch(entry.name)
+                if match is None:
+                    continue
+                params = match.groupdict()
+            info = scan_folder(entry.path, entry.name, params)
+            if info.problems:
+                warnings.warn(f"{entry.path}: {'; '.join(info.problems)}")
+            if not info.frame_count:
+                continue
+            self.folders[entry.name] = info
+            self.by_params[self.key(params)] = info
+
+    def key(self, params: dict) -> tuple[str, ...]:
+        """Build lookup key from parameters, ignoring any that are not indexed."""
+        return tuple(str(params[name]) for name in self.param_names)
+
+    def lookup(self, params: dict) -> Optional[FolderInfo]:
+        """Return folder matching all the indexed parameters, None if there's none."""
+        return self.by_params.get(self.key(params))
+
+    def is_available(self, params: dict) -> bool:
+        """Check whether folder for given parameters exists."""
+        return self.key(params) in self.by_params
+
+    def folder_name(self, params: dict) -> str:
+        """Return name of the folder matching given parameters."""
+        info = self.lookup(params)
+        if info is None:
+            wanted = dict(zip(self.param_names, self.key(params)))
+            raise KeyError(f"No folder in {self.dataset_dir} for {wanted}")
+        return info.name
+
+    def find(self, **params) -> list[FolderInfo]:
+        """Return all folders matching given subset of parameters."""
+        wanted = {name: str(value) for name, value in params.items()}
+        return [
+            info
+            for info in self.folders.values()
+            if all(info.params[name] == value for name, value in wanted.items())
+        ]
+
+    def values(self, param: str, **fixed) -> set[str]:
+        """Return values of the parameter available with other parameters fixed."""
+        return {info.params[param] for info in self.find(**fixed)}
+
+    def __contains__(self, folder_name: str) -> bool:
+        return folder_name in self.folders
+
+    def __len__(self):
+        return len(self.folders)
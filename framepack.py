@@ -0,0 +1,218 @@
+"""Persistent cache of decoded frames, one packed file per config folder.
+
+Pack layout:
+    header: magic, version, width, height, buffer format, level count,
+        frame count, manifest size
+    manifest: json list of [file name, mtime in ns, size in bytes] of source files,
+        every frame or a single video
+    frames: raw pixels of every frame, starting at page aligned offset.
+        Every frame is stored in every level of its pyramid, one after another:
+        level 0 in the size of the pack, every next one half the size of the previous
+
+Frames are stored in the layout of display surfaces, so a level matching
+the displayed size can be wrapped into a surface straight from the mapped file.
+Packs are built once, level 0 keeps every pixel of the source frames.
+Any other size is resampled from the nearest level, never from the source.
+"""
+
+import json
+import mmap
+import os
+import struct
+from typing import Optional
+
+MAGIC = b"NGFP"
+VERSION = 2
+HEADER = struct.Struct("<4sHII4sHII")
+PAGE_SIZE = mmap.ALLOCATIONGRANULARITY
+BYTES_PER_PIXEL = 4
+
+
+def pack_path(pack_dir: str, folder_name: str) -> str:
+    """Return path of the pack storing frames of given folder."""
+    return os.path.join(pack_dir, f"{folder_name}.pack")
+
+
+def source_manifest(frame_paths: list[str]) -> list[list]:
+    """Describe source frames by their name, modification time and size."""
+    manifest = []
+    for frame_path in frame_paths:
+        stat = os.stat(frame_path)
+        manifest.append([os.path.basename(frame_path), stat.st_mtime_ns, stat.st_size])
+    return manifest
+
+
+def data_offset(manifest_size: int) -> int:
+    """Return offset of the first frame, rounded up to the page boundary."""
+    end = HEADER.size + manifest_size
+    return (end + PAGE_SIZE - 1) // PAGE_SIZE * PAGE_SIZE
+
+
+def read_header(path: str) -> Optional[dict]:
+    """Read header and manifest of the pack, return None if it's missing or corrupted."""
+    try:
+        with open(path, "rb") as file:
+            header = HEADER.unpack(file.read(HEADER.size))
+            magic, version, width, height, buffer_format, levels = header[:6]
+            count, manifest_size = header[6:]
+            if magic != MAGIC or version != VERSION:
+                return None
+            manifest = json.loads(file.read(manifest_size))
+    except (OSError, struct.error, ValueError):
+        return None
+    return {
+        "size": (width, height),
+        "format": buffer_format.decode(),
+        "levels": levels,
+        "count": count,
+        "manifest": manifest,
+        "offset": data_offset(manifest_size),
+    }
+
+
+def is_valid(
+    path: str,
+    frame_paths: list[str],
+    min_size: tuple[int, int],
+    buffer_format: str,
+    levels: int = 1,
+) -> bool:
+    """Check whether the pack is up to date with its source frames.
+
+    Pack of any size is valid as long as level 0 is at least min_size,
+    usually the size of the source frames, so no detail of them is lost.
+    """
+    header = read_header(path)
+    if header is None:
+        return False
+    if header["format"] != buffer_format or header["levels"] != levels:
+        return False
+    width, height = header["size"]
+    if width < min_size[0] or height < min_size[1]:
+        return False
+    expected_size = header["offset"] + header["count"] * record_nbytes(
+        header["size"], levels
+    )
+    if os.path.getsize(path) != expected_size:
+        return False
+    return header["manifest"] == source_manifest(frame_paths)
+
+
+def frame_nbytes(size: tuple[int, int]) -> int:
+    """Return number of bytes of a single frame of given size."""
+    return size[0] * size[1] * BYTES_PER_PIXEL
+
+
+def level_size(size: tuple[int, int], level: int) -> tuple[int, int]:
+    """Return size of the frame in given level of the pyramid."""
+    return max(size[0] >> level, 1), max(size[1] >> level, 1)
+
+
+def record_nbytes(size: tuple[int, int], levels: int) -> int:
+    """Return number of bytes of a single frame stored in every level."""
+    return sum(frame_nbytes(level_size(size, level)) for level in range(levels))
+
+
+def write_pack(
+    path: str,
+    frame_paths: list[str],
+    size: tuple[int, int],
+    buffer_format: str,
+    buffers,
+    levels: int = 1,
+) -> int:
+    """Write pack atomically, so a crash never leaves a half written pack behind.
+
+    Args:
+        path: where to store the pack.
+        frame_paths: paths of source files, frames in order or a single video.
+        size: size the frames were scaled to, size of level 0.
+        buffer_format: pygame name of the pixels layout, e.g. "BGRA".
+        buffers: raw pixels of every frame, in order, every level of a frame
+            joined in a single buffer.
+        levels: number of levels of the pyramid stored for every frame.
+
+    Returns:
+        number of frames written.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    manifest = json.dumps(source_manifest(frame_paths)).encode()
+
+    def header(count: int) -> bytes:
+        return HEADER.pack(
+            MAGIC,
+            VERSION,
+            size[0],
+            size[1],
+            buffer_format.encode(),
+            levels,
+            count,
+            len(manifest),
+        )
+
+    tmp_path = f"{path}.tmp"
+    count = 0
+    try:
+        with open(tmp_path, "wb") as file:
+            file.write(header(count))
+            file.write(manifest)
+            file.write(b"\0" * (data_offset(len(manifest)) - file.tell()))
+            for buffer in buffers:
+                file.write(buffer)
+                count += 1
+            # frames are counted only once written, a video doesn't tell upfront
+            file.seek(0)
+            file.write(header(count))
+    except BaseException:
+        # frames failed to decode, no partial pack stays behind
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return count
+
+
+class FramePack:
+    """Memory mapped pack, gives access to its frames without copying them."""
+
+    def __init__(self, path: str) -> None:
+        header = read_header(path)
+        if header is None:
+            raise ValueError(f"{path} is not a valid frame pack")
+        self.path = path
+        self.size = header["size"]
+        self.format = header["format"]
+        self.levels = header["levels"]
+        self.count = header["count"]
+        self.offset = header["offset"]
+        self.level_sizes = [level_size(self.size, i) for i in range(self.levels)]
+        # where every level starts within the frame
+        self.level_offsets = [
+            sum(frame_nbytes(size) for size in self.level_sizes[:i])
+            for i in range(self.levels)
+        ]
+        self.record_nbytes = record_nbytes(self.size, self.levels)
+        with open(path, "rb") as file:
+            # copy on write mapping, surfaces wrapping it may be drawn onto
+            # without ever touching the file
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        self.view = memoryview(self.mmap)
+
+    def frame(self, idx: int, level: int = 0) -> memoryview:
+        """Return raw pixels of the frame with given index, in given level."""
+        start = self.offset + idx * self.record_nbytes + self.level_offsets[level]
+        return self.view[start : start + frame_nbytes(self.level_sizes[level])]
+
+    def nearest_level(self, size: tuple[int, int]) -> int:
+        """Return the smallest level at least as large as given size.
+
+        Level 0 is returned if even that one is smaller, frames are only
+        enlarged from the full size.
+        """
+        for level in reversed(range(self.levels)):
+            width, height = self.level_sizes[level]
+            if width >= size[0] and height >= size[1]:
+                return level
+        return 0
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,406 @@
+"""Service decoding frames once into shared memory for every viewer on the machine.
+
+Viewers connect to the store over a local socket and ask for frames of
+a folder in the size they display them. The first request decodes the frames
+into a shared memory segment, every next one, from any viewer, gets the same
+segment. Viewers map the segment and wrap its frames into surfaces without
+copying, so the memory taken by the frames doesn't grow with the number
+of viewers.
+
+Protocol: every request is a tuple sent over multiprocessing.connection,
+answered by ("ok", ...) or ("error", message). A viewer may open several
+connections, so a request never waits for another one being decoded,
+each first sends the id of the viewer.
+    ("attach", frame_paths, size) -> ("ok", segment name, frame count)
+    ("release", segment name) -> ("ok",)
+Segments are reference counted by attach and release, from any connection
+of the viewer. A viewer that closes its last connection releases all its
+segments. Segment nobody uses is unlinked.
+
+Run the store with `python3 framestore.py`, then start viewers with
+`python3 nerf_gui.py --frame-store`.
+"""
+
+import argparse
+import os
+import threading
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Callable, Iterable, Optional
+
+import framepack
+import settings
+from telemetry import registry
+
+BYTES_PER_PIXEL = 4
+
+
+@dataclass
+class Segment:
+    """Shared memory holding every frame of a folder, one after another, as the store sees it."""
+
+    memory: shared_memory.SharedMemory
+    count: int
+    # source files of the frames, the segment is outdated once they change
+    manifest: list
+    refs: int = 0
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+
+class FrameStore:
+    """Decode frames into shared memory segments and hand them out to viewers."""
+
+    def __init__(
+        self,
+        decode: Callable[[list[str], tuple[int, int]], Iterable[bytes]],
+        address=settings.FRAME_STORE_ADDRESS,
+        authkey: bytes = settings.FRAME_STORE_AUTHKEY,
+    ) -> None:
+        """
+        Args:
+            decode: returns raw pixels of every frame scaled to given size, in order.
+            address: address viewers connect to.
+            authkey: key viewers authenticate with.
+        """
+        self.decode = decode
+        self.listener = Listener(address, authkey=authkey)
+        # segments by name, including outdated ones viewers still use
+        self.segments: dict[str, Segment] = {}
+        # name of the up to date segment of (frame paths, size)
+        self.current: dict[tuple, str] = {}
+        # set once the segment of (frame paths, size) being decoded is published
+        self.loading: dict[tuple, threading.Event] = {}
+        # segments attached by every viewer, and number of its open connections
+        self.attached: dict[str, Counter] = {}
+        self.connections: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def attach(self, frame_paths: list[str], size: tuple[int, int]) -> Segment:
+        """Return segment with the frames in given size, decoding them if there's none.
+
+        Frames are decoded again if any of them changed its modification
+        time or size since, viewers attached to the outdated segment keep it.
+        Decoding runs outside the lock, so other folders are served meanwhile,
+        viewers asking for the same frames wait for the segment being decoded.
+        """
+        key = (tuple(frame_paths), tuple(size))
+        manifest = framepack.source_manifest(frame_paths)
+        while True:
+            with self.lock:
+                event = self.loading.get(key)
+                if event is None:
+                    segment = self.segments.get(self.current.get(key))
+                    if segment is not None and segment.manifest == manifest:
+                        segment.refs += 1
+                        return segment
+                    if segment is not None:
+                        del self.current[key]
+                        if not segment.refs:
+                            self.unlink(segment)
+                    event = self.loading[key] = threading.Event()
+                    break
+            # if decoding fails, the next waiter decodes the frames itself
+            event.wait()
+        try:
+            segment = self.create(frame_paths, size, manifest)
+        except BaseException:
+            with self.lock:
+                del self.loading[key]
+            event.set()
+            raise
+        with self.lock:
+            del self.loading[key]
+            self.segments[segment.name] = segment
+            self.current[key] = segment.name
+            segment.refs += 1
+        event.set()
+        return segment
+
+    def create(
+        self, frame_paths: list[str], size: tuple[int, int], manifest: list
+    ) -> Segment:
+        """Decode frames into a new segment."""
+        frame_nbytes = size[0] * size[1] * BYTES_PER_PIXEL
+        memory = shared_memory.SharedMemory(
+            create=True, size=max(len(frame_paths) * frame_nbytes, 1)
+        )
+        try:
+            for i, buffer in enumerate(self.decode(frame_paths, size)):
+                memory.buf[i * frame_nbytes : (i + 1) * frame_nbytes] = buffer
+        except BaseException:
+            memory.close()
+            memory.unlink()
+            raise
+        registry.count("framestore.decoded_frames", len(frame_paths))
+        return Segment(memory, len(frame_paths), manifest)
+
+    def release(self, name: str):
+        """Drop a reference to the segment, unlinking it if nobody uses it anymore."""
+        with self.lock:
+            segment = self.segments[name]
+            segment.refs -= 1
+            if not segment.refs:
+                self.unlink(segment)
+
+    def unlink(self, segment: Segment):
+        """Remove segment, viewers that still map it keep their mapping."""
+        del self.segments[segment.name]
+        self.current = {
+            key: name for key, name in self.current.items() if name != segment.name
+        }
+        segment.memory.close()
+        segment.memory.unlink()
+
+    def handle(self, connection: Connection):
+        """Answer requests sent over a single connection of a viewer until it's closed."""
+        try:
+            viewer_id = connection.recv()
+        except (EOFError, OSError):
+            connection.close()
+            return
+        with self.lock:
+            attached = self.attached.setdefault(viewer_id, Counter())
+            self.connections[viewer_id] += 1
+        try:
+            while True:
+                try:
+                    command, *args = connection.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    if command == "attach":
+                        segment = self.attach(*args)
+                        with self.lock:
+                            attached[segment.name] += 1
+                        reply = ("ok", segment.name, segment.count)
+                    elif command == "release" and self.forget(attached, args[0]):
+                        self.release(args[0])
+                        reply = ("ok",)
+                    else:
+                        reply = ("error", f"Invalid request {command} {args}")
+                except Exception as error:
+                    # a folder that fails to decode doesn't stop the store
+                    reply = ("error", repr(error))
+                connection.send(reply)
+        finally:
+            connection.close()
+            with self.lock:
+                self.connections[viewer_id] -= 1
+                last = not self.connections[viewer_id]
+                if last:
+                    del self.connections[viewer_id]
+                    del self.attached[viewer_id]
+            if last:
+                for name, refs in attached.items():
+                    for _ in range(refs):
+                        self.release(name)
+
+    def forget(self, attached: Counter, name: str) -> bool:
+        """Drop one attachment of the segment by a viewer, False if it has none."""
+        with self.lock:
+            if not attached[name]:
+                return False
+            attached[name] -= 1
+            return True
+
+    def serve_forever(self):
+        """Accept viewers, each served by its own thread."""
+        while True:
+            connection = self.listener.accept()
+            threading.Thread(
+                target=self.handle, args=(connection,), daemon=True
+            ).start()
+
+    def close(self):
+        """Stop accepting viewers and unlink every segment."""
+        self.listener.close()
+        with self.lock:
+            for segment in list(self.segments.values()):
+                self.unlink(segment)
+
+
+class AttachedMemory(shared_memory.SharedMemory):
+    """Shared memory that may stay mapped while surfaces wrap it, until the process exits."""
+
+    def __del__(self):
+        try:
+            self.close()
+        except (BufferError, OSError):
+            pass
+
+
+def attach_memory(name: str) -> shared_memory.SharedMemory:
+    """Map segment created by the store, without ever unlinking it from this process."""
+    try:
+        return AttachedMemory(name, track=False)
+    except TypeError:
+        # before Python 3.13 attached segments are tracked too, and unlinked
+        # when the process exits, while other viewers may still use them
+        memory = AttachedMemory(name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+class SharedSegment:
+    """Shared memory with every frame of a folder, as a viewer sees it."""
+
+    def __init__(self, name: str, count: int, size: tuple[int, int]) -> None:
+        self.name = name
+        self.count = count
+        self.size = size
+        self.frame_nbytes = size[0] * size[1] * BYTES_PER_PIXEL
+        self.memory = attach_memory(name)
+
+    def frame(self, idx: int) -> memoryview:
+        """Return raw pixels of the frame with given index."""
+        if not 0 <= idx < self.count:
+            raise IndexError(f"Frame index {idx} out of range for {self.name}")
+        start = idx * self.frame_nbytes
+        return self.memory.buf[start : start + self.frame_nbytes]
+
+
+class FrameStoreClient:
+    """Connections of a viewer to the frame store, safe to use from several threads.
+
+    Every request takes an idle connection, or opens a new one if all of them
+    wait for the store, so e.g. a release never waits for a folder being decoded.
+    """
+
+    def __init__(self) -> None:
+        self.address = None
+        self.authkey = b""
+        # identifies connections of this viewer, the store counts its segments by it
+        self.id = uuid.uuid4().hex
+        self.idle: list[Connection] = []
+        self.lock = threading.Lock()
+        # released segments whose frames are still wrapped by some surface
+        self.unclosed: list[SharedSegment] = []
+
+    @property
+    def connected(self) -> bool:
+        return self.address is not None
+
+    def connect(
+        self,
+        address=settings.FRAME_STORE_ADDRESS,
+        authkey: bytes = settings.FRAME_STORE_AUTHKEY,
+    ):
+        """Connect to the store.
+
+        Raises:
+            ConnectionError: if the store isn't running.
+        """
+        self.address = address
+        self.authkey = authkey
+        try:
+            self.idle.append(self.open())
+        except BaseException:
+            self.address = None
+            raise
+
+    def open(self) -> Connection:
+        """Open another connection of this viewer to the store."""
+        connection = Client(self.address, authkey=self.authkey)
+        connection.send(self.id)
+        return connection
+
+    def request(self, *message) -> tuple:
+        """Send request to the store and return its answer.
+
+        Raises:
+            RuntimeError: if the store failed to answer it.
+        """
+        with self.lock:
+            connection = self.idle.pop() if self.idle else None
+        if connection is None:
+            connection = self.open()
+        try:
+            connection.send(message)
+            status, *reply = connection.recv()
+        except BaseException:
+            # the answer may still be on its way, the connection isn't reused
+            connection.close()
+            raise
+        with self.lock:
+            self.idle.append(connection)
+        if status != "ok":
+            raise RuntimeError(f"Frame store failed: {reply[0]}")
+        return tuple(reply)
+
+    def attach(self, frame_paths: list[str], size: tuple[int, int]) -> SharedSegment:
+        """Return frames of the folder in given size, decoded by the store if needed."""
+        paths = [os.path.abspath(path) for path in frame_paths]
+        name, count = self.request("attach", paths, tuple(size))
+        registry.count("framestore.attached")
+        return SharedSegment(name, count, size)
+
+    def release(self, segment: SharedSegment):
+        """Tell the store the segment isn't used anymore and unmap it.
+
+        Segment stays mapped as long as surfaces wrap its frames,
+        it's unmapped by a later release then.
+        """
+        self.request("release", segment.name)
+        with self.lock:
+            self.unclosed.append(segment)
+            for segment in list(self.unclosed):
+                try:
+                    segment.memory.close()
+                except BufferError:
+                    continue
+                self.unclosed.remove(segment)
+
+    def close(self):
+        """Disconnect, the store releases every segment of this viewer."""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+        self.address = None
+
+
+# connection of this process, connected by the viewer if the store is used
+client = FrameStoreClient()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Decode frames once into shared memory for every viewer "
+        "started with --frame-store."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.DECODE_WORKERS,
+        help="number of processes decoding frames (default: number of cores)",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    # decoding needs pygame, viewers only attach to the decoded frames
+    from helpers import create_executor, decode_frames
+
+    args = parse_args()
+    executor = create_executor(args.workers)
+
+    def decode(frame_paths: list[str], size: tuple[int, int]) -> Iterable[bytes]:
+        return decode_frames(
+            frame_paths, [size] * len(frame_paths), args.workers, executor
+        )
+
+    store = FrameStore(decode)
+    print(f"Frame store listening on {store.listener.address}")
+    try:
+        store.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+        executor.shutdown()
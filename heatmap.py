@@ -0,0 +1,233 @@
+import threading
+import warnings
+from typing import Optional
+
+import numpy as np
+import pygame
+
+import settings
+from telemetry import registry
+from helpers import (
+    FRAME_BUFFER_FORMAT,
+    FolderFrames,
+    FrameProvider,
+    Image,
+    SurfaceCache,
+)
+
+# (difference, color) control points, colors in between are interpolated
+COLORMAP_POINTS = [
+    (0, (0, 0, 4)),
+    (64, (87, 16, 110)),
+    (128, (188, 55, 84)),
+    (192, (249, 142, 9)),
+    (255, (252, 255, 164)),
+]
+
+
+def build_colormap(points: list[tuple[int, tuple[int, int, int]]]) -> np.ndarray:
+    """Return lookup table mapping every difference 0-255 to RGB color."""
+    positions = [position for position, _ in points]
+    colors = np.array([color for _, color in points], dtype=np.float64)
+    table = np.empty((256, 3), dtype=np.uint8)
+    for channel in range(3):
+        table[:, channel] = np.interp(np.arange(256), positions, colors[:, channel])
+    return table
+
+
+COLORMAP = build_colormap(COLORMAP_POINTS)
+
+
+def difference_heatmaps(
+    frames_a: np.ndarray, frames_b: np.ndarray, gain: float = settings.HEATMAP_GAIN
+) -> np.ndarray:
+    """Colormap absolute per pixel difference of two stacks of frames.
+
+    Difference of a pixel is the largest difference of its color channels,
+    so their order doesn't matter, alpha channel is ignored.
+    Everything is computed on uint8 arrays, with the gain folded into
+    the lookup table, which is several times faster than going through
+    wider integers.
+
+    Args:
+        frames_a: frames of shape (n, height, width, channels).
+        frames_b: frames of the same shape.
+        gain: multiplier of the differences, small ones are barely visible otherwise.
+
+    Returns:
+        RGB heatmaps of shape (n, height, width, 3).
+    """
+    # whole pixels are subtracted, contiguous arrays are much faster than
+    # slices of color channels, and the opaque alpha channel differs by 0 anyway
+    difference = np.maximum(frames_a, frames_b)
+    difference -= np.minimum(frames_a, frames_b)
+    magnitude = np.maximum(difference[..., 0], difference[..., 1])
+    np.maximum(magnitude, difference[..., 2], out=magnitude)
+    scaled = np.minimum(np.arange(256) * gain, 255).astype(np.uint8)
+    return np.take(COLORMAP[scaled], magnitude, axis=0)
+
+
+def frame_pixels(
+    frames: FolderFrames, idx: int, size: Optional[tuple[int, int]] = None
+) -> np.ndarray:
+    """Return pixels of the frame as array of shape (height, width, 4).
+
+    Packed frames are read straight from the mapped file, if any level
+    of the pack has the displayed size. Others are loaded anew instead of
+    taken from the cache, so no surface drawn by the main thread is ever locked.
+
+    Args:
+        frames: frames of the folder.
+        idx: index of the frame.
+        size: displayed size the caller read once, current one if None.
+
+    Raises:
+        ValueError: if the frames were resized to something else meanwhile.
+    """
+    width, height = size or (frames.width, frames.height)
+    buffer = None
+    if frames.pack is not None:
+        buffer, level_size = frames.packed_frame(idx)
+        if level_size != (width, height):
+            buffer = None
+    if buffer is None:
+        buffer = pygame.image.tobytes(frames.load(idx).image, FRAME_BUFFER_FORMAT)
+    pixels = np.frombuffer(buffer, dtype=np.uint8)
+    return pixels.reshape(height, width, 4)
+
+
+def frames_to_array(
+    frames: FolderFrames, indices: range, size: Optional[tuple[int, int]] = None
+) -> np.ndarray:
+    """Stack pixels of the frames into array of shape (n, height, width, 4)."""
+    return np.stack([frame_pixels(frames, i, size) for i in indices])
+
+
+class HeatmapView:
+    """Display difference between the same frame of two folders as a heatmap.
+
+    Heatmaps of all the frames of a pair are computed in a background thread,
+    a few frames at a time, and cached, so scrubbing through them is as smooth
+    as playing the frames themselves.
+    """
+
+    def __init__(
+        self,
+        provider: FrameProvider,
+        budget_bytes: int = settings.HEATMAP_CACHE_BUDGET,
+        gain: float = settings.HEATMAP_GAIN,
+        batch_size: int = 8,
+    ) -> None:
+        """
+        Args:
+            provider: frames that are compared.
+            budget_bytes: memory budget of the computed heatmaps.
+            gain: multiplier of the differences.
+            batch_size: number of frames computed at once.
+        """
+        self.provider = provider
+        self.cache = SurfaceCache(budget_bytes)
+        self.cache.watch(f"{provider.name}_heatmap")
+        self.gain = gain
+        self.batch_size = batch_size
+        self.pair: Optional[tuple[str, str]] = None
+        # heatmaps that failed to compute, by cache key, they aren't waited for
+        self.failed: set[tuple[str, int]] = set()
+        self.frames: Optional[FolderFrames] = None
+        self.last_image: Optional[Image] = None
+        self.waiting = False
+        self.generation = 0
+
+    def pair_name(self, folder_a: str, folder_b: str) -> str:
+        return f"{folder_a} - {folder_b}"
+
+    def compute(self, folder_a: str, folder_b: str, generation: int):
+        """Compute and cache heatmaps of every frame of the pair.
+
+        Stops as soon as another pair is chosen, or the frames are resized.
+        A batch that fails is skipped and marked failed, the pair is then
+        computed again the next time a frame is picked, skipping cached ones.
+        """
+        frames_a = self.provider[folder_a]
+        frames_b = self.provider[folder_b]
+        name = self.pair_name(folder_a, folder_b)
+        count = min(len(frames_a), len(frames_b))
+        # frames are read in this size, a resize creates the view anew
+        size = (frames_a.width, frames_a.height)
+        x, y = frames_a.x, frames_a.y
+        failed = False
+        for start in range(0, count, self.batch_size):
+            if generation != self.generation:
+                return
+            indices = range(start, min(start + self.batch_size, count))
+            if all((name, i) in self.cache for i in indices):
+                continue
+            try:
+                heatmaps = difference_heatmaps(
+                    frames_to_array(frames_a, indices, size),
+                    frames_to_array(frames_b, indices, size),
+                    self.gain,
+                )
+            except Exception as error:
+                if (frames_a.width, frames_a.height) != size:
+                    return
+                registry.count("heatmap.errors")
+                warnings.warn(
+                    f"Heatmap of {name} frames {indices[0]}-{indices[-1]}"
+                    f" failed: {error!r}"
+                )
+                self.failed.update((name, i) for i in indices)
+                failed = True
+                continue
+            for i, heatmap in zip(indices, heatmaps):
+                surface = pygame.image.frombytes(heatmap.tobytes(), size, "RGB")
+                self.cache.put((name, i), Image.from_surface(surface, x=x, y=y))
+                self.failed.discard((name, i))
+        if failed and generation == self.generation:
+            self.pair = None
+
+    def set_frame(self, folder_a: str, folder_b: str, image_idx: int):
+        """Pick heatmap to display, start computing heatmaps if the pair changed.
+
+        Failed heatmap isn't waited for, the last heatmap picked stays
+        displayed until it's computed again.
+
+        Args:
+            folder_a: folder that is compared.
+            folder_b: reference folder.
+            image_idx: index of the frame.
+        """
+        self.frames = self.provider[folder_a]
+        if self.pair != (folder_a, folder_b):
+            self.pair = (folder_a, folder_b)
+            self.generation += 1
+            threading.Thread(
+                target=self.compute,
+                args=(folder_a, folder_b, self.generation),
+                daemon=True,
+            ).start()
+        count = min(len(self.frames), len(self.provider[folder_b]))
+        key = (self.pair_name(folder_a, folder_b), image_idx % count)
+        image = self.cache.get(key)
+        self.waiting = image is None and key not in self.failed
+        if image is not None:
+            self.last_image = image
+
+    def stop(self):
+        """Stop computing heatmaps, they're no longer displayed."""
+        self.generation += 1
+
+    def get_state(self) -> tuple:
+        """Describe what is drawn, so Renderer can tell if it changed."""
+        return (id(self.last_image),)
+
+    def get_rect(self) -> pygame.Rect:
+        """Area of the screen covered when drawing."""
+        return self.frames.get_rect()
+
+    def draw(self, screen: pygame.SurfaceType):
+        """Draw heatmap picked with set_frame."""
+        if self.last_image is not None:
+            self.last_image.draw(screen)
+        else:
+            self.frames.draw_placeholder(screen)
@@ -1,16 +1,65 @@
 import pygame
 import settings
+import framepack
+import framestore
 import os
+import videostream
+from dataset_index import DatasetIndex, FolderInfo
+from layout import Layout
+from profiling import profiler
+from telemetry import phases, registry, summarize
+import functools
+import itertools
+import math
+import multiprocessing
+import queue
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from collections.abc import Iterator, Mapping
 from typing import Optional
 
+# layout of raw frame buffers, matches 32 bit display surfaces
+FRAME_BUFFER_FORMAT = "BGRA"
+
 
 class Orientation(Enum):
     HORIZONTAL = 0
     VERTICAL = 1
 
 
+# color never used by buttons, marks transparent pixels of their sprites
+SPRITE_COLORKEY = (255, 0, 255)
+
+
+class ButtonShape(Enum):
+    NORMAL = 0
+    PRESSED = 1
+    POPUP = 2
+
+
+def convert_to_display(surface: pygame.SurfaceType) -> pygame.SurfaceType:
+    """Return copy of the surface in the pixel format of the display.
+
+    Blitting surfaces of the same format as the display is a plain copy,
+    any other format is converted pixel by pixel on every blit.
+    Opaque surfaces already in that format are returned as they are,
+    so frames wrapping mapped or shared memory are never copied.
+    """
+    if surface.get_flags() & pygame.SRCALPHA:
+        return surface.convert_alpha()
+    display = pygame.display.get_surface()
+    if (
+        surface.get_bitsize() == display.get_bitsize()
+        and surface.get_masks()[:3] == display.get_masks()[:3]
+    ):
+        return surface
+    return surface.convert()
+
+
 class Image:
     """Stores image, its attributes and draws it."""
 
@@ -40,9 +89,46 @@ class Image:
         self.height = height if height is not None else self.image.get_height()
         self.image = pygame.transform.scale(self.image, (self.width, self.height))
         self.rect = self.image.get_rect(center=(self.x, self.y))
+        self.prepared = False
+        self.prepare()
 
-    def draw(self, screen: pygame.SurfaceType):
-        screen.blit(self.image, self.rect)
+    @classmethod
+    def from_surface(
+        cls,
+        surface: pygame.SurfaceType,
+        x: int = 0,
+        y: int = 0,
+        border_size: int = 0,
+    ) -> "Image":
+        """Wrap already decoded and scaled surface.
+
+        Args:
+            surface: surface to display.
+            x: position the image center on the x coordinate.
+            y: position the image center on the y coordinate.
+            border_size: display black border around the image when drawing.
+        """
+        image = cls.__new__(cls)
+        image.x = x
+        image.y = y
+        image.border_size = border_size
+        image.image = surface
+        image.width = surface.get_width()
+        image.height = surface.get_height()
+        image.rect = surface.get_rect(center=(x, y))
+        image.prepared = False
+        image.prepare()
+        return image
+
+    def prepare(self):
+        """Convert image to the display pixel format and draw its border, only once.
+
+        Conversion needs the display mode to be set,
+        until then it's postponed to the first draw.
+        """
+        if self.prepared or pygame.display.get_surface() is None:
+            return
+        self.image = convert_to_display(self.image)
         if self.border_size > 0:
             pygame.draw.rect(
                 self.image,
@@ -55,6 +141,19 @@ class Image:
                 ],
                 self.border_size,
             )
+        self.prepared = True
+
+    def get_state(self) -> tuple:
+        """Describe what is drawn, so Renderer can tell if it changed."""
+        return (id(self.image),)
+
+    def get_rect(self) -> pygame.Rect:
+        """Area of the screen covered when drawing."""
+        return self.rect
+
+    def draw(self, screen: pygame.SurfaceType):
+        self.prepare()
+        screen.blit(self.image, self.rect)
 
 
 class Button:
@@ -63,11 +162,11 @@ class Button:
     def __init__(
         self,
         text: str = "Button",
-        x: int = settings.SCREEN_SIZE.mid_x,
-        y: int = settings.SCREEN_SIZE.mid_y,
+        x: Optional[int] = None,
+        y: Optional[int] = None,
         width: int = 400,
         height: int = 50,
-        font: pygame.font.FontType = settings.main_font_small,
+        font: Optional[pygame.font.FontType] = None,
         text_color: tuple = settings.Color.BLACK.value,
         color: tuple[int, int, int] = settings.Color.WHITE.value,
         shadow_color: tuple[int, int, int] = settings.Color.BLACK.value,
@@ -97,6 +196,10 @@ class Button:
             active: state of the button upon initialization.
             on_hover: whether to display pop effect upon mouse hover.
         """
+        if x is None:
+            x = settings.SCREEN_SIZE.mid_x
+        if y is None:
+            y = settings.SCREEN_SIZE.mid_y
         self.x = x
         self.y = y
         self.width = width
@@ -117,7 +220,7 @@ class Button:
         self.active_and_current_color = active_and_current_color
 
         self.text = text
-        self.font = font
+        self.font = font if font is not None else settings.main_font_small
 
         self.clicked = False
         self.pressed = False
@@ -133,6 +236,10 @@ class Button:
             self.hover_size = 0
             self.hover_pop = 0
 
+        self.shape = ButtonShape.NORMAL
+        self.sprites: dict[tuple, pygame.SurfaceType] = {}
+        self.sprites_style = None
+
     def get_color(self) -> tuple[int, int, int]:
         """Get color depending on the state of the button."""
         if self.active and self.current:
@@ -205,48 +312,111 @@ class Button:
             return True
         return False
 
+    def get_shape_rect(self, shape: ButtonShape) -> pygame.Rect:
+        """Return position and size of the button drawn in given shape."""
+        button = pygame.Rect(0, 0, self.width, self.height)
+        button.center = self.x, self.y
+        if shape == ButtonShape.PRESSED:
+            button.center = self.x, self.y + 5 - self.hover_pop
+        elif shape == ButtonShape.POPUP:
+            button = pygame.Rect(
+                0, 0, self.width + self.hover_size, self.height + self.hover_size
+            )
+            button.center = (self.x, self.y - self.hover_pop)
+        return button
+
     def set_size(self):
         """Manage graphical effects of popup or button being pressed."""
         if self.is_lock:
             return
-        self.button = pygame.Rect(0, 0, self.width, self.height)
-        self.button.center = self.x, self.y
         if self.check_down():
-            self.button.center = self.x, self.y + 5 - self.hover_pop
+            self.shape = ButtonShape.PRESSED
         elif self.is_popup():
-            self.button = pygame.Rect(
-                0, 0, self.width + self.hover_size, self.height + self.hover_size
-            )
-            self.button.center = (self.x, self.y - self.hover_pop)
+            self.shape = ButtonShape.POPUP
+        else:
+            self.shape = ButtonShape.NORMAL
+        self.button = self.get_shape_rect(self.shape)
 
-    def draw(self, screen: pygame.SurfaceType):
-        """Display button layer by layer.
+    def get_state(self) -> tuple:
+        """Describe what is drawn, so Renderer can tell if it changed."""
+        self.set_size()
+        return (tuple(self.button), self.get_color(), self.text)
+
+    def get_rect(self) -> pygame.Rect:
+        """Area of the screen covered when drawing, including popup."""
+        self.set_size()
+        return self.shadow.union(self.button)
+
+    def get_style(self) -> tuple:
+        """Return everything besides text and state that affects the look of the button."""
+        return (
+            self.width,
+            self.height,
+            self.font,
+            self.text_color,
+            self.shadow_color,
+            self.active_color,
+            self.inactive_color,
+            self.current_color,
+            self.active_and_current_color,
+            self.hover_size,
+            self.hover_pop,
+            self.border_radius,
+        )
+
+    def render_sprite(
+        self, shape: ButtonShape, color: tuple[int, int, int]
+    ) -> pygame.SurfaceType:
+        """Render button layer by layer onto a surface covering shadow and button.
 
         1. Shadow
         2. Button
         3. Text
         """
+        button = self.get_shape_rect(shape)
+        bounds = self.shadow.union(button)
+        sprite = pygame.Surface(bounds.size)
+        # rounded corners are left transparent, colorkey blits much faster than alpha
+        sprite.fill(SPRITE_COLORKEY)
+        sprite.set_colorkey(SPRITE_COLORKEY, pygame.RLEACCEL)
         pygame.draw.rect(
-            screen,
+            sprite,
             self.shadow_color,
-            self.shadow,
-            border_radius=self.border_radius,
-        )
-        self.set_size()
-        pygame.draw.rect(
-            screen,
-            self.get_color(),
-            self.button,
+            self.shadow.move(-bounds.x, -bounds.y),
             border_radius=self.border_radius,
         )
+        button.move_ip(-bounds.x, -bounds.y)
+        pygame.draw.rect(sprite, color, button, border_radius=self.border_radius)
         draw_text(
             text=self.text,
             text_color=self.text_color,
             font=self.font,
-            x=self.button.center[0],
-            y=self.button.center[1],
-            screen=screen,
+            x=button.center[0],
+            y=button.center[1],
+            screen=sprite,
         )
+        return sprite
+
+    def get_sprite(self) -> pygame.SurfaceType:
+        """Return image of the button in its current state, rendering it only once.
+
+        Rendered images are dropped when size or colors of the button change.
+        """
+        style = self.get_style()
+        if style != self.sprites_style:
+            self.sprites.clear()
+            self.sprites_style = style
+        key = (self.text, self.shape, self.get_color())
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = self.render_sprite(self.shape, key[2])
+            self.sprites[key] = sprite
+        return sprite
+
+    def draw(self, screen: pygame.SurfaceType):
+        """Display button by blitting image of its current state."""
+        self.set_size()
+        screen.blit(self.get_sprite(), self.shadow.union(self.button))
 
 
 class ButtonLayout:
@@ -262,8 +432,8 @@ class ButtonLayout:
         texts: list[str],
         active_ids: list[int],
         distance: int,
-        x: int = settings.SCREEN_SIZE.mid_x,
-        y: int = settings.SCREEN_SIZE.mid_y,
+        x: Optional[int] = None,
+        y: Optional[int] = None,
         height: int = 50,
         width: int = 400,
         center: bool = True,
@@ -285,6 +455,10 @@ class ButtonLayout:
             orientation: whether to create layout vertically or horizontally.
             inactive_color: color of the buttons in inactive state.
         """
+        if x is None:
+            x = settings.SCREEN_SIZE.mid_x
+        if y is None:
+            y = settings.SCREEN_SIZE.mid_y
         self.num_buttons = len(texts)
         self.buttons = {}
         self.start_x = x
@@ -333,6 +507,10 @@ class ButtonLayout:
         for button in self.buttons.values():
             button.draw(screen)
 
+    def get_widgets(self) -> list[Button]:
+        """Return all buttons, to be drawn by Renderer."""
+        return list(self.buttons.values())
+
     def get_active(self) -> Optional[Button]:
         """Return all buttons in active state."""
         for button in self.buttons.values():
@@ -387,8 +565,8 @@ class CheckBoxLayout:
         texts: list[str],
         active_ids: list[int],
         distance: int,
-        x: int = settings.SCREEN_SIZE.mid_x,
-        y: int = settings.SCREEN_SIZE.mid_y,
+        x: Optional[int] = None,
+        y: Optional[int] = None,
         height: int = 50,
         width: int = 400,
         center: bool = True,
@@ -412,6 +590,10 @@ class CheckBoxLayout:
             inactive_color: color of the checkbox in inactive state.
             multiple_choice: whether multiple checkboxes are allowed to be active at once.
         """
+        if x is None:
+            x = settings.SCREEN_SIZE.mid_x
+        if y is None:
+            y = settings.SCREEN_SIZE.mid_y
         self.distance = distance
         self.height = height
         self.width = width
@@ -474,6 +656,10 @@ class CheckBoxLayout:
         for button in self.checkboxes.values():
             button.draw(screen)
 
+    def get_widgets(self) -> list[Button]:
+        """Return all checkboxes, to be drawn by Renderer."""
+        return list(self.checkboxes.values())
+
     def deactivate_all_checkboxes(self):
         """Set all checkboxes to inactive state."""
         for checkbox in self.checkboxes.values():
@@ -519,12 +705,16 @@ class TextField:
         active_color: tuple[int, int, int],
         inactive_color: tuple[int, int, int],
         prompt_text: str,
-        x: int = settings.SCREEN_SIZE.mid_x,
-        y: int = settings.SCREEN_SIZE.mid_y,
+        x: Optional[int] = None,
+        y: Optional[int] = None,
         width: int = 500,
         height: int = 50,
         numeric_only: bool = False,
     ):
+        if x is None:
+            x = settings.SCREEN_SIZE.mid_x
+        if y is None:
+            y = settings.SCREEN_SIZE.mid_y
         self.active = True
         self.user_input = prompt_text
         self.input_field = pygame.Rect(x, y, width, height)
@@ -581,14 +771,65 @@ class TextField:
             self.delete_wait = self.fast_delete_activation
 
 
+class TextCache:
+    """Least recently used cache of rendered text surfaces.
+
+    Text is rasterized only the first time it's drawn with given font,
+    color and antialiasing, every next draw reuses the same surface.
+    """
+
+    def __init__(self, max_entries: int = settings.TEXT_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self.entries: OrderedDict[tuple, pygame.SurfaceType] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(
+        self,
+        text,
+        font: pygame.font.FontType,
+        text_color: tuple[int, int, int],
+        antialias: bool = True,
+    ) -> pygame.SurfaceType:
+        """Return surface with rendered text, rendering it only if it's not cached."""
+        key = (str(text), font, tuple(text_color), antialias)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = font.render(str(text), antialias, text_color)
+        self.entries[key] = surface
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return surface
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of renders served from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        """Drop all rendered texts and reset counters."""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+text_cache = TextCache()
+registry.watch("cache.text.hit_rate", lambda: text_cache.hit_rate)
+
+
 def draw_text(
     text,
     screen: pygame.Surface,
-    x: int = settings.SCREEN_SIZE.mid_x,
-    y: int = settings.SCREEN_SIZE.mid_y,
+    x: Optional[int] = None,
+    y: Optional[int] = None,
     center: bool = True,
     text_color: tuple[int, int, int] = settings.Color.BLACK.value,
-    font: pygame.font.FontType = settings.main_font_small,
+    font: Optional[pygame.font.FontType] = None,
 ):
     """Draw text on the screen in wanted place.
 
@@ -601,13 +842,373 @@ def draw_text(
         text_color: color of the text.
         font: font used to display text.
     """
-    text_obj = font.render(str(text), True, text_color)
+    if x is None:
+        x = settings.SCREEN_SIZE.mid_x
+    if y is None:
+        y = settings.SCREEN_SIZE.mid_y
+    if font is None:
+        font = settings.main_font_small
+    text_obj = text_cache.render(text, font, text_color)
     text_rect = text_obj.get_rect(topleft=(x, y))
     if center:
         text_rect.center = x, y
     screen.blit(text_obj, text_rect)
 
 
+class Text:
+    """Text label that remembers its content, so it can be drawn by Renderer."""
+
+    def __init__(
+        self,
+        text,
+        x: Optional[int] = None,
+        y: Optional[int] = None,
+        center: bool = True,
+        text_color: tuple[int, int, int] = settings.Color.BLACK.value,
+        font: Optional[pygame.font.FontType] = None,
+    ) -> None:
+        """
+        Args:
+            text: Text to display.
+            x: x coordinate of the text on the surface.
+            y: y coordinate of the text on the surface.
+            center: whether to use x, y as the center coordinates (default: upperleft corner)
+            text_color: color of the text.
+            font: font used to display text.
+        """
+        if x is None:
+            x = settings.SCREEN_SIZE.mid_x
+        if y is None:
+            y = settings.SCREEN_SIZE.mid_y
+        self.text = text
+        self.x = x
+        self.y = y
+        self.center = center
+        self.text_color = text_color
+        self.font = font if font is not None else settings.main_font_small
+
+    def get_state(self) -> tuple:
+        """Describe what is drawn, so Renderer can tell if it changed."""
+        return (str(self.text), self.text_color)
+
+    def get_rect(self) -> pygame.Rect:
+        """Area of the screen covered when drawing."""
+        rect = pygame.Rect((self.x, self.y), self.font.size(str(self.text)))
+        if self.center:
+            rect.center = self.x, self.y
+        return rect
+
+    def draw(self, screen: pygame.SurfaceType):
+        draw_text(
+            text=self.text,
+            screen=screen,
+            x=self.x,
+            y=self.y,
+            center=self.center,
+            text_color=self.text_color,
+            font=self.font,
+        )
+
+
+def merge_rects(rects: list[pygame.Rect]) -> list[pygame.Rect]:
+    """Join overlapping rectangles, so no area is redrawn twice."""
+    merged: list[pygame.Rect] = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        overlapping = rect.collidelist(merged)
+        while overlapping != -1:
+            rect.union_ip(merged.pop(overlapping))
+            overlapping = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
+class Renderer:
+    """Redraw and update only the parts of the screen that changed.
+
+    Every widget describes what it draws with get_state and where with get_rect.
+    Widget is dirty if any of them differs from the last render,
+    or if it's drawn for the first time. Area of a widget that is no longer
+    drawn is cleared as well.
+    """
+
+    def __init__(
+        self, background: tuple[int, int, int] = settings.Color.BACKGROUND.value
+    ) -> None:
+        self.background = background
+        self.drawn: dict[int, tuple[tuple, pygame.Rect]] = {}
+        self.full_redraw = True
+
+    def invalidate(self):
+        """Redraw the whole screen during the next render."""
+        self.full_redraw = True
+
+    def get_dirty_rects(self, screen: pygame.SurfaceType, widgets: list) -> list:
+        """Return areas that need to be redrawn and remember current widgets state."""
+        dirty = []
+        drawn = {}
+        for widget in widgets:
+            state, rect = widget.get_state(), pygame.Rect(widget.get_rect())
+            drawn[id(widget)] = (state, rect)
+            previous = self.drawn.pop(id(widget), None)
+            if previous is None:
+                dirty.append(rect)
+            elif previous != (state, rect):
+                dirty += [rect, previous[1]]
+        # widgets that disappeared since the last render
+        dirty += [rect for _, rect in self.drawn.values()]
+        self.drawn = drawn
+        if self.full_redraw:
+            self.full_redraw = False
+            registry.count("render.full_redraws")
+            return [screen.get_rect()]
+        return merge_rects(dirty)
+
+    def render(self, screen: pygame.SurfaceType, widgets: list) -> list[pygame.Rect]:
+        """Redraw dirty areas of the screen and update the display with them.
+
+        Args:
+            screen: display surface.
+            widgets: everything that is displayed, in drawing order.
+
+        Returns:
+            Areas of the screen that were updated.
+        """
+        start = time.perf_counter()
+        dirty = self.get_dirty_rects(screen, widgets)
+        for rect in dirty:
+            screen.set_clip(rect)
+            screen.fill(self.background)
+            for widget in widgets:
+                if self.drawn[id(widget)][1].colliderect(rect):
+                    widget.draw(screen)
+        screen.set_clip(None)
+        phases.lap("compose")
+        if dirty:
+            drawn = time.perf_counter()
+            pygame.display.update(dirty)
+            registry.observe("render.draw_ms", (drawn - start) * 1000)
+            registry.observe("render.flip_ms", (time.perf_counter() - drawn) * 1000)
+            registry.mark("render.present")
+        phases.lap("present")
+        return dirty
+
+
+class PerfOverlay:
+    """Overlay displaying performance counters reported into the registry.
+
+    Content is rendered into a single surface a few times per second only,
+    so it stays readable and the area under it isn't redrawn every frame.
+    """
+
+    def __init__(
+        self,
+        x: int = 10,
+        y: int = 10,
+        width: int = 500,
+        font: Optional[pygame.font.FontType] = None,
+        refresh: float = settings.PERF_OVERLAY_REFRESH,
+        sparkline_height: int = 40,
+    ) -> None:
+        """
+        Args:
+            x: x coordinate of the upperleft corner.
+            y: y coordinate of the upperleft corner.
+            width: width of the overlay.
+            font: font of the counters, monospace font by default.
+                It's looked up on first display, so the module-level
+                overlay doesn't need initialized pygame.
+            refresh: how often the content is refreshed, in seconds.
+            sparkline_height: height of the frame time graph.
+        """
+        self.x = x
+        self.y = y
+        self.width = width
+        self.font = font
+        self.refresh = refresh
+        self.sparkline_height = sparkline_height
+        self.visible = False
+        self.surface: Optional[pygame.SurfaceType] = None
+        self.refreshed = 0.0
+
+    def toggle(self):
+        """Show or hide the overlay."""
+        self.visible = not self.visible
+        self.surface = None
+
+    def get_lines(self) -> list[str]:
+        """Describe current state of the counters, one line each."""
+        # about the last second of frames
+        frame = summarize(registry.values("loop.frame_ms")[-60:])
+        events = summarize(registry.values("loop.events_ms")[-60:])
+        draw = summarize(registry.values("render.draw_ms")[-60:])
+        flip = summarize(registry.values("render.flip_ms")[-60:])
+        load = summarize(registry.values("decode.load_ms")[-60:])
+        queued = sum(registry.gauge(name) for name in registry.watched("prefetch."))
+        lines = [
+            f"FPS {registry.rate('render.present'):5.1f}"
+            f"  frame {frame.get('mean', 0):5.1f} ms  p95 {frame.get('p95', 0):5.1f}",
+            f"events {events.get('mean', 0):4.1f}  draw {draw.get('mean', 0):4.1f}"
+            f"  flip {flip.get('mean', 0):4.1f} ms",
+            f"decode queue {queued:3d}  load {load.get('mean', 0):5.1f} ms",
+            f"playback {registry.gauge('playback.speed') or 1:g}x"
+            f"  dropped {registry.counters['playback.dropped_frames']}"
+            f"  late {registry.counters['playback.late_frames']}",
+        ]
+        for name in registry.watched("cache."):
+            if not name.endswith(".used_mb"):
+                continue
+            cache = name[len("cache.") : -len(".used_mb")]
+            used = registry.gauge(name)
+            hit_rate = registry.gauge(f"cache.{cache}.hit_rate")
+            if not used and not hit_rate:
+                continue
+            budget = registry.gauge(f"cache.{cache}.budget_mb")
+            lines.append(
+                f"{cache[:24]:<24} {hit_rate:4.0%} {used:6.1f} / {budget:.0f} MB"
+            )
+        lines.append(f"{'text':<24} {registry.gauge('cache.text.hit_rate'):4.0%}")
+        clicks = registry.values("input.click_to_photon_ms")
+        if clicks:
+            lines.append(
+                f"click to photon {clicks[-1]:5.1f} ms"
+                f"  p95 {summarize(clicks)['p95']:5.1f}"
+            )
+        if profiler.active:
+            lines.append(f"profiling, {profiler.remaining} frames left")
+        elif profiler.last_prefix is not None:
+            lines.append(f"profile {profiler.last_prefix}.prof")
+        return lines
+
+    def update(self):
+        """Render current counters if the last rendering is old enough."""
+        now = time.monotonic()
+        if self.surface is not None and now - self.refreshed < self.refresh:
+            return
+        self.refreshed = now
+        if self.font is None:
+            self.font = settings.hud_font
+        lines = [
+            text_cache.render(line, self.font, settings.Color.WHITE.value)
+            for line in self.get_lines()
+        ]
+        padding = 8
+        line_height = self.font.get_linesize()
+        height = 3 * padding + len(lines) * line_height + self.sparkline_height
+        self.surface = pygame.Surface((self.width, height), pygame.SRCALPHA)
+        self.surface.fill((0, 0, 0, 170))
+        for i, line in enumerate(lines):
+            self.surface.blit(line, (padding, padding + i * line_height))
+        self.draw_sparkline(
+            pygame.Rect(
+                padding,
+                height - padding - self.sparkline_height,
+                self.width - 2 * padding,
+                self.sparkline_height,
+            )
+        )
+
+    def draw_sparkline(self, rect: pygame.Rect):
+        """Draw graph of the most recent frame times, one bar per frame."""
+        bar_width = 2
+        values = registry.values("loop.frame_ms")[-(rect.width // bar_width) :]
+        # two frames at 60 fps fit the graph, longer ones are clipped
+        scale = rect.height / (2000 / 60)
+        pygame.draw.line(
+            self.surface,
+            (120, 120, 120),
+            (rect.left, rect.bottom - 1000 / 60 * scale),
+            (rect.right, rect.bottom - 1000 / 60 * scale),
+        )
+        for i, value in enumerate(values):
+            height = max(1, min(rect.height, round(value * scale)))
+            if value <= 1000 / 60:
+                color = settings.Color.GREEN.value
+            elif value <= 2000 / 60:
+                color = (250, 210, 90)
+            else:
+                color = (250, 90, 90)
+            self.surface.fill(
+                color,
+                (
+                    rect.left + i * bar_width,
+                    rect.bottom - height,
+                    bar_width - 1,
+                    height,
+                ),
+            )
+
+    def get_state(self) -> tuple:
+        """Describe what is drawn, so Renderer can tell if it changed."""
+        return (id(self.surface),)
+
+    def get_rect(self) -> pygame.Rect:
+        """Area of the screen covered when drawing."""
+        return self.surface.get_rect(topleft=(self.x, self.y))
+
+    def draw(self, screen: pygame.SurfaceType):
+        screen.blit(self.surface, (self.x, self.y))
+
+
+perf_overlay = PerfOverlay()
+
+
+class ProgressBar:
+    """Bar describing progress of some work, e.g. loading in background."""
+
+    def __init__(
+        self,
+        x: int,
+        y: int,
+        width: int = 600,
+        height: int = 10,
+        font: Optional[pygame.font.FontType] = None,
+    ) -> None:
+        """
+        Args:
+            x: x coordinate of the upperleft corner.
+            y: y coordinate of the upperleft corner.
+            width: width of the bar and the longest description.
+            height: height of the bar, the description is displayed above it.
+            font: font of the description.
+        """
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.font = font if font is not None else settings.label_font
+        self.fraction = 0.0
+        self.text = ""
+
+    def set_progress(self, done: int, total: int, text: str = ""):
+        """Set how much of the work is done and describe what is being done."""
+        self.fraction = done / total if total else 1.0
+        self.text = text
+
+    def get_state(self) -> tuple:
+        """Describe what is drawn, so Renderer can tell if it changed."""
+        return (int(self.fraction * self.width), self.text)
+
+    def get_rect(self) -> pygame.Rect:
+        """Area of the screen covered when drawing."""
+        return pygame.Rect(
+            self.x, self.y, self.width, self.font.get_linesize() + self.height
+        )
+
+    def draw(self, screen: pygame.SurfaceType):
+        text = text_cache.render(self.text, self.font, settings.Color.BLACK.value)
+        # long descriptions are cut, so nothing is drawn outside of get_rect
+        screen.blit(
+            text, (self.x, self.y), pygame.Rect(0, 0, self.width, text.get_height())
+        )
+        bar = pygame.Rect(
+            self.x, self.y + self.font.get_linesize(), self.width, self.height
+        )
+        pygame.draw.rect(screen, settings.Color.WHITE.value, bar)
+        bar.width = int(self.fraction * self.width)
+        pygame.draw.rect(screen, settings.Color.GREEN.value, bar)
+
+
 def construct_folder_name(folder_data: dict[str, str]) -> str:
     """Construct folder name by extracting relevant data from provided dict."""
     pos_encoding = folder_data["pos_encoding"]
@@ -628,41 +1229,1590 @@ def construct_folder_name_mednerf(folder_data: dict[str, str]) -> str:
     return folder_name
 
 
-def load_images(folder_path: str) -> list[Image]:
-    """Load all images from given folder into list."""
+def list_frames(folder_path: str) -> list[str]:
+    """Return sorted paths of all frames in given folder."""
+    return [
+        os.path.join(folder_path, image_name)
+        for image_name in sorted(os.listdir(folder_path))
+    ]
+
+
+def load_images(folder_path: str, layout: Optional[Layout] = None) -> list[Image]:
+    """Load all images from given folder into list.
+
+    Args:
+        folder_path: folder storing the images.
+        layout: layout the images are displayed in, of the window by default.
+    """
+    rect = (layout or Layout.for_screen()).frame_rect()
     images = []
-    for image_name in sorted(os.listdir(folder_path)):
-        image_path = os.path.join(folder_path, image_name)
+    for image_path in list_frames(folder_path):
         images.append(
             Image(
                 image_path=image_path,
-                x=int(settings.SCREEN_SIZE.x * 2 / 6),
-                y=settings.SCREEN_SIZE.mid_y - 50,
-                width=600,
-                height=600,
+                x=rect.centerx,
+                y=rect.centery,
+                width=rect.width,
+                height=rect.height,
             )
         )
     return images
 
 
-def load_all_folders(dataset_dir: str) -> dict[str, list[Image]]:
-    """Create mapping dict {folder_path: images in that folder}."""
-    folders = {}
-    for folder_name in sorted(os.listdir(dataset_dir)):
-        folder_path = os.path.join(dataset_dir, folder_name, "video_200000")
-        images = load_images(folder_path=folder_path)
-        folders[folder_name] = images
-    return folders
+def surface_nbytes(surface: pygame.SurfaceType) -> int:
+    """Return number of bytes occupied by the pixels of the surface."""
+    return surface.get_pitch() * surface.get_height()
 
 
-def load_all_folders_mednerf(dataset_dir: str) -> dict[str, list[Image]]:
-    """Create mapping dict {folder_path: images in that folder}."""
-    folders = {}
-    for folder_name in sorted(os.listdir(dataset_dir)):
-        folder_path = os.path.join(dataset_dir, folder_name, "video_200000")
-        images = load_images(folder_path=folder_path)
-        folders[folder_name] = images
-    return folders
+class SurfaceCache:
+    """Least recently used cache of decoded frames bounded by a memory budget.
+
+    Frames are keyed by (folder_name, frame index). Every entry is accounted
+    to its folder, so memory usage can be inspected per folder.
+    Safe to use from the prefetching threads.
+    """
+
+    def __init__(self, budget_bytes: int = settings.FRAME_CACHE_BUDGET) -> None:
+        """
+        Args:
+            budget_bytes: maximum number of bytes kept in decoded surfaces.
+                The most recently added frame is always kept, even if it
+                alone exceeds the budget.
+        """
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.folder_bytes = defaultdict(int)
+        self.entries: OrderedDict[tuple[str, int], tuple[Image, int]] = OrderedDict()
+        # frames some thread is decoding right now, see reserve
+        self.loading: set[tuple[str, int]] = set()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple[str, int]) -> Optional[Image]:
+        """Return cached frame and mark it as most recently used."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups that found the frame already decoded."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def watch(self, name: str):
+        """Report hit rate and memory usage to the registry under given name."""
+        registry.watch(f"cache.{name}.hit_rate", lambda: self.hit_rate)
+        registry.watch(f"cache.{name}.used_mb", lambda: self.used_bytes / 2**20)
+        registry.watch(f"cache.{name}.budget_mb", lambda: self.budget_bytes / 2**20)
+
+    def put(self, key: tuple[str, int], image: Image):
+        """Add frame to the cache, evicting least recently used frames if needed."""
+        nbytes = surface_nbytes(image.image)
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            while self.entries and self.used_bytes + nbytes > self.budget_bytes:
+                self.remove(next(iter(self.entries)))
+            self.entries[key] = (image, nbytes)
+            self.used_bytes += nbytes
+            self.folder_bytes[key[0]] += nbytes
+
+    def reserve(self, key: tuple[str, int]) -> bool:
+        """Mark frame as being decoded by the calling thread.
+
+        Returns:
+            False if the frame is cached or decoded by another thread already.
+        """
+        with self.lock:
+            if key in self.entries or key in self.loading:
+                return False
+            self.loading.add(key)
+            return True
+
+    def unreserve(self, key: tuple[str, int]):
+        """Mark frame reserved with reserve as no longer being decoded."""
+        with self.lock:
+            self.loading.discard(key)
+
+    def remove(self, key: tuple[str, int]):
+        """Drop frame from the cache."""
+        with self.lock:
+            _, nbytes = self.entries.pop(key)
+            self.used_bytes -= nbytes
+            self.folder_bytes[key[0]] -= nbytes
+            if not self.folder_bytes[key[0]]:
+                del self.folder_bytes[key[0]]
+
+    def clear(self):
+        """Drop every frame from the cache."""
+        with self.lock:
+            self.entries.clear()
+            self.folder_bytes.clear()
+            self.used_bytes = 0
+
+    def discard_folder(self, folder_name: str):
+        """Drop every frame of the folder from the cache."""
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == folder_name]:
+                self.remove(key)
+
+    def __contains__(self, key: tuple[str, int]) -> bool:
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class FolderFrames:
+    """Frames of a single folder, decoded only when accessed.
+
+    Behaves like a read-only list of images, so it can be indexed
+    and measured the same way as the list returned by load_images.
+    """
+
+    def __init__(
+        self,
+        folder_name: str,
+        frame_paths: list[str],
+        cache: SurfaceCache,
+        x: int,
+        y: int,
+        width: int,
+        height: int,
+        source_size: Optional[tuple[int, int]] = None,
+        packs: Optional[dict[str, framepack.FramePack]] = None,
+    ) -> None:
+        self.folder_name = folder_name
+        self.frame_paths = frame_paths
+        self.cache = cache
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        # frames are packed in their own size, whatever size they're displayed in
+        self.source_size = source_size or (width, height)
+        # mapped packs by folder name, shared by every provider of the dataset
+        self.packs = packs if packs is not None else {}
+
+    @property
+    def pack(self) -> Optional[framepack.FramePack]:
+        """Mapped frame pack of this folder, None until it's synced."""
+        return self.packs.get(self.folder_name)
+
+    def load(self, idx: int) -> Image:
+        """Decode and scale frame with given index, bypassing the cache.
+
+        If the folder has a frame pack, the frame is resampled from
+        the nearest level of the mapped file instead.
+        """
+        start = time.perf_counter()
+        if self.pack is not None:
+            image = self.wrap(*self.packed_frame(idx))
+        else:
+            image = Image(
+                image_path=self.frame_paths[idx],
+                x=self.x,
+                y=self.y,
+                width=self.width,
+                height=self.height,
+            )
+        registry.observe("decode.load_ms", (time.perf_counter() - start) * 1000)
+        return image
+
+    def packed_frame(self, idx: int) -> tuple[memoryview, tuple[int, int]]:
+        """Return raw pixels of the packed frame in the level nearest to the displayed size.
+
+        Returns:
+            (pixels, size of the level)
+        """
+        pack = self.pack
+        level = pack.nearest_level((self.width, self.height))
+        return pack.frame(idx, level), pack.level_sizes[level]
+
+    def __getitem__(self, idx: int) -> Image:
+        """Return frame with given index, decoding it on first access."""
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Frame index {idx} out of range for {self.folder_name}")
+        key = (self.folder_name, idx)
+        image = self.cache.get(key)
+        if image is None or not self.fits(image):
+            image = self.load(idx)
+            self.cache.put(key, image)
+        return image
+
+    def sync_pack(
+        self,
+        pack_dir: str,
+        workers: Optional[int] = settings.DECODE_WORKERS,
+        executor: Optional[ProcessPoolExecutor] = None,
+    ):
+        """Map frame pack of this folder, rebuilding it first if it's outdated.
+
+        Pack is built once, in the size of the source frames and a pyramid
+        of smaller ones, or in the displayed size if that's larger, so
+        enlarged frames are wrapped without scaling too. Resizes never
+        rebuild it, frames are resampled from the nearest level instead.
+        It's rebuilt only when any source frame changes its modification time
+        or size.
+
+        Args:
+            pack_dir: directory storing the packs.
+            workers: number of processes decoding frames if rebuild is needed.
+            executor: pool of worker processes to reuse for the rebuild.
+        """
+        path = framepack.pack_path(pack_dir, self.folder_name)
+        if not self.has_valid_pack(pack_dir):
+            size = self.source_size
+            if self.width >= size[0] and self.height >= size[1]:
+                size = (self.width, self.height)
+            buffers = decode_frames(
+                self.frame_paths,
+                [size] * len(self.frame_paths),
+                workers,
+                executor,
+                levels=settings.FRAME_PYRAMID_LEVELS,
+            )
+            framepack.write_pack(
+                path,
+                self.frame_paths,
+                size,
+                FRAME_BUFFER_FORMAT,
+                buffers,
+                levels=settings.FRAME_PYRAMID_LEVELS,
+            )
+        self.packs[self.folder_name] = framepack.FramePack(path)
+
+    def has_valid_pack(self, pack_dir: str) -> bool:
+        """Check whether frame pack of this folder is up to date, in whatever size it is."""
+        return framepack.is_valid(
+            framepack.pack_path(pack_dir, self.folder_name),
+            self.frame_paths,
+            self.source_size,
+            FRAME_BUFFER_FORMAT,
+            settings.FRAME_PYRAMID_LEVELS,
+        )
+
+    def wrap(self, buffer: bytes, size: Optional[tuple[int, int]] = None) -> Image:
+        """Create frame from raw pixels returned by decode_frame.
+
+        Args:
+            buffer: raw pixels of the frame.
+            size: size of the pixels if it differs from the displayed one,
+                they're scaled then. Larger frames are smoothed, smaller
+                ones are enlarged the same way as decoded images.
+        """
+        display_size = (self.width, self.height)
+        size = size or display_size
+        surface = pygame.image.frombuffer(buffer, size, FRAME_BUFFER_FORMAT)
+        if size[0] > self.width and size[1] > self.height:
+            surface = pygame.transform.smoothscale(surface, display_size)
+        elif size != display_size:
+            surface = pygame.transform.scale(surface, display_size)
+        # frames are opaque, converted to the display format without alpha
+        surface.set_alpha(None)
+        return Image.from_surface(surface, x=self.x, y=self.y)
+
+    def fits(self, image: Image) -> bool:
+        """Check whether the frame was created for the current size and position."""
+        return image.rect == self.get_rect()
+
+    def resize(self, x: int, y: int, width: int, height: int):
+        """Display the frames in another place and size, dropping the decoded ones.
+
+        Frames decoded for the previous size that are still in flight
+        are recognized by fits and never displayed.
+        """
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.cache.discard_folder(self.folder_name)
+
+    def prefetch(self, idx: int):
+        """Decode frame with given index into the cache, unless it's already there.
+
+        A frame is decoded by a single thread at a time, others skip it.
+        """
+        key = (self.folder_name, idx)
+        if not self.cache.reserve(key):
+            return
+        try:
+            image = self.load(idx)
+            if self.fits(image):
+                self.cache.put(key, image)
+        finally:
+            self.cache.unreserve(key)
+
+    def get_ready(self, idx: int) -> Optional[Image]:
+        """Return frame with given index only if it's already decoded."""
+        image = self.cache.get((self.folder_name, idx % len(self)))
+        if image is None or not self.fits(image):
+            return None
+        return image
+
+    def get_rect(self) -> pygame.Rect:
+        """Area of the screen covered by the frames."""
+        rect = pygame.Rect(0, 0, self.width, self.height)
+        rect.center = self.x, self.y
+        return rect
+
+    def draw_placeholder(self, screen: pygame.SurfaceType):
+        """Draw empty frame in place of the frame that is not decoded yet."""
+        pygame.draw.rect(screen, settings.Color.GRAY.value, self.get_rect())
+
+    def __len__(self):
+        return len(self.frame_paths)
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes used by decoded frames of this folder."""
+        return self.cache.folder_bytes.get(self.folder_name, 0)
+
+
+class SharedFrames(FolderFrames):
+    """Frames of a single folder decoded once by the frame store for every viewer.
+
+    Frames are decoded by the store into shared memory, in the displayed size,
+    the first time any viewer displays the folder. Every viewer wraps them
+    into surfaces without copying, so they take no memory of their own and
+    aren't put in the cache. See framestore.
+    """
+
+    def __init__(
+        self,
+        folder_name: str,
+        frame_paths: list[str],
+        store: framestore.FrameStoreClient,
+        cache: SurfaceCache,
+        x: int,
+        y: int,
+        width: int,
+        height: int,
+        source_size: Optional[tuple[int, int]] = None,
+        packs: Optional[dict[str, framepack.FramePack]] = None,
+    ) -> None:
+        super().__init__(
+            folder_name, frame_paths, cache, x, y, width, height, source_size, packs
+        )
+        self.store = store
+        self.segment: Optional[framestore.SharedSegment] = None
+        # every frame is wrapped only once, so it's drawn as the same image
+        self.images: dict[int, Image] = {}
+        self.lock = threading.Lock()
+
+    def attach(self) -> framestore.SharedSegment:
+        """Return frames shared by the store, waiting for it to decode them if needed.
+
+        Store is asked outside the lock, so the main thread never waits
+        for it to decode the folder. Segment is published under the lock,
+        unless another thread published one first or the frames were resized
+        meanwhile, it's released then.
+        """
+        while True:
+            with self.lock:
+                if self.segment is not None:
+                    return self.segment
+                size = (self.width, self.height)
+            segment = self.store.attach(self.frame_paths, size)
+            with self.lock:
+                if self.segment is None and size == (self.width, self.height):
+                    self.segment = segment
+                    return segment
+            self.store.release(segment)
+
+    def load(self, idx: int) -> Image:
+        """Wrap frame with given index shared by the store, only once.
+
+        Frame is wrapped and stored under the lock, only if it comes from
+        the segment still attached. One attached before a resize released it
+        is dropped and the frame is wrapped from the segment of the new size.
+        """
+        start = time.perf_counter()
+        image = None
+        while image is None:
+            segment = self.attach()
+            with self.lock:
+                if segment is not self.segment:
+                    continue
+                image = self.images.get(idx)
+                if image is None:
+                    image = self.images[idx] = self.wrap(segment.frame(idx))
+        registry.observe("decode.load_ms", (time.perf_counter() - start) * 1000)
+        return image
+
+    def __getitem__(self, idx: int) -> Image:
+        """Return frame with given index, waiting for the store on first access."""
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Frame index {idx} out of range for {self.folder_name}")
+        image = self.get_ready(idx)
+        if image is None:
+            image = self.load(idx)
+        return image
+
+    def prefetch(self, idx: int):
+        """Wrap frame with given index, unless it's already wrapped."""
+        if self.get_ready(idx) is None:
+            self.load(idx)
+
+    def get_ready(self, idx: int) -> Optional[Image]:
+        """Return frame with given index only if it's already wrapped."""
+        with self.lock:
+            image = self.images.get(idx % len(self))
+        if image is None or not self.fits(image):
+            return None
+        return image
+
+    def resize(self, x: int, y: int, width: int, height: int):
+        """Display the frames in another place and size, shared by the store in that size.
+
+        Everything is changed under the lock, so no frame is attached
+        or wrapped in the old size afterwards.
+        """
+        with self.lock:
+            self.images = {}
+            if self.segment is not None:
+                self.store.release(self.segment)
+                self.segment = None
+            super().resize(x, y, width, height)
+
+    @property
+    def nbytes(self) -> int:
+        """Frames are shared, they take no memory of this viewer."""
+        return 0
+
+
+class VideoFrames(FolderFrames):
+    """Frames of a single video, streamed from ffmpeg instead of decoded one by one.
+
+    Displayed frames are read from a stream decoding ahead of them into a ring
+    buffer bounded by settings.VIDEO_BUFFER_BUDGET, so even long videos take
+    a fixed amount of memory. Frames loaded explicitly, e.g. for heatmaps,
+    come from a stream of their own, so they don't make the displayed one seek.
+    Neither is ever put in the cache or packed.
+    """
+
+    def __init__(
+        self,
+        folder_name: str,
+        video_path: str,
+        video: videostream.VideoIndex,
+        cache: SurfaceCache,
+        x: int,
+        y: int,
+        width: int,
+        height: int,
+    ) -> None:
+        super().__init__(
+            folder_name, [], cache, x, y, width, height, (video.width, video.height)
+        )
+        self.video_path = video_path
+        self.video = video
+        self.stream = self.create_stream()
+        self.loader: Optional[videostream.VideoStream] = None
+
+    def create_stream(self) -> videostream.VideoStream:
+        return videostream.VideoStream(
+            self.video_path,
+            self.video,
+            (self.width, self.height),
+            # frames in flight during a resize keep the size they're decoded in
+            functools.partial(self.wrap, size=(self.width, self.height)),
+            budget_bytes=settings.VIDEO_BUFFER_BUDGET,
+            pixel_format=FRAME_BUFFER_FORMAT.lower(),
+            ffmpeg=settings.FFMPEG,
+            idle_timeout=settings.VIDEO_IDLE_TIMEOUT,
+        )
+
+    def load(self, idx: int) -> Image:
+        """Return frame with given index, waiting until it's decoded.
+
+        Loading frames in order reads them from a single ffmpeg pipe.
+        """
+        start = time.perf_counter()
+        if self.loader is None:
+            self.loader = self.create_stream()
+        image = self.loader.read(idx)
+        registry.observe("decode.load_ms", (time.perf_counter() - start) * 1000)
+        return image
+
+    def __getitem__(self, idx: int) -> Image:
+        """Return frame with given index, waiting until it's decoded."""
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Frame index {idx} out of range for {self.folder_name}")
+        return self.stream.read(idx)
+
+    def sync_pack(
+        self,
+        pack_dir: str,
+        workers: Optional[int] = settings.DECODE_WORKERS,
+        executor: Optional[ProcessPoolExecutor] = None,
+    ):
+        """Videos are streamed, there's nothing to pack."""
+
+    def has_valid_pack(self, pack_dir: str) -> bool:
+        return True
+
+    def resize(self, x: int, y: int, width: int, height: int):
+        """Display the frames in another place and size, restarting the streams.
+
+        ffmpeg scales the frames, so every stream is replaced by one decoding
+        frames of the new size.
+        """
+        self.stream.close()
+        if self.loader is not None:
+            self.loader.close()
+            self.loader = None
+        super().resize(x, y, width, height)
+        self.stream = self.create_stream()
+
+    def prefetch(self, idx: int):
+        """Streams decode ahead of the displayed frame on their own."""
+
+    def get_ready(self, idx: int) -> Optional[Image]:
+        """Return frame with given index if it's decoded, make the stream decode it otherwise."""
+        return self.stream.request(idx % len(self))
+
+    def __len__(self):
+        return self.video.frame_count
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes used by frames buffered by the streams."""
+        streams = [self.stream, self.loader]
+        return sum(stream.nbytes for stream in streams if stream is not None)
+
+
+def create_frames(
+    info: FolderInfo,
+    cache: SurfaceCache,
+    x: int,
+    y: int,
+    width: int,
+    height: int,
+    packs: Optional[dict[str, framepack.FramePack]] = None,
+) -> FolderFrames:
+    """Create frames of the folder.
+
+    Video is streamed. Frames of other folders are shared by the frame store
+    if the viewer is connected to it, decoded by the viewer itself otherwise.
+    """
+    if info.video is not None:
+        return VideoFrames(
+            info.name, info.video_path, info.video, cache, x, y, width, height
+        )
+    source_size = (info.width, info.height) if info.width and info.height else None
+    if framestore.client.connected:
+        return SharedFrames(
+            info.name,
+            info.frame_paths,
+            framestore.client,
+            cache,
+            x,
+            y,
+            width,
+            height,
+            source_size,
+            packs,
+        )
+    return FolderFrames(
+        info.name, info.frame_paths, cache, x, y, width, height, source_size, packs
+    )
+
+
+class FrameProvider(Mapping):
+    """Lazy replacement for the mapping {folder_name: images in that folder}.
+
+    Only the folder listing is read upfront, frames are decoded the first
+    time they are accessed and kept in a shared SurfaceCache.
+    Folders storing a video are streamed instead, see VideoFrames.
+    Connected to the frame store, frames are shared among viewers, see SharedFrames.
+    """
+
+    def __init__(
+        self,
+        dataset_dir: str,
+        budget_bytes: int = settings.FRAME_CACHE_BUDGET,
+        index: Optional[DatasetIndex] = None,
+        x: Optional[int] = None,
+        y: Optional[int] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        name: Optional[str] = None,
+        cache: Optional[SurfaceCache] = None,
+        packs: Optional[dict[str, framepack.FramePack]] = None,
+    ) -> None:
+        """
+        Args:
+            dataset_dir: directory containing config folders.
+            budget_bytes: memory budget of the decoded frames cache,
+                ignored if the cache is provided.
+            index: already scanned dataset, scanned here if not provided.
+            x: position the frames center on the x coordinate.
+            y: position the frames center on the y coordinate.
+            width: width the frames are scaled to.
+            height: height the frames are scaled to.
+                Geometry left out is the one of the frames in the window layout.
+            name: name the cache reports to the registry under,
+                name of the dataset directory by default.
+            cache: cache shared with other providers, frames of every dataset
+                then compete for a single budget. Folder names have to be
+                unique among the providers, they key the frames.
+            packs: mapped frame packs shared with another provider of the same
+                dataset, e.g. the one displaying them in another size.
+        """
+        rect = Layout.for_screen().frame_rect()
+        x = x if x is not None else rect.centerx
+        y = y if y is not None else rect.centery
+        width = width if width is not None else rect.width
+        height = height if height is not None else rect.height
+        self.dataset_dir = dataset_dir
+        self.name = name or os.path.basename(os.path.normpath(dataset_dir))
+        self.index = index if index is not None else DatasetIndex(dataset_dir)
+        if cache is None:
+            cache = SurfaceCache(budget_bytes)
+            cache.watch(self.name)
+        self.cache = cache
+        self.packs = packs if packs is not None else {}
+        self.folders: dict[str, FolderFrames] = {}
+        for folder_name, info in self.index.folders.items():
+            self.folders[folder_name] = create_frames(
+                info, self.cache, x=x, y=y, width=width, height=height, packs=self.packs
+            )
+
+    def __getitem__(self, folder_name: str) -> FolderFrames:
+        return self.folders[folder_name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.folders)
+
+    def __len__(self):
+        return len(self.folders)
+
+    @property
+    def used_bytes(self) -> int:
+        """Number of bytes used by all decoded frames, of every provider sharing the cache."""
+        return self.cache.used_bytes
+
+    def bytes_per_folder(self) -> dict[str, int]:
+        """Return number of bytes used by decoded frames of every folder."""
+        return {name: folder.nbytes for name, folder in self.folders.items()}
+
+    def resize(self, x: int, y: int, width: int, height: int):
+        """Display frames of every folder in another place and size.
+
+        Packed frames are resampled from the pyramid level nearest
+        to the new size, the packs themselves stay as they are.
+        """
+        for folder in self.folders.values():
+            folder.resize(x, y, width, height)
+
+    def preload(
+        self,
+        folder_names: Optional[list[str]] = None,
+        workers: Optional[int] = settings.DECODE_WORKERS,
+    ):
+        """Decode frames upfront using multiple processes.
+
+        Frames are decoded and scaled by worker processes, the main process
+        only wraps returned pixel buffers into surfaces. Decoding stops once
+        the cache budget is filled.
+
+        Args:
+            folder_names: folders to decode, in given order (default: all).
+            workers: number of processes (default: number of cores).
+        """
+        tasks = []
+        for folder_name in folder_names or list(self.folders):
+            folder = self.folders[folder_name]
+            if folder.pack is not None or isinstance(folder, SharedFrames):
+                # already decoded on disk or by the store, wrapping it on demand is cheap
+                continue
+            for idx, frame_path in enumerate(folder.frame_paths):
+                if (folder_name, idx) not in self.cache:
+                    tasks.append((folder, idx, frame_path))
+        if not tasks:
+            return
+        frame_nbytes = tasks[0][0].width * tasks[0][0].height * 4
+        free_bytes = self.cache.budget_bytes - self.cache.used_bytes
+        tasks = tasks[: max(free_bytes // frame_nbytes, 0)]
+        buffers = decode_frames(
+            [path for _, _, path in tasks],
+            [(folder.width, folder.height) for folder, _, _ in tasks],
+            workers,
+        )
+        for (folder, idx, _), buffer in zip(tasks, buffers):
+            self.cache.put((folder.folder_name, idx), folder.wrap(buffer))
+
+    def sync_packs(
+        self,
+        pack_dir: str = settings.FRAME_PACK_DIR,
+        workers: Optional[int] = settings.DECODE_WORKERS,
+    ):
+        """Map frame packs of every folder, rebuilding the outdated ones."""
+        executor = None
+        try:
+            for folder in self.folders.values():
+                if executor is None and not folder.has_valid_pack(pack_dir):
+                    # one pool for every rebuild, only if there is any
+                    executor = create_executor(workers)
+                folder.sync_pack(pack_dir, workers, executor)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+
+class Prefetcher:
+    """Decode frames that are likely to be displayed next in background threads.
+
+    Work is ordered by priority, the lower the sooner. Every call to schedule
+    replaces the queued work, so a rapid series of clicks doesn't pile up
+    decoding of frames that are no longer relevant.
+    """
+
+    def __init__(
+        self,
+        provider: FrameProvider,
+        workers: int = settings.PREFETCH_WORKERS,
+        radius: int = settings.PREFETCH_RADIUS,
+    ) -> None:
+        """
+        Args:
+            provider: frames that will be decoded into its cache.
+            workers: number of decoding threads.
+            radius: how many frames before and after the current one to decode.
+        """
+        self.provider = provider
+        self.workers = workers
+        self.radius = radius
+        self.queue = queue.PriorityQueue()
+        self.generation = 0
+        self.counter = itertools.count()
+        self.threads: list[threading.Thread] = []
+        registry.watch(f"prefetch.{provider.name}.queue", self.queue.qsize)
+
+    def start(self):
+        """Start decoding threads if they are not running yet."""
+        if self.threads:
+            return
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self.work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def cancel(self):
+        """Drop all the queued work."""
+        self.generation += 1
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def schedule(self, folder_name: str, image_idx: int, neighbours: list[str]):
+        """Replace queued work with frames around image_idx.
+
+        Frames of the current folder go first, starting from image_idx
+        and moving away from it. Then the same frames of the neighbouring folders,
+        in given order.
+
+        Args:
+            folder_name: folder that is currently displayed.
+            image_idx: index of currently displayed frame.
+            neighbours: folders reachable with a single click.
+        """
+        self.cancel()
+        self.start()
+        offsets = self.get_offsets()
+        for rank, name in enumerate([folder_name, *neighbours]):
+            for priority, offset in enumerate(offsets):
+                self.put(rank * len(offsets) + priority, name, image_idx + offset)
+
+    def schedule_together(self, folder_names: list[str], image_idx: int):
+        """Replace queued work with frames around image_idx of folders displayed at once.
+
+        All folders get the current frame decoded first, then frames
+        further away from it, one step at a time.
+        """
+        self.cancel()
+        self.start()
+        for priority, offset in enumerate(self.get_offsets()):
+            for rank, name in enumerate(folder_names):
+                self.put(priority * len(folder_names) + rank, name, image_idx + offset)
+
+    def get_offsets(self) -> list[int]:
+        """Return offsets from the current frame, ordered by distance."""
+        offsets = [0]
+        for distance in range(1, self.radius + 1):
+            offsets += [distance, -distance]
+        return offsets
+
+    def put(self, priority: int, folder_name: Optional[str], idx: int):
+        self.queue.put(
+            (priority, next(self.counter), self.generation, folder_name, idx)
+        )
+
+    def stop(self):
+        """Drop queued work and end decoding threads."""
+        self.cancel()
+        for _ in self.threads:
+            self.put(-1, None, 0)
+        self.threads = []
+
+    def work(self):
+        """Decode queued frames, skipping the ones that were cancelled.
+
+        A frame that fails to decode is counted and reported, and tried again
+        the next time it's scheduled. The thread keeps decoding the others.
+        """
+        while True:
+            _, _, generation, folder_name, idx = self.queue.get()
+            if folder_name is None:
+                return
+            if generation != self.generation:
+                registry.count("prefetch.cancelled")
+                continue
+            frames = self.provider[folder_name]
+            try:
+                frames.prefetch(idx % len(frames))
+            except Exception as error:
+                registry.count("prefetch.errors")
+                warnings.warn(
+                    f"Prefetching {folder_name} frame {idx} failed: {error!r}"
+                )
+
+
+class FrameView:
+    """Draw current frame without ever waiting for it to be decoded.
+
+    Until the wanted frame is ready, the last drawn frame is displayed,
+    or a placeholder if there's none.
+    """
+
+    def __init__(self, prefetcher: Prefetcher) -> None:
+        self.prefetcher = prefetcher
+        self.frames: Optional[FolderFrames] = None
+        self.last_image: Optional[Image] = None
+        self.scheduled = None
+        self.waiting = False
+
+    def set_frame(self, folder_name: str, image_idx: int, neighbours: list[str]):
+        """Pick frame to display and schedule prefetching if it changed.
+
+        Args:
+            folder_name: folder that the frame is taken from.
+            image_idx: index of the frame.
+            neighbours: folders reachable with a single click, prefetched as well.
+        """
+        self.frames = self.prefetcher.provider[folder_name]
+        if self.scheduled != (folder_name, image_idx):
+            self.scheduled = (folder_name, image_idx)
+            self.prefetcher.schedule(folder_name, image_idx, neighbours)
+        image = self.frames.get_ready(image_idx)
+        self.waiting = image is None
+        if image is not None:
+            self.last_image = image
+
+    def get_state(self) -> tuple:
+        """Describe what is drawn, so Renderer can tell if it changed."""
+        return (id(self.last_image),)
+
+    def get_rect(self) -> pygame.Rect:
+        """Area of the screen covered when drawing."""
+        if self.last_image is not None:
+            return self.last_image.get_rect()
+        return self.frames.get_rect()
+
+    def draw(self, screen: pygame.SurfaceType):
+        """Draw frame picked with set_frame."""
+        if self.last_image is not None:
+            self.last_image.draw(screen)
+        else:
+            self.frames.draw_placeholder(screen)
+
+
+class ZoomView:
+    """Display magnified part of the current frame, zoomed with the mouse wheel.
+
+    Magnified frame is split into tiles rasterized only once and kept in
+    a cache keyed by (folder, frame index, zoom, tile), so dragging it around
+    rasterizes only the newly exposed tiles. Packed frames are magnified
+    from their full size, others from the displayed frame. Zoom and position
+    are kept when the frame or config changes, so the same region can be
+    compared across configs and followed during playback.
+    """
+
+    def __init__(
+        self,
+        frame_view: FrameView,
+        levels: tuple[int, ...] = settings.ZOOM_LEVELS,
+        tile_size: int = settings.ZOOM_TILE_SIZE,
+        budget_bytes: int = settings.ZOOM_CACHE_BUDGET,
+        font: Optional[pygame.font.FontType] = None,
+    ) -> None:
+        """
+        Args:
+            frame_view: view of the frames that are magnified.
+            levels: zoom factors chosen by the mouse wheel, starting with 1.
+            tile_size: approximate size of the tiles, in pixels of the screen.
+            budget_bytes: memory budget of the rasterized tiles.
+            font: font of the zoom factor displayed in the corner.
+        """
+        self.frame_view = frame_view
+        self.levels = levels
+        self.tile_size = tile_size
+        self.cache = SurfaceCache(budget_bytes)
+        self.cache.watch("zoom_tiles")
+        self.font = font if font is not None else settings.label_font
+        self.level = 0
+        # upperleft corner of the visible area, in widths and heights of the frame
+        self.offset = [0.0, 0.0]
+        self.dragging = False
+        self.frames: Optional[FolderFrames] = None
+        self.source: Optional[pygame.SurfaceType] = None
+        self.source_key = None
+        self.waiting = False
+
+    @property
+    def zoom(self) -> int:
+        return self.levels[self.level]
+
+    @property
+    def active(self) -> bool:
+        """Whether the frame is magnified at all."""
+        return self.zoom > 1
+
+    def set_frame_view(self, frame_view: FrameView):
+        """Magnify frames of another view, e.g. one laid out anew, dropping the tiles."""
+        self.frame_view = frame_view
+        self.frames = None
+        self.source = None
+        self.source_key = None
+        self.cache.clear()
+
+    def clamp(self):
+        """Keep the visible area inside the frame."""
+        limit = 1 - 1 / self.zoom
+        self.offset = [min(max(offset, 0.0), limit) for offset in self.offset]
+
+    def zoom_at(self, pos: tuple[int, int], steps: int):
+        """Change zoom by given number of levels, keeping the point under pos in place."""
+        level = min(max(self.level + steps, 0), len(self.levels) - 1)
+        if level == self.level:
+            return
+        rect = self.get_rect()
+        old_zoom = self.zoom
+        self.level = level
+        for axis, position in enumerate(
+            ((pos[0] - rect.x) / rect.width, (pos[1] - rect.y) / rect.height)
+        ):
+            point = self.offset[axis] + position / old_zoom
+            self.offset[axis] = point - position / self.zoom
+        self.clamp()
+        registry.count("zoom.changes")
+
+    def pan(self, rel: tuple[int, int]):
+        """Move the visible area along with the mouse dragging the frame."""
+        rect = self.get_rect()
+        self.offset[0] -= rel[0] / (rect.width * self.zoom)
+        self.offset[1] -= rel[1] / (rect.height * self.zoom)
+        self.clamp()
+
+    def handle_event(self, event: pygame.event.EventType):
+        """Zoom with the mouse wheel over the frame and pan by dragging it."""
+        if self.frame_view.frames is None and self.frames is None:
+            return
+        rect = self.get_rect()
+        if event.type == pygame.MOUSEWHEEL:
+            pos = pygame.mouse.get_pos()
+            if rect.collidepoint(pos):
+                self.zoom_at(pos, 1 if event.y > 0 else -1)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self.dragging = self.active and rect.collidepoint(event.pos)
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.dragging = False
+        elif event.type == pygame.MOUSEMOTION and self.dragging:
+            self.pan(event.rel)
+
+    def set_frame(self, folder_name: str, image_idx: int, neighbours: list[str]):
+        """Pick frame to magnify.
+
+        Packed frames are always ready, frames of the displayed size aren't
+        even prefetched then. Others are picked by the frame view, until
+        they're decoded the last magnified frame is displayed.
+
+        Args:
+            folder_name: folder that the frame is taken from.
+            image_idx: index of the frame.
+            neighbours: folders reachable with a single click, prefetched as well.
+        """
+        self.frames = self.frame_view.prefetcher.provider[folder_name]
+        idx = image_idx % len(self.frames)
+        pack = self.frames.pack
+        if pack is not None:
+            key = (folder_name, idx, pack.size)
+            if key != self.source_key:
+                self.source = pygame.image.frombuffer(
+                    pack.frame(idx), pack.size, FRAME_BUFFER_FORMAT
+                )
+                self.source_key = key
+            self.waiting = False
+            return
+        self.frame_view.set_frame(folder_name, image_idx, neighbours)
+        self.waiting = self.frame_view.waiting
+        if not self.waiting:
+            self.source = self.frame_view.last_image.image
+            self.source_key = (folder_name, idx, self.source.get_size())
+
+    def get_tile(
+        self, tile: tuple[int, int], block: tuple[int, int], scale: tuple[float, float]
+    ) -> Image:
+        """Return tile of the magnified frame, rasterizing it on first use.
+
+        Args:
+            tile: column and row of the tile.
+            block: size of the tiles in pixels of the source frame.
+            scale: how many pixels of the screen every source pixel covers.
+        """
+        key = (*self.source_key, self.zoom, tile)
+        image = self.cache.get(key)
+        if image is not None:
+            return image
+        width, height = self.source.get_size()
+        left, top = tile[0] * block[0], tile[1] * block[1]
+        right = min(left + block[0], width)
+        bottom = min(top + block[1], height)
+        # edges are rounded the same way for neighbouring tiles, so they never
+        # overlap or leave a gap, pixels are enlarged without smoothing
+        size = (
+            round(right * scale[0]) - round(left * scale[0]),
+            round(bottom * scale[1]) - round(top * scale[1]),
+        )
+        surface = pygame.transform.scale(
+            self.source.subsurface((left, top, right - left, bottom - top)), size
+        )
+        surface.set_alpha(None)
+        image = Image.from_surface(surface)
+        self.cache.put(key, image)
+        registry.count("zoom.tiles_rasterized")
+        return image
+
+    def get_state(self) -> tuple:
+        """Describe what is drawn, so Renderer can tell if it changed."""
+        rect = self.get_rect()
+        return (
+            self.source_key,
+            self.zoom,
+            round(self.offset[0] * rect.width * self.zoom),
+            round(self.offset[1] * rect.height * self.zoom),
+        )
+
+    def get_rect(self) -> pygame.Rect:
+        """Area of the screen covered when drawing."""
+        return (self.frames or self.frame_view.frames).get_rect()
+
+    def draw(self, screen: pygame.SurfaceType):
+        """Draw visible tiles with a single batch of blits, clipped to the frame."""
+        rect = self.get_rect()
+        if self.source is None:
+            self.frame_view.draw(screen)
+            return
+        width, height = self.source.get_size()
+        zoom = self.zoom
+        scale = (rect.width * zoom / width, rect.height * zoom / height)
+        block = (
+            max(round(self.tile_size / scale[0]), 1),
+            max(round(self.tile_size / scale[1]), 1),
+        )
+        # visible area of the magnified frame
+        left = round(self.offset[0] * rect.width * zoom)
+        top = round(self.offset[1] * rect.height * zoom)
+        columns = range(
+            int(left / scale[0]) // block[0],
+            min(
+                int((left + rect.width - 1) / scale[0]) // block[0],
+                (width - 1) // block[0],
+            )
+            + 1,
+        )
+        rows = range(
+            int(top / scale[1]) // block[1],
+            min(
+                int((top + rect.height - 1) / scale[1]) // block[1],
+                (height - 1) // block[1],
+            )
+            + 1,
+        )
+        blits = []
+        for row in rows:
+            for column in columns:
+                image = self.get_tile((column, row), block, scale)
+                image.prepare()
+                position = (
+                    rect.x + round(column * block[0] * scale[0]) - left,
+                    rect.y + round(row * block[1] * scale[1]) - top,
+                )
+                blits.append((image.image, position))
+        label = text_cache.render(f"{zoom}x", self.font, settings.Color.WHITE.value)
+        blits.append((label, rect.move(5, 5).topleft))
+        clip = screen.get_clip()
+        screen.set_clip(rect)
+        screen.blits(blits, doreturn=False)
+        screen.set_clip(clip)
+
+
+class PlaybackMode(Enum):
+    FORWARD = 0
+    REVERSE = 1
+    PING_PONG = 2
+
+
+class FrameScheduler:
+    """Pace the main loop with a monotonic clock instead of sleeping inside it.
+
+    Playback maps the time elapsed since it started to the frame displayed,
+    so it keeps its speed no matter how often the loop runs. When the loop
+    falls behind, frames whose time passed are dropped instead of played late.
+    Frames are counted in playback positions, e.g. every frame and its
+    in-betweens, from 0 to count - 1. When there's nothing to play or wait for,
+    the loop sleeps until the next input.
+    """
+
+    def __init__(
+        self,
+        frame_duration: float,
+        target_fps: int = settings.TARGET_FPS,
+        speeds: tuple[float, ...] = settings.PLAYBACK_SPEEDS,
+    ) -> None:
+        """
+        Args:
+            frame_duration: how long every position is displayed during playback
+                at normal speed, in seconds.
+            target_fps: how often the loop runs while it's busy waiting for something.
+            speeds: speed multipliers chosen from, 1 is the normal speed.
+        """
+        self.frame_duration = frame_duration
+        self.frame_interval = 1 / target_fps
+        self.speeds = speeds
+        self.speed = 1.0
+        self.mode = PlaybackMode.FORWARD
+        self.playing = False
+        self.count = 1
+        # position displayed last, and the tick of the clock it was displayed for
+        self.position = 0
+        self.tick = 0
+        # ticks are counted from the phase the clock had at anchor_time
+        self.anchor_time = 0.0
+        self.anchor_phase = 0.0
+        self.advanced = 0.0
+        registry.watch("playback.speed", lambda: self.speed)
+
+    def phase_at(self, now: float) -> float:
+        """Return number of ticks of the clock at given time, fractional."""
+        elapsed = now - self.anchor_time
+        return self.anchor_phase + elapsed * self.speed / self.frame_duration
+
+    def time_of(self, tick: int) -> float:
+        """Return when the clock reaches given tick."""
+        ticks = tick - self.anchor_phase
+        return self.anchor_time + ticks * self.frame_duration / self.speed
+
+    def position_of(self, tick: int) -> int:
+        """Return position displayed at given tick of the clock."""
+        if self.mode == PlaybackMode.REVERSE:
+            return -tick % self.count
+        if self.mode == PlaybackMode.PING_PONG and self.count > 1:
+            period = 2 * (self.count - 1)
+            tick %= period
+            return tick if tick < self.count else period - tick
+        return tick % self.count
+
+    def tick_of(self, position: int) -> int:
+        """Return tick of the clock the position is displayed at, ping-pong going forward."""
+        return -position if self.mode == PlaybackMode.REVERSE else position
+
+    def anchor(self, phase: float):
+        """Count ticks from given phase from now on."""
+        self.anchor_time = time.monotonic()
+        self.anchor_phase = phase
+        self.tick = math.floor(phase)
+
+    def set_playing(self, playing: bool, position: int = 0, count: int = 1):
+        """Start or stop playback, first position change is one tick away.
+
+        Playback starts anew at the position if it changed since
+        the last advance, e.g. another frame was chosen, or there's
+        another number of positions.
+
+        Args:
+            playing: whether playback runs.
+            position: position displayed now.
+            count: number of positions played.
+        """
+        if playing and (
+            not self.playing or position != self.position or count != self.count
+        ):
+            self.position = position
+            self.count = count
+            self.anchor(self.tick_of(position))
+        self.playing = playing
+
+    def set_frame_duration(self, frame_duration: float):
+        """Change how long every position is displayed, continuing from now."""
+        if self.playing:
+            now = time.monotonic()
+            self.anchor_phase = self.phase_at(now)
+            self.anchor_time = now
+        self.frame_duration = frame_duration
+
+    def set_speed(self, speed: float):
+        """Change speed multiplier, continuing from the displayed position."""
+        if self.playing:
+            self.anchor(self.phase_at(time.monotonic()))
+        self.speed = speed
+
+    def change_speed(self, steps: int):
+        """Choose speed given number of steps faster, or slower if negative."""
+        speeds = sorted(self.speeds)
+        nearest = min(speeds, key=lambda speed: abs(speed - self.speed))
+        index = min(max(speeds.index(nearest) + steps, 0), len(speeds) - 1)
+        self.set_speed(speeds[index])
+
+    def set_mode(self, mode: PlaybackMode):
+        """Play in another direction, continuing from the displayed position."""
+        self.mode = mode
+        if self.playing:
+            self.anchor(self.tick_of(self.position))
+
+    def toggle_mode(self, mode: PlaybackMode):
+        """Switch between given mode and playing forward."""
+        self.set_mode(PlaybackMode.FORWARD if self.mode == mode else mode)
+
+    def advance(self) -> Optional[int]:
+        """Return position to display if the clock reached another tick, None otherwise.
+
+        Ticks the loop was too late for are dropped and counted, so are ticks
+        displayed later than half of their duration after their time.
+        """
+        if not self.playing:
+            return None
+        now = time.monotonic()
+        tick = math.floor(self.phase_at(now))
+        if tick == self.tick:
+            return None
+        dropped = abs(tick - self.tick) - 1
+        if dropped:
+            registry.count("playback.dropped_frames", dropped)
+        late = now - self.time_of(tick)
+        registry.observe("playback.late_ms", late * 1000)
+        # positions shorter than a loop iteration are displayed a loop iteration long
+        slot = max(self.frame_duration / self.speed, self.frame_interval)
+        if late > slot / 2:
+            registry.count("playback.late_frames")
+        self.tick = tick
+        self.advanced = now
+        self.position = self.position_of(tick)
+        return self.position
+
+    def get_timeout(self, busy: bool) -> Optional[float]:
+        """Return how long the loop can sleep, None if it can sleep until the next input."""
+        now = time.monotonic()
+        deadlines = []
+        if self.playing:
+            # positions shorter than a loop iteration are dropped, not displayed faster
+            deadlines.append(
+                max(self.time_of(self.tick + 1), self.advanced + self.frame_interval)
+            )
+        if busy:
+            deadlines.append(now + self.frame_interval)
+        if not deadlines:
+            return None
+        return max(min(deadlines) - now, 0)
+
+    def wait_events(self, busy: bool = False) -> list[pygame.event.EventType]:
+        """Return pending events, sleeping until input or the next deadline if there are none.
+
+        Args:
+            busy: whether the loop waits for something other than input, e.g. frame decoding.
+        """
+        events = pygame.event.get()
+        if events:
+            return events
+        timeout = self.get_timeout(busy)
+        if timeout is None:
+            event = pygame.event.wait()
+        elif timeout > 0:
+            event = pygame.event.wait(math.ceil(timeout * 1000))
+        else:
+            return []
+        if event.type == pygame.NOEVENT:
+            return []
+        return [event, *pygame.event.get()]
+
+
+class GridView:
+    """Display frames of several folders side by side, all at the same frame index.
+
+    Frames are decoded in the size of a grid cell into a cache of their own,
+    so the grid doesn't evict frames of the main view.
+    """
+
+    def __init__(
+        self,
+        dataset_dir: str,
+        index: DatasetIndex,
+        rect: pygame.Rect,
+        budget_bytes: int = settings.GRID_CACHE_BUDGET,
+        font: Optional[pygame.font.FontType] = None,
+        packs: Optional[dict[str, framepack.FramePack]] = None,
+    ) -> None:
+        """
+        Args:
+            dataset_dir: directory containing config folders.
+            index: already scanned dataset.
+            rect: area of the screen the grid fills.
+            budget_bytes: memory budget of the frames decoded for the grid.
+            font: font of the cell labels.
+            packs: mapped frame packs of the main view, cells are resampled
+                from their smaller levels instead of decoded from the images.
+        """
+        self.dataset_dir = dataset_dir
+        self.index = index
+        self.packs = packs
+        self.rect = pygame.Rect(rect)
+        self.budget_bytes = budget_bytes
+        self.font = font if font is not None else settings.label_font
+        self.folder_names: list[str] = []
+        self.labels: list[str] = []
+        self.cells: list[pygame.Rect] = []
+        self.cell_size = 0
+        self.prefetcher: Optional[Prefetcher] = None
+        self.last_images: dict[str, Image] = {}
+        self.scheduled = None
+        self.waiting = False
+
+    def set_folders(self, folder_names: list[str], labels: Optional[list[str]] = None):
+        """Choose folders to display, laid out row by row in a square grid.
+
+        Args:
+            folder_names: folders to display, one per cell.
+            labels: text displayed in the corner of every cell.
+        """
+        labels = labels if labels is not None else list(folder_names)
+        if folder_names == self.folder_names and labels == self.labels:
+            return
+        self.folder_names = folder_names
+        self.labels = labels
+        self.scheduled = None
+        columns = max(math.ceil(math.sqrt(len(folder_names))), 1)
+        rows = max(math.ceil(len(folder_names) / columns), 1)
+        cell_size = min(self.rect.width // columns, self.rect.height // rows)
+        self.cells = [
+            pygame.Rect(
+                self.rect.x + (i % columns) * cell_size,
+                self.rect.y + (i // columns) * cell_size,
+                cell_size,
+                cell_size,
+            )
+            for i in range(len(folder_names))
+        ]
+        if cell_size != self.cell_size:
+            self.cell_size = cell_size
+            self.last_images = {}
+            if self.prefetcher is not None:
+                self.prefetcher.stop()
+            provider = FrameProvider(
+                self.dataset_dir,
+                budget_bytes=self.budget_bytes,
+                index=self.index,
+                width=cell_size,
+                height=cell_size,
+                name=f"{os.path.basename(os.path.normpath(self.dataset_dir))}_grid",
+                packs=self.packs,
+            )
+            self.prefetcher = Prefetcher(provider)
+
+    def stop(self):
+        """Stop decoding frames of the grid, it's no longer displayed."""
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+
+    def set_frame(self, image_idx: int):
+        """Pick frame of every cell and schedule prefetching if it changed."""
+        if self.scheduled != image_idx:
+            self.scheduled = image_idx
+            self.prefetcher.schedule_together(self.folder_names, image_idx)
+        self.waiting = False
+        for folder_name in self.folder_names:
+            image = self.prefetcher.provider[folder_name].get_ready(image_idx)
+            if image is None:
+                self.waiting = True
+            else:
+                self.last_images[folder_name] = image
+
+    def get_state(self) -> tuple:
+        """Describe what is drawn, so Renderer can tell if it changed."""
+        return tuple(
+            id(self.last_images.get(folder_name)) for folder_name in self.folder_names
+        ) + tuple(self.labels)
+
+    def get_rect(self) -> pygame.Rect:
+        """Area of the screen covered when drawing."""
+        return self.rect
+
+    def draw(self, screen: pygame.SurfaceType):
+        """Draw all the cells with a single batch of blits."""
+        blits = []
+        for folder_name, label, cell in zip(self.folder_names, self.labels, self.cells):
+            image = self.last_images.get(folder_name)
+            if image is None:
+                pygame.draw.rect(screen, settings.Color.GRAY.value, cell)
+            else:
+                image.prepare()
+                blits.append((image.image, cell))
+            text = text_cache.render(label, self.font, settings.Color.BLACK.value)
+            blits.append((text, text.get_rect(topleft=cell.move(5, 5).topleft)))
+        screen.blits(blits, doreturn=False)
+
+
+def one_click_variants(
+    folder_data: dict[str, str], options: dict[str, list]
+) -> list[dict[str, str]]:
+    """Return copies of folder_data with exactly one option changed.
+
+    Args:
+        folder_data: currently selected options.
+        options: every value that can be chosen for the option.
+    """
+    variants = []
+    for key, values in options.items():
+        for value in values:
+            if value != folder_data[key]:
+                variants.append({**folder_data, key: value})
+    return variants
+
+
+def decode_frame(image_path: str, size: tuple[int, int], levels: int = 1) -> bytes:
+    """Decode and scale single frame, return its raw pixels.
+
+    Runs in worker processes, so it only uses pygame functions
+    that don't need a display.
+
+    Args:
+        image_path: path of the frame.
+        size: size the frame is scaled to.
+        levels: number of levels of the pyramid returned, every next one
+            is smoothed down to half the size of the previous, see framepack.
+
+    Returns:
+        raw pixels of every level, one after another.
+    """
+    surface = pygame.image.load(image_path)
+    if surface.get_size() != tuple(size):
+        surface = pygame.transform.scale(surface, size)
+    buffers = [pygame.image.tostring(surface, FRAME_BUFFER_FORMAT)]
+    for level in range(1, levels):
+        # smoothscale needs 32 bit pixels, the previous level already has them
+        surface = pygame.transform.smoothscale(
+            pygame.image.frombuffer(
+                buffers[-1], framepack.level_size(size, level - 1), FRAME_BUFFER_FORMAT
+            ),
+            framepack.level_size(size, level),
+        )
+        buffers.append(pygame.image.tostring(surface, FRAME_BUFFER_FORMAT))
+    return b"".join(buffers)
+
+
+def create_executor(
+    workers: Optional[int] = settings.DECODE_WORKERS,
+) -> ProcessPoolExecutor:
+    """Create pool of worker processes, they're started once there's work for them."""
+    return ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context(settings.PROCESS_START_METHOD),
+    )
+
+
+def decode_frames(
+    frame_paths: list[str],
+    sizes: list[tuple[int, int]],
+    workers: Optional[int] = settings.DECODE_WORKERS,
+    executor: Optional[ProcessPoolExecutor] = None,
+    levels: int = 1,
+) -> Iterator[bytes]:
+    """Decode frames in worker processes, yield their raw pixels in order.
+
+    Args:
+        frame_paths: paths of frames to decode.
+        sizes: size every frame is scaled to.
+        workers: number of processes (default: number of cores).
+        executor: pool of worker processes to reuse, created for this call if not provided.
+        levels: number of pyramid levels of every frame, see decode_frame.
+    """
+    if not frame_paths:
+        return
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(len(frame_paths) // (4 * workers), 1)
+    args = (frame_paths, sizes, [levels] * len(frame_paths))
+    if executor is not None:
+        yield from executor.map(decode_frame, *args, chunksize=chunksize)
+        return
+    with create_executor(workers) as executor:
+        yield from executor.map(decode_frame, *args, chunksize=chunksize)
+
+
+def load_all_folders(
+    dataset_dir: str,
+    budget_bytes: int = settings.FRAME_CACHE_BUDGET,
+    index: Optional[DatasetIndex] = None,
+    cache: Optional[SurfaceCache] = None,
+    layout: Optional[Layout] = None,
+) -> FrameProvider:
+    """Create lazy mapping {folder_name: frames in that folder}, placed by the layout."""
+    rect = (layout or Layout.for_screen()).frame_rect()
+    return FrameProvider(
+        dataset_dir,
+        budget_bytes=budget_bytes,
+        index=index,
+        x=rect.centerx,
+        y=rect.centery,
+        width=rect.width,
+        height=rect.height,
+        cache=cache,
+    )
+
+
+def load_all_folders_mednerf(
+    dataset_dir: str,
+    budget_bytes: int = settings.FRAME_CACHE_BUDGET,
+    index: Optional[DatasetIndex] = None,
+    cache: Optional[SurfaceCache] = None,
+    layout: Optional[Layout] = None,
+) -> FrameProvider:
+    """Create lazy mapping {folder_name: frames in that folder}, placed by the layout."""
+    rect = (layout or Layout.for_screen()).frame_rect()
+    return FrameProvider(
+        dataset_dir,
+        budget_bytes=budget_bytes,
+        index=index,
+        x=rect.centerx,
+        y=rect.centery,
+        width=rect.width,
+        height=rect.height,
+        cache=cache,
+    )
 
 
 class Indexing(Enum):
@@ -693,6 +2843,38 @@ def handle_play_flag(play_button, play, event):
     return play
 
 
+def handle_grid_flag(grid_button, event):
+    """Toggle grid view with the button or G key, return whether it's displayed."""
+    if grid_button.set_action(event) or (
+        event.type == pygame.KEYDOWN and event.key == pygame.K_g
+    ):
+        grid_button.active = not grid_button.active
+    return grid_button.active
+
+
+def handle_diff_flag(diff_button, event):
+    """Toggle difference heatmap with the button or D key, return whether it's displayed."""
+    if diff_button.set_action(event) or (
+        event.type == pygame.KEYDOWN and event.key == pygame.K_d
+    ):
+        diff_button.active = not diff_button.active
+    return diff_button.active
+
+
+def handle_overlay_flag(overlay, event):
+    """Toggle performance overlay with F3 key, return whether it's displayed."""
+    if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+        overlay.toggle()
+    return overlay.visible
+
+
+def handle_profile_flag(profiler, event):
+    """Start or stop profiling with F4 key, return whether it's running."""
+    if event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+        profiler.toggle()
+    return profiler.active
+
+
 def handle_arrows(arrows_buttons, play, play_button, event):
     index_direction = None
     if arrows_buttons.update(event):
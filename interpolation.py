@@ -0,0 +1,213 @@
+"""Smooth playback, frames synthesized in between the frames of a folder.
+
+Every folder has only a few dozen frames of the orbit, played slowly they
+look choppy. In-betweens cross-fading consecutive frames let playback run
+at the frame rate of the loop while the orbit keeps its speed.
+"""
+
+import threading
+import warnings
+from typing import Optional
+
+import numpy as np
+import pygame
+
+import settings
+from telemetry import registry
+from heatmap import frame_pixels
+from helpers import FrameProvider, FrameView, Image, SurfaceCache
+
+
+def in_between_weights(steps: int) -> np.ndarray:
+    """Return weights of the next frame in every in-between, out of 256, evenly spaced."""
+    return np.arange(1, steps + 1, dtype=np.uint16) * 256 // (steps + 1)
+
+
+def cross_fade(frame_a: np.ndarray, frame_b: np.ndarray, steps: int) -> np.ndarray:
+    """Blend two frames into evenly spaced in-between frames.
+
+    All the in-betweens are computed at once on uint16 arrays, weights
+    are fixed point fractions of 256, so no float arrays are ever created.
+
+    Args:
+        frame_a: pixels of shape (height, width, channels).
+        frame_b: pixels of the next frame, of the same shape.
+        steps: number of in-between frames.
+
+    Returns:
+        in-between frames of shape (steps, height, width, channels),
+        the first one closest to frame_a.
+    """
+    weights = in_between_weights(steps)[:, None, None, None]
+    blended = frame_a.astype(np.uint16) * (256 - weights)
+    blended += frame_b.astype(np.uint16) * weights
+    # rounded to the nearest value, 255 * 256 + 128 still fits uint16
+    blended += 128
+    blended >>= 8
+    return blended.astype(np.uint8)
+
+
+class InterpolatedView:
+    """Display frames synthesized in between the frames of a folder during playback.
+
+    In-betweens of the frames just ahead of the displayed one, in the direction
+    of playback, are computed in a background thread and cached, bounded by
+    their own memory budget.
+    Until an in-between is ready, the frame it starts from is displayed,
+    so playback never waits for them.
+    """
+
+    def __init__(
+        self,
+        frame_view: FrameView,
+        steps: int,
+        budget_bytes: int = settings.INTERPOLATION_CACHE_BUDGET,
+        ahead: int = settings.INTERPOLATION_AHEAD,
+    ) -> None:
+        """
+        Args:
+            frame_view: view of the frames that are interpolated.
+            steps: number of in-between frames after every frame.
+            budget_bytes: memory budget of the computed in-betweens.
+            ahead: number of frames, starting with the displayed one,
+                whose in-betweens are computed ahead.
+        """
+        self.frame_view = frame_view
+        self.provider: FrameProvider = frame_view.prefetcher.provider
+        self.steps = steps
+        self.cache = SurfaceCache(budget_bytes)
+        self.cache.watch(f"{self.provider.name}_interpolated")
+        self.ahead = ahead
+        self.image: Optional[Image] = None
+        # frame displayed last, and frame whose in-betweens the thread computes next
+        self.scheduled = None
+        self.pending = None
+        self.generation = 0
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def waiting(self) -> bool:
+        return self.frame_view.waiting
+
+    def key(self, folder_name: str, image_idx: int, step: int) -> tuple[str, int]:
+        return (folder_name, image_idx * self.steps + step - 1)
+
+    def set_frame_view(self, frame_view: FrameView):
+        """Interpolate frames of another view, e.g. one laid out anew, dropping the in-betweens."""
+        self.stop()
+        self.frame_view = frame_view
+        self.image = None
+        self.cache.clear()
+
+    def compute(
+        self, folder_name: str, image_idx: int, pixels: dict[int, np.ndarray]
+    ) -> dict[int, np.ndarray]:
+        """Compute and cache in-betweens of the frame and the one after it.
+
+        Args:
+            folder_name: folder that the frames are taken from.
+            image_idx: index of the frame.
+            pixels: pixels of the frames at hand already, by index.
+
+        Returns:
+            pixels of both frames of the pair, by index.
+        """
+        frames = self.provider[folder_name]
+        if len(frames) < 2:
+            # a single frame has nothing to fade into
+            return {}
+        if self.key(folder_name, image_idx, self.steps) in self.cache:
+            return {}
+        pair = {}
+        for idx in (image_idx, (image_idx + 1) % len(frames)):
+            pair[idx] = pixels[idx] if idx in pixels else frame_pixels(frames, idx)
+        in_betweens = cross_fade(*pair.values(), self.steps)
+        for step, in_between in enumerate(in_betweens, start=1):
+            image = frames.wrap(in_between.tobytes())
+            self.cache.put(self.key(folder_name, image_idx, step), image)
+        registry.count("interpolation.frames", self.steps)
+        return pair
+
+    def work(self):
+        """Compute in-betweens ahead of the displayed frame, whenever it changes.
+
+        A pair that fails is skipped, its frames are displayed without
+        in-betweens and the thread goes on with the next pair.
+        """
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                folder_name, image_idx, direction = self.pending
+                self.pending = None
+                generation = self.generation
+            frames = self.provider[folder_name]
+            count = len(frames)
+            size = (frames.width, frames.height)
+            # consecutive pairs share a frame, it's read only once
+            pixels = {}
+            for offset in range(min(self.ahead, count)):
+                if generation != self.generation:
+                    break
+                idx = (image_idx + offset * direction) % count
+                try:
+                    pixels = self.compute(folder_name, idx, pixels)
+                except Exception as error:
+                    if (frames.width, frames.height) != size:
+                        # frames were resized while being read, the next frame
+                        # displayed in the new size schedules them anew
+                        break
+                    registry.count("interpolation.errors")
+                    warnings.warn(
+                        f"Interpolating {folder_name} frame {idx} failed: {error!r}"
+                    )
+                    pixels = {}
+
+    def set_frame(
+        self, folder_name: str, image_idx: int, step: int, direction: int = 1
+    ):
+        """Pick in-between to display, computing the ones ahead if the frame changed.
+
+        Args:
+            folder_name: folder that the frames are taken from.
+            image_idx: index of the frame the in-between starts from.
+            step: which in-between, 0 is the frame itself.
+            direction: 1 if playback goes forward, -1 if it goes back.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.work, daemon=True)
+            self.thread.start()
+        with self.condition:
+            if self.scheduled != (folder_name, image_idx, direction):
+                self.generation += 1
+                self.scheduled = self.pending = (folder_name, image_idx, direction)
+                self.condition.notify()
+        self.image = None
+        if step:
+            self.image = self.cache.get(self.key(folder_name, image_idx, step))
+            if self.image is not None and not self.frame_view.frames.fits(self.image):
+                self.image = None
+
+    def stop(self):
+        """Stop computing in-betweens, they're no longer displayed."""
+        with self.condition:
+            self.generation += 1
+            self.scheduled = self.pending = None
+
+    def get_state(self) -> tuple:
+        """Describe what is drawn, so Renderer can tell if it changed."""
+        if self.image is not None:
+            return (id(self.image),)
+        return self.frame_view.get_state()
+
+    def get_rect(self) -> pygame.Rect:
+        """Area of the screen covered when drawing."""
+        return self.frame_view.get_rect()
+
+    def draw(self, screen: pygame.SurfaceType):
+        """Draw in-between picked with set_frame, or the frame it starts from."""
+        if self.image is not None:
+            self.image.draw(screen)
+        else:
+            self.frame_view.draw(screen)
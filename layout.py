@@ -0,0 +1,87 @@
+"""Positions and sizes of everything the viewer displays, derived from the window size.
+
+Widgets are placed in design units, pixels of a window of settings.DESIGN_SIZE.
+Layout scales them uniformly to the actual window and centers the result,
+so the viewer looks the same in any window, only bigger or smaller.
+"""
+
+from typing import Optional
+
+import pygame
+
+import settings
+
+# center and size of the displayed frames, in design units
+FRAME_X = settings.DESIGN_SIZE[0] * 2 / 6
+FRAME_Y = settings.DESIGN_SIZE[1] / 2 - 50
+FRAME_SIZE = 600
+# centers of the columns of widgets, in design units
+LEFT_THIRD = settings.DESIGN_SIZE[0] / 6
+MID_X = settings.DESIGN_SIZE[0] / 2
+RIGHT_THIRD = settings.DESIGN_SIZE[0] * 5 / 6
+# size of the icon marking locked checkboxes, in design units
+LOCK_SIZE = 24
+
+
+class Layout:
+    """Map design units to pixels of a window of given size."""
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        design_size: tuple[int, int] = settings.DESIGN_SIZE,
+    ) -> None:
+        """
+        Args:
+            width: width of the window.
+            height: height of the window.
+            design_size: window size the design units are pixels of.
+        """
+        self.width = width
+        self.height = height
+        self.design_size = design_size
+        self.scale = min(width / design_size[0], height / design_size[1])
+        # the design keeps its aspect ratio, the rest of the window stays empty
+        self.offset_x = (width - design_size[0] * self.scale) / 2
+        self.offset_y = (height - design_size[1] * self.scale) / 2
+
+    @classmethod
+    def for_screen(cls) -> "Layout":
+        """Create layout of the window, or of the whole screen if it's not open yet."""
+        surface = pygame.display.get_surface()
+        if surface is not None:
+            return cls(*surface.get_size())
+        return cls(settings.SCREEN_SIZE.x, settings.SCREEN_SIZE.y)
+
+    def x(self, design_x: float) -> int:
+        """Return x coordinate of the window matching the one of the design."""
+        return round(self.offset_x + design_x * self.scale)
+
+    def y(self, design_y: float) -> int:
+        """Return y coordinate of the window matching the one of the design."""
+        return round(self.offset_y + design_y * self.scale)
+
+    def size(self, design_size: float) -> int:
+        """Return length in pixels of the window, never shorter than a pixel."""
+        return max(round(design_size * self.scale), 1)
+
+    def frame_rect(self, size: Optional[float] = None) -> pygame.Rect:
+        """Return area of the window the frames are displayed in.
+
+        Args:
+            size: size of the frames in design units, FRAME_SIZE by default.
+        """
+        size = self.size(size if size is not None else FRAME_SIZE)
+        rect = pygame.Rect(0, 0, size, size)
+        rect.center = self.x(FRAME_X), self.y(FRAME_Y)
+        return rect
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Layout):
+            return NotImplemented
+        return (self.width, self.height, self.design_size) == (
+            other.width,
+            other.height,
+            other.design_size,
+        )
@@ -1,221 +1,283 @@
+from typing import Optional
+
 import settings
-import time
 import pygame
-import mednerf
+from dataset_index import DatasetIndex
+from layout import FRAME_SIZE, FRAME_Y, LOCK_SIZE, RIGHT_THIRD, Layout
+from viewer import Scene
 from helpers import (
-    Button,
-    ButtonLayout,
     CheckBoxLayout,
     Image,
     Orientation,
-    Indexing,
-    draw_text,
+    SurfaceCache,
+    Text,
     load_all_folders,
-    construct_folder_name,
-    set_idx,
-    handle_arrows,
-    handle_play_flag,
+    one_click_variants,
+)
+
+DATASET_DIR = "sampling_dataset"
+FOLDER_PATTERN = (
+    r"lego_pos_encoding_(?P<pos_encoding>True|False)"
+    r"_view_dirs_(?P<view_dirs>True|False)"
+    r"_(?P<coarse_n_samples>\d+)_(?P<n_samples>\d+)"
 )
+# config every other one is measured against by PSNR and SSIM
+METRICS_REFERENCE = "lego_pos_encoding_True_view_dirs_True_64_128"
+# position of the checkboxes choosing number of samples, in design units
+CHECKBOXES_Y = 600
 
 
-def initialize_layouts():
-    checkboxes_x = settings.SCREEN_SIZE.right_third
-    checkboxes_y = 600
-    small_button_width = 70
+def initialize_layouts(layout: Layout):
+    checkboxes_x = layout.x(RIGHT_THIRD)
+    checkboxes_y = CHECKBOXES_Y
+    small_button_width = layout.size(70)
+    height = layout.size(50)
     coarse_n_samples = CheckBoxLayout(
         ["0", "64"],
         active_ids=[1],
         width=small_button_width,
-        distance=settings.HORIZONTAL_DISTANCE + 10,
+        height=height,
+        distance=layout.size(settings.HORIZONTAL_DISTANCE + 10),
         x=checkboxes_x,
-        y=checkboxes_y - 70,
+        y=layout.y(checkboxes_y - 70),
         orientation=Orientation.HORIZONTAL,
     )
     n_samples = CheckBoxLayout(
         ["16", "32", "64", "128"],
         active_ids=[3],
         width=small_button_width,
-        distance=settings.HORIZONTAL_DISTANCE + 10,
+        height=height,
+        distance=layout.size(settings.HORIZONTAL_DISTANCE + 10),
         x=checkboxes_x,
-        y=checkboxes_y,
+        y=layout.y(checkboxes_y),
         orientation=Orientation.HORIZONTAL,
     )
     ablation = CheckBoxLayout(
         ["Pos encoding", "View direction"],
         active_ids=[0, 1],
-        width=350,
-        distance=settings.VERTICAL_DISTANCE,
+        width=layout.size(350),
+        height=height,
+        distance=layout.size(settings.VERTICAL_DISTANCE),
         x=checkboxes_x,
-        y=400,
+        y=layout.y(400),
         orientation=Orientation.VERTICAL,
         multiple_choice=True,
     )
-    locks_x = int(ablation.x - ablation.width / 2 + 20)
+    locks_x = int(ablation.x - ablation.width / 2 + layout.size(20))
+    lock_size = layout.size(LOCK_SIZE)
     lock1 = Image(
         "lock.png",
         x=locks_x,
+        width=lock_size,
+        height=lock_size,
         border_size=0,
-        y=ablation.y - 3,
+        y=ablation.y - layout.size(3),
     )
     lock2 = Image(
         "lock.png",
         x=locks_x,
+        width=lock_size,
+        height=lock_size,
         border_size=0,
-        y=ablation.y + ablation.distance - 3,
+        y=ablation.y + ablation.distance - layout.size(3),
     )
     locks = [lock1, lock2]
-    media_buttons_y = int(
-        settings.SCREEN_SIZE.mid_y - 50 + 600 / 2 + settings.HORIZONTAL_DISTANCE
-    )
-    arrows = ButtonLayout(
-        ["<", ">"],
-        active_ids=[0, 1],
-        width=small_button_width,
-        distance=settings.HORIZONTAL_DISTANCE,
-        orientation=Orientation.HORIZONTAL,
-        x=int(settings.SCREEN_SIZE.x * 2 / 6),
-        y=media_buttons_y,
-    )
-    play_button = Button(
-        text="Play",
-        y=media_buttons_y,
-        x=settings.SCREEN_SIZE.left_third,
-        width=200,
-        active=True,
-    )
-    return coarse_n_samples, n_samples, ablation, locks, arrows, play_button
-
-
-# initialize lego
-(
-    coarse_samples_checkboxes,
-    samples_checkboxes,
-    ablation_checkboxes,
-    locks,
-    arrows_buttons,
-    play_button,
-) = initialize_layouts()
-folder_data = {
-    "dataset_dir": "sampling_dataset",
-    "pos_encoding": ablation_checkboxes["Pos encoding"].active,
-    "view_dirs": ablation_checkboxes["View direction"].active,
-    "n_samples": samples_checkboxes.get_active_checkboxes()[0].text,
-    "coarse_n_samples": coarse_samples_checkboxes.get_active_checkboxes()[0].text,
-}
-
-folders = load_all_folders("sampling_dataset")
-folder_name = construct_folder_name(folder_data)
-images = folders[folder_name]
-image_idx = 0
-max_idx = len(images) - 1
-play = False
-play_speed = 0.07
-
-
-def lego_run(project_checkboxes, screen):
-    global play
-    global image_idx
-    global images
-    run = True
-    active_samples_checkbox = samples_checkboxes.get_active_checkboxes()[0]
-    active_coarse_samples_checkbox = coarse_samples_checkboxes.get_active_checkboxes()[
-        0
-    ]
-    total_num_of_samples = int(active_coarse_samples_checkbox.text) + int(
-        active_samples_checkbox.text
-    )
-    while run:
-        update_folder = False
-        for event in pygame.event.get():
-            folder_name = None
-            index_direction = None
-
-            if (
-                samples_checkboxes.update(event)
-                or ablation_checkboxes.update(event)
-                or coarse_samples_checkboxes.update(event)
-            ):
-                update_folder = True
-            if project_checkboxes.update(event):
-                if project_checkboxes["Mednerf"].active:
-                    mednerf.mednerf_run(project_checkboxes, screen)
-
-            play, index_direction = handle_arrows(
-                arrows_buttons, play, play_button, event
-            )
+    return coarse_n_samples, n_samples, ablation, locks
 
-            play = handle_play_flag(play_button, play, event)
-
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    run = False
-                if event.key == pygame.K_LEFT:
-                    index_direction = Indexing.PREVIOUS
-                if event.key == pygame.K_RIGHT:
-                    index_direction = Indexing.NEXT
-            if event.type == pygame.QUIT:
-                run = False
-
-            if index_direction is not None:
-                image_idx = set_idx(image_idx, max_idx, index_direction)
-
-        if update_folder:
-            active_samples_checkbox = samples_checkboxes.get_active_checkboxes()[0]
-            active_coarse_samples_checkbox = (
-                coarse_samples_checkboxes.get_active_checkboxes()[0]
-            )
-            if (
-                active_samples_checkbox.text == "128"
-                and active_coarse_samples_checkbox.text == "64"
-            ):
-                ablation_checkboxes.unlock()
-            else:
-                ablation_checkboxes["Pos encoding"].active = True
-                ablation_checkboxes["View direction"].active = True
-                ablation_checkboxes.lock()
-
-            folder_data["coarse_n_samples"] = active_coarse_samples_checkbox.text
-            folder_data["n_samples"] = active_samples_checkbox.text
-            folder_data["pos_encoding"] = ablation_checkboxes["Pos encoding"].active
-            folder_data["view_dirs"] = ablation_checkboxes["View direction"].active
-            folder_name = construct_folder_name(folder_data)
-            images = folders[folder_name]
-            total_num_of_samples = int(active_coarse_samples_checkbox.text) + int(
-                active_samples_checkbox.text
-            )
 
-        screen.fill(settings.Color.BACKGROUND.value)
-        images[image_idx].draw(screen)
-        play_button.draw(screen)
-        arrows_buttons.display(screen)
+class SamplingScene(Scene):
+    """Lego rendered with different numbers of samples and ablations."""
+
+    title = "Sampling"
+
+    def __init__(
+        self, cache: Optional[SurfaceCache] = None, layout: Optional[Layout] = None
+    ) -> None:
+        """
+        Args:
+            cache: cache of decoded frames shared with other scenes.
+            layout: layout of the window, the current one by default.
+        """
+        layout = layout or Layout.for_screen()
+        self.create_layouts(layout)
+        active_coarse_samples_checkbox = (
+            self.coarse_samples_checkboxes.get_active_checkboxes()[0]
+        )
+        folder_data = {
+            "dataset_dir": DATASET_DIR,
+            "pos_encoding": self.ablation_checkboxes["Pos encoding"].active,
+            "view_dirs": self.ablation_checkboxes["View direction"].active,
+            "n_samples": self.samples_checkboxes.get_active_checkboxes()[0].text,
+            "coarse_n_samples": active_coarse_samples_checkbox.text,
+        }
+        index = DatasetIndex(DATASET_DIR, FOLDER_PATTERN)
+        super().__init__(
+            load_all_folders(DATASET_DIR, index=index, cache=cache, layout=layout),
+            folder_data,
+            layout,
+            media_buttons_y=FRAME_Y + FRAME_SIZE / 2 + settings.HORIZONTAL_DISTANCE,
+            # under the checkboxes of samples, left of their center
+            labels_position=(
+                RIGHT_THIRD - (settings.HORIZONTAL_DISTANCE + 10) / 2 - 50,
+                CHECKBOXES_Y + 150,
+            ),
+        )
+        self.update_total_samples()
 
-        draw_text(
+    def create_layouts(self, layout: Layout):
+        (
+            self.coarse_samples_checkboxes,
+            self.samples_checkboxes,
+            self.ablation_checkboxes,
+            self.locks,
+        ) = initialize_layouts(layout)
+        self.coarse_label = Text(
             "Coarse: ",
-            screen,
-            coarse_samples_checkboxes.x - 230,
-            coarse_samples_checkboxes.y,
+            self.coarse_samples_checkboxes.x - layout.size(230),
+            self.coarse_samples_checkboxes.y,
         )
-        draw_text(
+        self.fine_label = Text(
             "Fine: ",
-            screen,
-            coarse_samples_checkboxes.x - 230,
-            samples_checkboxes.y,
+            self.coarse_samples_checkboxes.x - layout.size(230),
+            self.samples_checkboxes.y,
+        )
+        self.total_samples_label = Text(
+            "",
+            self.coarse_samples_checkboxes.x - layout.size(50),
+            self.samples_checkboxes.y + layout.size(100),
+        )
+
+    def update_layouts(self, event: pygame.event.EventType) -> bool:
+        return (
+            self.samples_checkboxes.update(event)
+            or self.ablation_checkboxes.update(event)
+            or self.coarse_samples_checkboxes.update(event)
         )
-        draw_text(
-            f"Total number of samples: {total_num_of_samples}",
-            screen,
-            coarse_samples_checkboxes.x - 50,
-            samples_checkboxes.y + 100,
+
+    def read_layouts(self):
+        """Update folder_data with the chosen config.
+
+        Ablations were done only for some numbers of samples,
+        for the others they're locked and reset to True.
+        """
+        active_samples_checkbox = self.samples_checkboxes.get_active_checkboxes()[0]
+        active_coarse_samples_checkbox = (
+            self.coarse_samples_checkboxes.get_active_checkboxes()[0]
+        )
+        if self.has_ablations(
+            active_coarse_samples_checkbox.text, active_samples_checkbox.text
+        ):
+            self.ablation_checkboxes.unlock()
+        else:
+            self.ablation_checkboxes["Pos encoding"].active = True
+            self.ablation_checkboxes["View direction"].active = True
+            self.ablation_checkboxes.lock()
+
+        folder_data = self.folder_data
+        folder_data["coarse_n_samples"] = active_coarse_samples_checkbox.text
+        folder_data["n_samples"] = active_samples_checkbox.text
+        folder_data["pos_encoding"] = self.ablation_checkboxes["Pos encoding"].active
+        folder_data["view_dirs"] = self.ablation_checkboxes["View direction"].active
+        self.update_total_samples()
+
+    def show_params(self, params: dict[str, str]):
+        for layout, text in (
+            (self.coarse_samples_checkboxes, params["coarse_n_samples"]),
+            (self.samples_checkboxes, params["n_samples"]),
+        ):
+            layout.deactivate_all_checkboxes()
+            layout[text].active = True
+        self.ablation_checkboxes["Pos encoding"].active = (
+            params["pos_encoding"] == "True"
+        )
+        self.ablation_checkboxes["View direction"].active = (
+            params["view_dirs"] == "True"
+        )
+
+    def update_total_samples(self):
+        total_num_of_samples = int(self.folder_data["coarse_n_samples"]) + int(
+            self.folder_data["n_samples"]
+        )
+        self.total_samples_label.text = (
+            f"Total number of samples: {total_num_of_samples}"
+        )
+
+    def neighbour_folder_names(self) -> list[str]:
+        """Return names of folders reachable from the current one with a single click.
+
+        Choosing number of samples other than 64 + 128 locks the ablations,
+        which resets both of them to True.
+        """
+        options = {
+            "coarse_n_samples": list(self.coarse_samples_checkboxes.checkboxes),
+            "n_samples": list(self.samples_checkboxes.checkboxes),
+            "pos_encoding": [True, False],
+            "view_dirs": [True, False],
+        }
+        current = self.index.folder_name(self.folder_data)
+        names = []
+        for variant in one_click_variants(self.folder_data, options):
+            for data in (variant, {**variant, "pos_encoding": True, "view_dirs": True}):
+                info = self.index.lookup(data)
+                if info is not None:
+                    if info.name != current and info.name not in names:
+                        names.append(info.name)
+                    break
+        return names
+
+    def grid_folders(self) -> tuple[list[str], list[str]]:
+        """Return folders compared in grid view and their labels.
+
+        Without ablations every number of fine samples is displayed,
+        otherwise every ablation of the current numbers of samples.
+        """
+        folder_data = self.folder_data
+        if folder_data["pos_encoding"] and folder_data["view_dirs"]:
+            infos = self.index.find(
+                coarse_n_samples=folder_data["coarse_n_samples"],
+                pos_encoding=True,
+                view_dirs=True,
+            )
+            infos.sort(key=lambda info: int(info.params["n_samples"]))
+            labels = [f"Fine: {info.params['n_samples']}" for info in infos]
+        else:
+            infos = self.index.find(
+                coarse_n_samples=folder_data["coarse_n_samples"],
+                n_samples=folder_data["n_samples"],
+            )
+            labels = [
+                f"PE: {info.params['pos_encoding']} VD: {info.params['view_dirs']}"
+                for info in infos
+            ]
+        return [info.name for info in infos], labels
+
+    def describe_folder(self, folder_name: str) -> str:
+        params = self.index.folders[folder_name].params
+        return (
+            f"{params['coarse_n_samples']} + {params['n_samples']},"
+            f" PE: {params['pos_encoding']} VD: {params['view_dirs']}"
+        )
+
+    def metrics_references(self) -> dict[str, str]:
+        return {name: METRICS_REFERENCE for name in self.index.folders}
+
+    def has_ablations(self, coarse_n_samples: str, n_samples: str) -> bool:
+        """Check whether ablations were done for given numbers of samples."""
+        return (
+            len(self.index.find(coarse_n_samples=coarse_n_samples, n_samples=n_samples))
+            > 1
         )
 
-        coarse_samples_checkboxes.display(screen)
-        samples_checkboxes.display(screen)
-        project_checkboxes.display(screen)
-        ablation_checkboxes.display(screen)
-        if ablation_checkboxes.is_lock:
-            for lock in locks:
-                lock.draw(screen)
-        if play:
-            time.sleep(play_speed)
-            image_idx = set_idx(image_idx, max_idx, Indexing.NEXT)
-        pygame.display.update()
+    def get_layout_widgets(self) -> list:
+        widgets = [
+            self.coarse_label,
+            self.fine_label,
+            self.total_samples_label,
+            *self.coarse_samples_checkboxes.get_widgets(),
+            *self.samples_checkboxes.get_widgets(),
+            *self.ablation_checkboxes.get_widgets(),
+        ]
+        # display locks to inform user that these options are locked
+        if self.ablation_checkboxes.is_lock:
+            widgets += self.locks
+        return widgets
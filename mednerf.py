@@ -1,20 +1,26 @@
+from typing import Optional
+
 import settings
-import time
 import pygame
+from dataset_index import DatasetIndex
+from layout import FRAME_Y, LOCK_SIZE, RIGHT_THIRD, Layout
+from metrics import group_references
+from viewer import Scene
 from helpers import (
-    Button,
-    ButtonLayout,
     CheckBoxLayout,
     Image,
     Orientation,
-    Indexing,
+    SurfaceCache,
     load_all_folders_mednerf,
-    construct_folder_name_mednerf,
-    set_idx,
-    handle_arrows,
-    handle_play_flag,
+    one_click_variants,
 )
 
+DATASET_DIR = "mednerf_dataset"
+FOLDER_PATTERN = r"(?P<dataset_name>chest|knee)_(?P<model>\w+)"
+# models are measured by PSNR and SSIM against mednerf of the same dataset
+METRICS_REFERENCES = ["chest_mednerf", "knee_mednerf"]
+METRICS_GROUP = r"(chest|knee)_"
+
 model_dict = {
     "Mednerf": "mednerf",
     "HyperNeRFGAN": "nerfgan",
@@ -23,183 +29,183 @@ model_dict = {
 }
 
 
-def initialize_layouts_mednerf():
-    checkboxes_x = settings.SCREEN_SIZE.right_third
+def initialize_layouts_mednerf(layout: Layout):
+    checkboxes_x = layout.x(RIGHT_THIRD)
     checkboxes_y = 800
-    small_button_width = 70
+    height = layout.size(50)
     n_samples = CheckBoxLayout(
         ["Mednerf", "HyperNeRFGAN", "HNGAN -no VD", "HNGAN - no VD + aug"],
         active_ids=[0],
-        width=350,
-        distance=settings.HORIZONTAL_DISTANCE + 10,
+        width=layout.size(350),
+        height=height,
+        distance=layout.size(settings.HORIZONTAL_DISTANCE + 10),
         x=checkboxes_x,
-        y=checkboxes_y,
+        y=layout.y(checkboxes_y),
         orientation=Orientation.VERTICAL,
     )
     ablation = CheckBoxLayout(
         ["Chest", "Knee"],
         active_ids=[0],
-        width=350,
-        distance=settings.HORIZONTAL_DISTANCE + 10,
+        width=layout.size(350),
+        height=height,
+        distance=layout.size(settings.HORIZONTAL_DISTANCE + 10),
         x=checkboxes_x,
-        y=400,
+        y=layout.y(400),
         orientation=Orientation.VERTICAL,
         multiple_choice=False,
     )
-    locks_x = int(ablation.x - ablation.width / 2 + 20)
+    locks_x = int(ablation.x - ablation.width / 2 + layout.size(20))
+    lock_size = layout.size(LOCK_SIZE)
     lock1 = Image(
         "lock.png",
         x=locks_x,
+        width=lock_size,
+        height=lock_size,
         border_size=0,
-        y=ablation.y - 3,
+        y=ablation.y - layout.size(3),
     )
     lock2 = Image(
         "lock.png",
         x=locks_x,
+        width=lock_size,
+        height=lock_size,
         border_size=0,
-        y=ablation.y + ablation.distance - 3,
+        y=ablation.y + ablation.distance - layout.size(3),
     )
     locks = [lock1, lock2]
-    media_buttons_y = int(
-        settings.SCREEN_SIZE.mid_y - 50 + 800 / 2 + settings.HORIZONTAL_DISTANCE
-    )
-    arrows = ButtonLayout(
-        ["<", ">"],
-        active_ids=[0, 1],
-        width=small_button_width,
-        distance=settings.HORIZONTAL_DISTANCE,
-        orientation=Orientation.HORIZONTAL,
-        x=int(settings.SCREEN_SIZE.x * 2 / 6),
-        y=media_buttons_y,
-    )
-    play_button = Button(
-        text="Play",
-        y=media_buttons_y,
-        x=settings.SCREEN_SIZE.left_third,
-        width=200,
-        active=True,
-    )
-    return n_samples, ablation, locks, arrows, play_button
-
-
-samples_checkboxes, ablation_checkboxes, locks, arrows_buttons, play_button = (
-    initialize_layouts_mednerf()
-)
-folder_data = {
-    "dataset_dir": "mednerf_dataset",
-    "dataset_name": "chest" if ablation_checkboxes["Chest"].active else "knee",
-    "model": "mednerf",  ###samples_checkboxes.get_active_checkboxes()[0].text,
-    "aug": True,
-    "fmaps": True,
-}
-
-# load all images beforehand
-# to allow for smooth changes during "rendering"
-
-# warning: load_folder function calls load_images
-# which scales images by 1.5 with hardcoded value
-# also the position of the image is fixed
-# pygame also has function scale() that scales
-# to precise number (500, 500), instead of by the factor
-# maybe it can be used to match lego and mednerf sizes
-folders = load_all_folders_mednerf("mednerf_dataset")
-folder_name = construct_folder_name_mednerf(folder_data)
-images = folders[folder_name]
-image_idx = 0
-max_idx = len(images) - 1
-run = True
-play = False
-play_speed = 0.07
-
-
-def mednerf_run(project_checkboxes, screen):
-    global play
-    global images
-    global image_idx
-    run = True
-    while run:
-        update_folder = False
-        # for loop iterating over every event that pygame catches
-        # if user does not do any action (no mouse movement, no keyboard action) this is skipped
-        for event in pygame.event.get():
-            folder_name = None
-            index_direction = None
-
-            # .update() function in layouts returns True
-            # only if any of the checkbox or button was activated
-            # if that happened we know something changed, and can act on it later
-            if samples_checkboxes.update(event) or ablation_checkboxes.update(event):
-                update_folder = True
-
-            if project_checkboxes.update(event):
-                if project_checkboxes["Sampling"].active:
-                    return
-            # play and play_button is passed
-            # because clicking any of the arrow
-            # stops the animation
-            play, index_direction = handle_arrows(
-                arrows_buttons, play, play_button, event
-            )
-
-            play = handle_play_flag(play_button, play, event)
-
-            # here every keyboard event is catched
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    run = False
-                if event.key == pygame.K_LEFT:
-                    index_direction = Indexing.PREVIOUS
-                if event.key == pygame.K_RIGHT:
-                    index_direction = Indexing.NEXT
-            if event.type == pygame.QUIT:
-                run = False
-
-            if index_direction is not None:
-                image_idx = set_idx(image_idx, max_idx, index_direction)
-
-        # act upon change registered earlier
-        if update_folder:
-            ### CUSTOM LOCKING
-            # lock position encoding and viewing direction
-            # for any other number of samples than 128
-            # because it's the only n_samples that these ablations were done for
-            active_samples_checkbox = samples_checkboxes.get_active_checkboxes()[0]
-            # TODO LATER
-            # if active_samples_checkbox.text == "128":
-            #     ablation_checkboxes.unlock()
-            # else:
-            #     ablation_checkboxes["Pos encoding"].active = True
-            #     ablation_checkboxes["View direction"].active = True
-            #     ablation_checkboxes.lock()
-            ### END OF CUSTOM LOCKING
-
-            # update data that possibly changed
-            folder_data["model"] = model_dict.get(active_samples_checkbox.text)
-
-            # access individual checkboxes or buttons using bracket notation
-            # either the checkbox text or its index in the list
-            # can be used to retrieve it from the layout
-            # TODO LATER
-            folder_data["dataset_name"] = (
-                "chest" if ablation_checkboxes["Chest"].active else "knee"
-            )
-            # folder_data["dataset_name"] = ablation_checkboxes["View direction"].active
-            folder_name = construct_folder_name_mednerf(folder_data)
-            images = folders[folder_name]
-
-        screen.fill(settings.Color.BACKGROUND.value)
-        images[image_idx].draw(screen)
-        play_button.draw(screen)
-        arrows_buttons.display(screen)
-        samples_checkboxes.display(screen)
-        ablation_checkboxes.display(screen)
-        project_checkboxes.display(screen)
-
+    return n_samples, ablation, locks
+
+
+class MednerfScene(Scene):
+    """Chest and knee scans rendered by mednerf and HyperNeRFGAN variants."""
+
+    title = "Mednerf"
+
+    def __init__(
+        self, cache: Optional[SurfaceCache] = None, layout: Optional[Layout] = None
+    ) -> None:
+        """
+        Args:
+            cache: cache of decoded frames shared with other scenes.
+            layout: layout of the window, the current one by default.
+        """
+        layout = layout or Layout.for_screen()
+        self.create_layouts(layout)
+        folder_data = {
+            "dataset_dir": DATASET_DIR,
+            "dataset_name": (
+                "chest" if self.ablation_checkboxes["Chest"].active else "knee"
+            ),
+            "model": "mednerf",  ###samples_checkboxes.get_active_checkboxes()[0].text,
+            "aug": True,
+            "fmaps": True,
+        }
+        # frames are decoded lazily upon first access
+        # and kept in a cache bounded by settings.FRAME_CACHE_BUDGET,
+        # they're placed and scaled to the same size as lego by the layout
+        index = DatasetIndex(DATASET_DIR, FOLDER_PATTERN)
+        super().__init__(
+            load_all_folders_mednerf(
+                DATASET_DIR, index=index, cache=cache, layout=layout
+            ),
+            folder_data,
+            layout,
+            media_buttons_y=FRAME_Y + 800 / 2 + settings.HORIZONTAL_DISTANCE,
+            labels_position=(RIGHT_THIRD, 250),
+        )
+
+    def create_layouts(self, layout: Layout):
+        (
+            self.samples_checkboxes,
+            self.ablation_checkboxes,
+            self.locks,
+        ) = initialize_layouts_mednerf(layout)
+
+    def update_layouts(self, event: pygame.event.EventType) -> bool:
+        return self.samples_checkboxes.update(event) or self.ablation_checkboxes.update(
+            event
+        )
+
+    def read_layouts(self):
+        ### CUSTOM LOCKING
+        # lock position encoding and viewing direction
+        # for any other number of samples than 128
+        # because it's the only n_samples that these ablations were done for
+        active_samples_checkbox = self.samples_checkboxes.get_active_checkboxes()[0]
+        # TODO LATER
+        # if active_samples_checkbox.text == "128":
+        #     ablation_checkboxes.unlock()
+        # else:
+        #     ablation_checkboxes["Pos encoding"].active = True
+        #     ablation_checkboxes["View direction"].active = True
+        #     ablation_checkboxes.lock()
+        ### END OF CUSTOM LOCKING
+
+        # update data that possibly changed
+        self.folder_data["model"] = model_dict.get(active_samples_checkbox.text)
+
+        # access individual checkboxes or buttons using bracket notation
+        # either the checkbox text or its index in the list
+        # can be used to retrieve it from the layout
+        # TODO LATER
+        self.folder_data["dataset_name"] = (
+            "chest" if self.ablation_checkboxes["Chest"].active else "knee"
+        )
+        # folder_data["dataset_name"] = ablation_checkboxes["View direction"].active
+
+    def show_params(self, params: dict[str, str]):
+        labels = {model: label for label, model in model_dict.items()}
+        self.samples_checkboxes.deactivate_all_checkboxes()
+        self.samples_checkboxes[labels[params["model"]]].active = True
+        self.ablation_checkboxes.deactivate_all_checkboxes()
+        self.ablation_checkboxes[params["dataset_name"].capitalize()].active = True
+
+    def neighbour_folder_names(self) -> list[str]:
+        options = {
+            "model": list(model_dict.values()),
+            "dataset_name": ["chest", "knee"],
+        }
+        names = []
+        for variant in one_click_variants(self.folder_data, options):
+            info = self.index.lookup(variant)
+            if info is not None:
+                names.append(info.name)
+        return names
+
+    def grid_folders(self) -> tuple[list[str], list[str]]:
+        """Return every model of the current dataset, compared in grid view, and their labels."""
+        names = []
+        labels = []
+        for label, model in model_dict.items():
+            info = self.index.lookup({**self.folder_data, "model": model})
+            if info is not None:
+                names.append(info.name)
+                labels.append(label)
+        return names, labels
+
+    def describe_folder(self, folder_name: str) -> str:
+        params = self.index.folders[folder_name].params
+        labels = {model: label for label, model in model_dict.items()}
+        return (
+            f"{labels.get(params['model'], params['model'])}, {params['dataset_name']}"
+        )
+
+    def metrics_references(self) -> dict[str, str]:
+        return group_references(self.index, METRICS_REFERENCES, METRICS_GROUP)
+
+    def is_comparable(self, reference_name: str) -> bool:
+        """Switching the dataset turns the heatmap off, as scans are not comparable."""
+        return (
+            self.index.folders[reference_name].params["dataset_name"]
+            == self.folder_data["dataset_name"]
+        )
+
+    def get_layout_widgets(self) -> list:
+        widgets = [
+            *self.samples_checkboxes.get_widgets(),
+            *self.ablation_checkboxes.get_widgets(),
+        ]
         # display locks to inform user that these options are locked
-        if ablation_checkboxes.is_lock:
-            for lock in locks:
-                lock.draw(screen)
-        if play:
-            time.sleep(play_speed)
-            image_idx = set_idx(image_idx, max_idx, Indexing.NEXT)
-        pygame.display.update()
+        if self.ablation_checkboxes.is_lock:
+            widgets += self.locks
+        return widgets
@@ -0,0 +1,400 @@
+"""Image quality of every config of a dataset, measured against a reference config.
+
+PSNR and SSIM are computed per frame, on whole stacks of frames at once,
+one config per process. Results are stored next to frame packs and
+recomputed only when frames of the config or of its reference change.
+
+Usage:
+    python metrics.py sampling_dataset --reference lego_pos_encoding_True_view_dirs_True_64_128
+    python metrics.py mednerf_dataset --group "(chest|knee)_" \\
+        --reference chest_mednerf --reference knee_mednerf
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pygame
+
+import framepack
+import settings
+from dataset_index import DatasetIndex
+
+VERSION = 1
+# constants stabilizing SSIM division, as in the original paper
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+SSIM_WINDOW = 7
+# frames processed at once by SSIM, bounds memory of float64 intermediates
+SSIM_CHUNK = 8
+MAX_VALUE = 255
+# ITU-R BT.601 weights of RGB channels in luma
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+
+@dataclass
+class FolderMetrics:
+    """Per frame metrics of a config folder against its reference."""
+
+    name: str
+    reference: str
+    psnr: list[float]
+    ssim: list[float]
+
+    @property
+    def mean_psnr(self) -> float:
+        return float(np.mean(self.psnr))
+
+    @property
+    def mean_ssim(self) -> float:
+        return float(np.mean(self.ssim))
+
+    def summary(self) -> dict[str, float]:
+        """Aggregate per frame metrics."""
+        return {
+            "psnr_mean": self.mean_psnr,
+            "psnr_min": min(self.psnr),
+            "psnr_max": max(self.psnr),
+            "ssim_mean": self.mean_ssim,
+            "ssim_min": min(self.ssim),
+            "ssim_max": max(self.ssim),
+        }
+
+
+def load_frames(
+    frame_paths: list[str], size: Optional[tuple[int, int]] = None
+) -> np.ndarray:
+    """Decode frames into array of shape (n, height, width, 3).
+
+    Args:
+        frame_paths: paths of the frames.
+        size: (width, height) the frames are scaled to, if they differ.
+    """
+    frames = []
+    for frame_path in frame_paths:
+        surface = pygame.image.load(frame_path)
+        if size is not None and surface.get_size() != tuple(size):
+            if surface.get_bitsize() < 24:
+                # smoothscale needs true color, e.g. grayscale scans are paletted
+                true_color = pygame.Surface(surface.get_size(), depth=24)
+                true_color.blit(surface, (0, 0))
+                surface = true_color
+            surface = pygame.transform.smoothscale(surface, size)
+        width, height = surface.get_size()
+        pixels = np.frombuffer(pygame.image.tobytes(surface, "RGB"), dtype=np.uint8)
+        frames.append(pixels.reshape(height, width, 3))
+    return np.stack(frames)
+
+
+def align_frames(frame_paths: list[str], count: int) -> list[str]:
+    """Pick frames matching every one of count frames of the reference.
+
+    Sequences of different length are assumed to cover the same camera path,
+    so frames are matched by their relative position.
+    """
+    if len(frame_paths) == count:
+        return frame_paths
+    return [frame_paths[i * len(frame_paths) // count] for i in range(count)]
+
+
+def psnr(frames: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """Peak signal to noise ratio of every frame, inf for identical frames."""
+    difference = frames.astype(np.float32) - reference
+    mse = np.mean(np.square(difference), axis=(1, 2, 3))
+    with np.errstate(divide="ignore"):
+        return 10 * np.log10(MAX_VALUE**2 / mse)
+
+
+def box_filter(images: np.ndarray, size: int) -> np.ndarray:
+    """Mean of every size x size window of the images, without padding.
+
+    Computed from summed area tables, so the cost doesn't depend on size.
+    """
+    sums = np.zeros(
+        (images.shape[0], images.shape[1] + 1, images.shape[2] + 1), np.float64
+    )
+    np.cumsum(images, axis=1, out=sums[:, 1:, 1:])
+    np.cumsum(sums[:, 1:, 1:], axis=2, out=sums[:, 1:, 1:])
+    windows = (
+        sums[:, size:, size:]
+        - sums[:, :-size, size:]
+        - sums[:, size:, :-size]
+        + sums[:, :-size, :-size]
+    )
+    return windows / size**2
+
+
+def ssim(
+    frames: np.ndarray, reference: np.ndarray, window: int = SSIM_WINDOW
+) -> np.ndarray:
+    """Mean structural similarity of every frame, computed on luma.
+
+    Uses uniform window and sample covariance, same as scikit-image defaults.
+    """
+    c1 = (SSIM_K1 * MAX_VALUE) ** 2
+    c2 = (SSIM_K2 * MAX_VALUE) ** 2
+    covariance_norm = window**2 / (window**2 - 1)
+    scores = []
+    for start in range(0, len(frames), SSIM_CHUNK):
+        x = frames[start : start + SSIM_CHUNK] @ LUMA_WEIGHTS
+        y = reference[start : start + SSIM_CHUNK] @ LUMA_WEIGHTS
+        mean_x = box_filter(x, window)
+        mean_y = box_filter(y, window)
+        variance_x = covariance_norm * (box_filter(x * x, window) - mean_x**2)
+        variance_y = covariance_norm * (box_filter(y * y, window) - mean_y**2)
+        covariance = covariance_norm * (box_filter(x * y, window) - mean_x * mean_y)
+        similarity = ((2 * mean_x * mean_y + c1) * (2 * covariance + c2)) / (
+            (mean_x**2 + mean_y**2 + c1) * (variance_x + variance_y + c2)
+        )
+        scores.append(similarity.mean(axis=(1, 2)))
+    return np.concatenate(scores)
+
+
+def compare_folders(
+    frame_paths: list[str], reference_paths: list[str]
+) -> dict[str, list[float]]:
+    """Compute per frame metrics of a config, run in worker processes."""
+    reference = load_frames(reference_paths)
+    size = reference.shape[2], reference.shape[1]
+    frames = load_frames(align_frames(frame_paths, len(reference_paths)), size)
+    return {
+        "psnr": psnr(frames, reference).tolist(),
+        "ssim": ssim(frames, reference).tolist(),
+    }
+
+
+def metrics_path(cache_dir: str, reference: str) -> str:
+    """Return path of the file storing metrics against given reference."""
+    return os.path.join(cache_dir, "metrics", f"{reference}.json")
+
+
+def to_json(value):
+    """Replace floats JSON can't represent, e.g. PSNR of identical frames, with strings.
+
+    inf becomes "inf", the strings are parsed back by float.
+    """
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_json(item) for item in value]
+    return value
+
+
+def read_cache(path: str) -> dict:
+    """Read stored metrics, return empty cache if they're missing or corrupted."""
+    try:
+        with open(path) as file:
+            cache = json.load(file)
+        if cache.get("version") != VERSION:
+            return {}
+        for folder in cache.get("folders", {}).values():
+            folder["psnr"] = [float(value) for value in folder["psnr"]]
+            folder["ssim"] = [float(value) for value in folder["ssim"]]
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        return {}
+    return cache
+
+
+def write_cache(path: str, cache: dict):
+    """Write metrics atomically, so a crash never leaves a half written file behind."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(to_json(cache), file, allow_nan=False)
+    os.replace(tmp_path, path)
+
+
+def group_references(
+    index: DatasetIndex, references: list[str], group: Optional[str] = None
+) -> dict[str, str]:
+    """Assign reference to every config folder of the dataset.
+
+    Args:
+        index: index of the dataset.
+        references: names of reference folders.
+        group: regular expression, config is compared with the reference
+            matched to the same text. Without group, there has to be
+            a single reference.
+
+    Returns:
+        name of the reference of every folder that has one.
+    """
+    for reference in references:
+        if reference not in index:
+            raise KeyError(f"No folder {reference} in {index.dataset_dir}")
+    if group is None:
+        if len(references) != 1:
+            raise ValueError("Multiple references need a group to pick from them")
+        return {name: references[0] for name in index.folders}
+
+    pattern = re.compile(group)
+
+    def group_of(name: str) -> Optional[str]:
+        match = pattern.search(name)
+        return match.group(0) if match else None
+
+    by_group = {group_of(reference): reference for reference in references}
+    assigned = {}
+    for name in index.folders:
+        reference = by_group.get(group_of(name))
+        if reference is not None:
+            assigned[name] = reference
+    return assigned
+
+
+def compute_metrics(
+    index: DatasetIndex,
+    references: dict[str, str],
+    cache_dir: str,
+    workers: Optional[int] = None,
+    stored_only: bool = False,
+) -> dict[str, FolderMetrics]:
+    """Compute metrics of the folders, reusing stored ones that are up to date.
+
+    Args:
+        index: index of the dataset.
+        references: name of the reference of every folder to compute.
+        cache_dir: directory storing metrics between runs.
+        workers: number of processes, None uses every core.
+        stored_only: return only stored metrics, never compute missing ones.
+
+    Returns:
+        metrics of every folder, without missing ones if stored_only is set.
+        Folders storing videos are not measured.
+    """
+    caches = {}
+    manifests = {}
+    missing = []
+    results = {}
+    for name, reference in references.items():
+        if index.folders[name].video or index.folders[reference].video:
+            # streamed videos have no frames stored to compare
+            continue
+        if reference not in caches:
+            cache = read_cache(metrics_path(cache_dir, reference))
+            manifests[reference] = framepack.source_manifest(
+                index.folders[reference].frame_paths
+            )
+            if cache.get("reference_manifest") != manifests[reference]:
+                cache = {}
+            cache.setdefault("version", VERSION)
+            cache["reference_manifest"] = manifests[reference]
+            cache.setdefault("folders", {})
+            caches[reference] = cache
+        manifests[name] = framepack.source_manifest(index.folders[name].frame_paths)
+        stored = caches[reference]["folders"].get(name)
+        if stored is not None and stored["manifest"] == manifests[name]:
+            results[name] = FolderMetrics(
+                name, reference, stored["psnr"], stored["ssim"]
+            )
+        else:
+            missing.append(name)
+
+    if missing and not stored_only:
+        with ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context(settings.PROCESS_START_METHOD),
+        ) as executor:
+            computed = executor.map(
+                compare_folders,
+                [index.folders[name].frame_paths for name in missing],
+                [index.folders[references[name]].frame_paths for name in missing],
+            )
+            for name, values in zip(missing, computed):
+                reference = references[name]
+                caches[reference]["folders"][name] = {
+                    "manifest": manifests[name],
+                    **values,
+                }
+                results[name] = FolderMetrics(
+                    name, reference, values["psnr"], values["ssim"]
+                )
+        for reference in {references[name] for name in missing}:
+            write_cache(metrics_path(cache_dir, reference), caches[reference])
+    return results
+
+
+def format_metrics(metrics: FolderMetrics) -> str:
+    """Describe metrics of a folder in a single short line."""
+    if metrics.name == metrics.reference:
+        return "PSNR / SSIM: reference"
+    return f"PSNR: {metrics.mean_psnr:.2f} dB  SSIM: {metrics.mean_ssim:.4f}"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compute PSNR and SSIM of dataset configs against a reference."
+    )
+    parser.add_argument("dataset_dir", help="directory containing config folders")
+    parser.add_argument(
+        "--reference",
+        action="append",
+        required=True,
+        help="name of the reference folder, may be repeated together with --group",
+    )
+    parser.add_argument(
+        "--group",
+        help="regular expression, configs are compared with the reference "
+        "matching the same text, e.g. '(chest|knee)_'",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=settings.FRAME_PACK_DIR,
+        help=f"directory storing metrics (default: {settings.FRAME_PACK_DIR},"
+        " shared with the viewer)",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="number of processes (default: every core)"
+    )
+    parser.add_argument(
+        "--per-frame", action="store_true", help="print metrics of every frame"
+    )
+    parser.add_argument("--json", help="also write all metrics to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    index = DatasetIndex(args.dataset_dir)
+    references = group_references(index, args.reference, args.group)
+    results = compute_metrics(index, references, args.cache_dir, args.workers)
+
+    print(f"{'config':<50} {'reference':<50} {'PSNR':>8} {'SSIM':>8}")
+    for name in sorted(results):
+        metrics = results[name]
+        print(
+            f"{name:<50} {metrics.reference:<50}"
+            f" {metrics.mean_psnr:>8.2f} {metrics.mean_ssim:>8.4f}"
+        )
+        if args.per_frame:
+            for i, (frame_psnr, frame_ssim) in enumerate(
+                zip(metrics.psnr, metrics.ssim)
+            ):
+                print(f"{'':<4}{i:>4} {'':<93} {frame_psnr:>8.2f} {frame_ssim:>8.4f}")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(
+                to_json(
+                    {
+                        name: {
+                            "reference": metrics.reference,
+                            **metrics.summary(),
+                            "psnr": metrics.psnr,
+                            "ssim": metrics.ssim,
+                        }
+                        for name, metrics in results.items()
+                    }
+                ),
+                file,
+                indent=2,
+                allow_nan=False,
+            )
@@ -1,27 +1,153 @@
+import argparse
 import os
 
 import pygame
 
+import framestore
 import lego
+import mednerf
 import settings
-from helpers import CheckBoxLayout, Orientation
+from helpers import SurfaceCache
+from layout import Layout
+from profiling import profiler
+from telemetry import registry
+from viewer import Loader, Viewer
 
-os.environ["SDL_VIDEO_CENTERED"] = "1"
-pygame.init()
-screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
-pygame.display.set_caption("Nerf gui")
 
+def open_window(fullscreen: bool = False) -> pygame.SurfaceType:
+    """Open window and display empty background right away.
 
-project_checkboxes = CheckBoxLayout(
-    ["Sampling", "Mednerf"],
-    active_ids=[0],
-    width=350,
-    distance=settings.VERTICAL_DISTANCE,
-    x=settings.SCREEN_SIZE.right_third,
-    y=100,
-    orientation=Orientation.VERTICAL,
-)
+    Window covers the whole screen and can be resized, the viewer is laid out
+    anew for every size. Only the display and font modules are initialized,
+    the rest of pygame isn't used and takes a while to start.
+
+    Args:
+        fullscreen: whether to open fullscreen window instead.
+    """
+    os.environ["SDL_VIDEO_CENTERED"] = "1"
+    pygame.display.init()
+    pygame.font.init()
+    flags = pygame.FULLSCREEN if fullscreen else pygame.RESIZABLE
+    screen = pygame.display.set_mode((0, 0), flags)
+    pygame.display.set_caption("Nerf gui")
+    screen.fill(settings.Color.BACKGROUND.value)
+    pygame.display.flip()
+    return screen
+
+
+def create_viewer(screen: pygame.SurfaceType) -> Viewer:
+    """Create viewer of every project, sharing a single cache of decoded frames.
+
+    Everything is laid out for the size of the screen, fonts included.
+    """
+    cache = SurfaceCache(settings.FRAME_CACHE_BUDGET)
+    cache.watch("frames")
+    layout = Layout(*screen.get_size())
+    settings.set_font_scale(layout.scale)
+    scenes = [
+        lego.SamplingScene(cache, layout),
+        mednerf.MednerfScene(cache, layout),
+    ]
+    return Viewer(screen, scenes, layout)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Graphical user interface for NeRF based projects."
+    )
+    parser.add_argument(
+        "--config",
+        metavar="FOLDER",
+        help="config folder displayed first, e.g. knee_nerfgan, "
+        "its frames are loaded before any other",
+    )
+    parser.add_argument(
+        "--fullscreen",
+        action="store_true",
+        help="open fullscreen window instead of a resizable one",
+    )
+    parser.add_argument(
+        "--smooth",
+        action="store_true",
+        help="play frames interpolated in between the frames, S key toggles it anytime",
+    )
+    parser.add_argument(
+        "--frame-store",
+        action="store_true",
+        help="share decoded frames with other viewers through the frame store, "
+        "started with python3 framestore.py",
+    )
+    parser.add_argument(
+        "--preload",
+        action="store_true",
+        help="decode all frames in background using every core instead of on demand",
+    )
+    parser.add_argument(
+        "--no-pack-cache",
+        action="store_true",
+        help="don't store decoded frames on disk between runs",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.DECODE_WORKERS,
+        help="number of processes decoding frames (default: number of cores)",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="compute PSNR and SSIM of configs that don't have them stored yet, "
+        "in background",
+    )
+    parser.add_argument(
+        "--perf-log",
+        metavar="PATH",
+        help="write performance counters to this JSON file on exit",
+    )
+    parser.add_argument(
+        "--profile",
+        type=int,
+        metavar="FRAMES",
+        help="profile the given number of main loop iterations from the start, "
+        f"F4 starts and stops profiling anytime (results go to {settings.PROFILE_DIR})",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    lego.lego_run(project_checkboxes, screen)
+    args = parse_args()
+    if args.frame_store:
+        try:
+            framestore.client.connect()
+        except ConnectionError as error:
+            raise SystemExit(
+                f"Frame store is not running, start it with python3 framestore.py"
+                f" ({error})"
+            )
+    viewer = create_viewer(open_window(args.fullscreen))
+    viewer.set_smooth(args.smooth)
+    if args.config:
+        try:
+            viewer.select_folder(args.config)
+        except KeyError as error:
+            pygame.quit()
+            raise SystemExit(error.args[0])
+    # window is responsive right away, frames are packed
+    # and metrics read in background, the displayed config first
+    viewer.start_loading(
+        Loader(
+            viewer,
+            packs=not args.no_pack_cache,
+            preload=args.preload,
+            metrics=args.metrics,
+            workers=args.workers,
+        )
+    )
+    if args.profile:
+        profiler.start(args.profile)
+    try:
+        viewer.run()
+    finally:
+        profiler.stop()
+        if args.perf_log:
+            registry.dump(args.perf_log)
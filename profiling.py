@@ -0,0 +1,125 @@
+"""Capture cProfile and tracemalloc data of a chosen number of main loop iterations.
+
+Capture is started from the command line or with a hotkey and stopped
+after the given number of iterations. Only the main thread is profiled,
+frames decoded by prefetching threads show up in the allocations only.
+"""
+
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from typing import Optional
+
+import settings
+from telemetry import phases
+
+# number of allocation sites listed in the report
+TOP_ALLOCATIONS = 30
+
+
+class Profiler:
+    """Profile the main loop for a limited number of iterations and write results to disk.
+
+    Every capture writes, under a common name timestamped to the millisecond:
+        .prof: cProfile statistics, readable with pstats or snakeviz
+        -alloc.txt: allocation sites that grew the most during the capture
+        .tracemalloc: allocation snapshot at the end, readable with tracemalloc
+        -phases.json: time spent in every phase of the loop iterations
+    """
+
+    def __init__(
+        self,
+        output_dir: str = settings.PROFILE_DIR,
+        frames: int = settings.PROFILE_FRAMES,
+        memory: bool = True,
+    ) -> None:
+        """
+        Args:
+            output_dir: directory the results are written to.
+            frames: default number of loop iterations captured.
+            memory: whether to trace allocations as well, which slows
+                the program down considerably more than profiling alone.
+        """
+        self.output_dir = output_dir
+        self.frames = frames
+        self.memory = memory
+        self.remaining = 0
+        self.profile: Optional[cProfile.Profile] = None
+        self.start_snapshot: Optional[tracemalloc.Snapshot] = None
+        self.traced = False
+        # common path prefix of the last written capture, shown by the overlay
+        self.last_prefix: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.profile is not None
+
+    def start(self, frames: Optional[int] = None):
+        """Start capturing, stopping after given number of loop iterations."""
+        if self.active:
+            return
+        self.remaining = frames or self.frames
+        if self.memory:
+            self.traced = not tracemalloc.is_tracing()
+            if self.traced:
+                tracemalloc.start()
+            self.start_snapshot = tracemalloc.take_snapshot()
+        phases.enable()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def frame(self):
+        """Count finished loop iteration, stop capturing after the last one."""
+        if self.profile is None:
+            return
+        self.remaining -= 1
+        if self.remaining <= 0:
+            self.stop()
+
+    def stop(self) -> Optional[str]:
+        """Stop capturing and write results, return their common path prefix."""
+        if self.profile is None:
+            return None
+        self.profile.disable()
+        phases.disable()
+        os.makedirs(self.output_dir, exist_ok=True)
+        now = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        base = os.path.join(self.output_dir, f"{stamp}-{int(now * 1000) % 1000:03d}")
+        # captures stopped within the same millisecond are numbered
+        prefix = base
+        number = 1
+        while os.path.exists(f"{prefix}.prof"):
+            number += 1
+            prefix = f"{base}-{number}"
+        self.profile.dump_stats(f"{prefix}.prof")
+        self.profile = None
+
+        if self.start_snapshot is not None:
+            snapshot = tracemalloc.take_snapshot()
+            if self.traced:
+                tracemalloc.stop()
+            snapshot.dump(f"{prefix}.tracemalloc")
+            growth = snapshot.compare_to(self.start_snapshot, "lineno")
+            with open(f"{prefix}-alloc.txt", "w") as file:
+                file.write(f"Top {TOP_ALLOCATIONS} allocation sites by growth\n")
+                for stat in growth[:TOP_ALLOCATIONS]:
+                    file.write(f"{stat}\n")
+            self.start_snapshot = None
+
+        with open(f"{prefix}-phases.json", "w") as file:
+            json.dump(phases.summary(), file, indent=2)
+        self.last_prefix = prefix
+        return prefix
+
+    def toggle(self):
+        """Start capturing with the default number of iterations, or stop early."""
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+
+profiler = Profiler()
@@ -2,8 +2,6 @@ from dataclasses import dataclass
 import pygame
 from enum import Enum
 
-pygame.init()
-
 
 @dataclass
 class ScreenSize:
@@ -31,16 +29,104 @@ class ScreenSize:
         return int(self.x * 5 / 6)
 
 
-infoObject = pygame.display.Info()
-SCREEN_SIZE = ScreenSize(infoObject.current_w, infoObject.current_h)
-
 HORIZONTAL_DISTANCE = 80
 VERTICAL_DISTANCE = 65
 SLEEP_DURATION = 0.1
+# how often the main loop runs while it waits for something, e.g. frame decoding
+TARGET_FPS = 60
+# speed multipliers of playback, chosen with [ and ] keys
+PLAYBACK_SPEEDS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0)
+# number of rendered texts kept for reuse
+TEXT_CACHE_SIZE = 256
+# memory budget of frames decoded for the grid view, in bytes
+GRID_CACHE_BUDGET = 256 * 1024 * 1024
+# memory budget of computed difference heatmaps, in bytes
+HEATMAP_CACHE_BUDGET = 128 * 1024 * 1024
+# multiplier of pixel differences shown in heatmaps, small ones are invisible otherwise
+HEATMAP_GAIN = 4
+# how often the performance overlay refreshes its content, in seconds
+PERF_OVERLAY_REFRESH = 0.25
+# directory storing captured profiles
+PROFILE_DIR = "profiles"
+# number of main loop iterations captured by a single profile
+PROFILE_FRAMES = 300
+# memory budget of decoded dataset frames, in bytes
+FRAME_CACHE_BUDGET = 512 * 1024 * 1024
+# number of threads decoding frames in background
+PREFETCH_WORKERS = 2
+# number of frames decoded ahead of and behind the displayed one
+PREFETCH_RADIUS = 5
+# number of processes decoding frames upfront, None uses every core
+DECODE_WORKERS = None
+# directory storing decoded frames between runs
+FRAME_PACK_DIR = ".frame_cache"
+# how worker processes are started, forking is unsafe while the viewer runs threads
+PROCESS_START_METHOD = "spawn"
+# ffmpeg executable decoding frames of videos
+FFMPEG = "ffmpeg"
+# memory budget of frames decoded ahead when streaming a video, per stream, in bytes
+VIDEO_BUFFER_BUDGET = 64 * 1024 * 1024
+# seconds a stream waits for its frames to be displayed before stopping ffmpeg
+VIDEO_IDLE_TIMEOUT = 5.0
+# window size the layout of the viewer is designed for, it's scaled to any other one
+DESIGN_SIZE = (1920, 1080)
+# number of levels of packed frames, every next one half the size of the previous
+FRAME_PYRAMID_LEVELS = 3
+# zoom factors of the displayed frame, chosen with the mouse wheel
+ZOOM_LEVELS = (1, 2, 4, 8, 16)
+# approximate size of the tiles the magnified frame is split into, in pixels
+ZOOM_TILE_SIZE = 256
+# memory budget of rasterized tiles of magnified frames, in bytes
+ZOOM_CACHE_BUDGET = 64 * 1024 * 1024
+# memory budget of frames synthesized in between the frames during smooth playback
+INTERPOLATION_CACHE_BUDGET = 128 * 1024 * 1024
+# number of frames ahead of the displayed one whose in-betweens are computed
+INTERPOLATION_AHEAD = 8
+# address of the service sharing decoded frames among viewers, see framestore
+FRAME_STORE_ADDRESS = ("127.0.0.1", 47211)
+# key viewers authenticate to the frame store with
+FRAME_STORE_AUTHKEY = b"nerf_gui"
+
+# (name, size) of fonts, looked up on first use as the lookup is slow
+FONTS = {
+    "main_font": ("rasa", 80),
+    "main_font_small": ("rasa", 50),
+    "equation_font_small": ("rasa", 70),
+    "label_font": ("rasa", 30),
+    "hud_font": ("monospace", 18),
+}
+# fonts are scaled along with the layout, see set_font_scale
+font_scale = 1.0
+
+
+def __getattr__(name: str):
+    """Create SCREEN_SIZE and fonts on first access instead of on import.
+
+    Both need pygame initialized, so importing settings has no side effects,
+    and the window can be opened before the fonts are looked up.
+    """
+    if name == "SCREEN_SIZE":
+        pygame.display.init()
+        info = pygame.display.Info()
+        value = ScreenSize(info.current_w, info.current_h)
+    elif name in FONTS:
+        pygame.font.init()
+        font_name, size = FONTS[name]
+        value = pygame.font.SysFont(font_name, max(round(size * font_scale), 1))
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
 
-main_font = pygame.font.SysFont("rasa", 80)
-main_font_small = pygame.font.SysFont("rasa", 50)
-equation_font_small = pygame.font.SysFont("rasa", 70)
+def set_font_scale(scale: float):
+    """Scale every font, fonts created so far are created anew on next access."""
+    global font_scale
+    if scale == font_scale:
+        return
+    font_scale = scale
+    for name in FONTS:
+        globals().pop(name, None)
 
 
 class Color(Enum):
@@ -0,0 +1,175 @@
+"""In-process registry of performance counters.
+
+Widgets, loaders and main loops report into the shared registry,
+which is displayed by the performance overlay and can be dumped to a file.
+Reporting is cheap enough to stay enabled all the time, values that are
+expensive or already tracked elsewhere are watched and read only when needed.
+"""
+
+import json
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Callable, Optional
+
+# number of most recent values kept of every timing
+HISTORY = 240
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    """Describe values by their mean and nearest rank percentiles."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "max": ordered[-1],
+    }
+
+
+class Registry:
+    """Named counters, timings, marks and watched gauges, safe to use from any thread."""
+
+    def __init__(self, history: int = HISTORY) -> None:
+        """
+        Args:
+            history: number of most recent values kept of every timing and mark.
+        """
+        self.history = history
+        self.lock = threading.Lock()
+        self.counters: defaultdict[str, int] = defaultdict(int)
+        self.timings: dict[str, deque] = {}
+        self.totals: defaultdict[str, int] = defaultdict(int)
+        self.marks: dict[str, deque] = {}
+        self.gauges: dict[str, Callable[[], Optional[float]]] = {}
+
+    def count(self, name: str, amount: int = 1):
+        """Increase counter by given amount."""
+        with self.lock:
+            self.counters[name] += amount
+
+    def observe(self, name: str, value: float):
+        """Record a single measurement, e.g. duration in ms."""
+        with self.lock:
+            values = self.timings.get(name)
+            if values is None:
+                values = self.timings[name] = deque(maxlen=self.history)
+            values.append(value)
+            self.totals[name] += 1
+
+    def mark(self, name: str):
+        """Record that something happened now, e.g. a frame was displayed."""
+        with self.lock:
+            times = self.marks.get(name)
+            if times is None:
+                times = self.marks[name] = deque(maxlen=self.history)
+            times.append(time.monotonic())
+
+    def watch(self, name: str, getter: Callable[[], Optional[float]]):
+        """Register gauge read only when its value is needed, replacing any with that name."""
+        with self.lock:
+            self.gauges[name] = getter
+
+    def values(self, name: str) -> list[float]:
+        """Return most recent measurements, oldest first."""
+        with self.lock:
+            return list(self.timings.get(name, ()))
+
+    def rate(self, name: str, window: float = 1.0) -> float:
+        """Return how many times per second the mark was recorded during the last window."""
+        since = time.monotonic() - window
+        with self.lock:
+            times = self.marks.get(name, ())
+            return sum(1 for t in times if t >= since) / window
+
+    def gauge(self, name: str) -> Optional[float]:
+        """Read current value of the watched gauge, None if it's unknown."""
+        with self.lock:
+            getter = self.gauges.get(name)
+        return getter() if getter is not None else None
+
+    def watched(self, prefix: str = "") -> list[str]:
+        """Return sorted names of the gauges starting with prefix."""
+        with self.lock:
+            return sorted(name for name in self.gauges if name.startswith(prefix))
+
+    def snapshot(self) -> dict:
+        """Return current state of every counter, timing and gauge."""
+        with self.lock:
+            counters = dict(self.counters)
+            timings = {name: list(values) for name, values in self.timings.items()}
+            totals = dict(self.totals)
+            gauges = dict(self.gauges)
+            marks = {name: len(times) for name, times in self.marks.items()}
+        return {
+            "counters": counters,
+            "timings": {
+                name: {**summarize(values), "total": totals[name]}
+                for name, values in timings.items()
+            },
+            "rates": {name: self.rate(name) for name in marks},
+            "gauges": {name: getter() for name, getter in gauges.items()},
+        }
+
+    def dump(self, path: str):
+        """Write snapshot of the registry to a JSON file."""
+        with open(path, "w") as file:
+            json.dump(
+                {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), **self.snapshot()},
+                file,
+                indent=2,
+            )
+
+
+class PhaseTimer:
+    """Split every iteration of the main loop into named phases and time them.
+
+    Timing is done only while enabled, e.g. during profiling. Otherwise every
+    call returns right after checking the flag, so the timers can stay
+    in the loops for good.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.last = 0.0
+        self.durations: defaultdict[str, list[float]] = defaultdict(list)
+
+    def enable(self):
+        """Start timing, dropping durations of the previous run."""
+        self.durations = defaultdict(list)
+        self.enabled = True
+        self.last = time.perf_counter()
+
+    def disable(self):
+        self.enabled = False
+
+    def begin(self):
+        """Start timing the first phase of the iteration."""
+        if not self.enabled:
+            return
+        self.last = time.perf_counter()
+
+    def lap(self, name: str):
+        """End the phase with given name, the next one starts right away."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.durations[name].append((now - self.last) * 1000)
+        self.last = now
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Describe durations of every phase, in ms."""
+        return {name: summarize(values) for name, values in self.durations.items()}
+
+
+registry = Registry()
+phases = PhaseTimer()
@@ -1,23 +1,370 @@
-import subprocess
+"""Extract frames of videos into config folders the viewer can display.
+
+Every video is extracted by its own ffmpeg process, several at once.
+Frames of video.mp4 are written to <output>/video/video_200000/, numbered
+from 1. The pack format packs them into .frame_cache/video.pack as well,
+the same way the viewer does on first display, so it maps them right away.
+Videos extracted before with the same options are skipped, unless they
+changed since.
+"""
+
+import argparse
+import hashlib
+import json
 import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+
+import framepack
+import settings
+import videostream
+from dataset_index import FRAMES_DIR, read_image_header
+from helpers import FRAME_BUFFER_FORMAT, decode_frames
+
+# pack extracts JPEGs and packs them for the viewer, see extract_pack
+FORMATS = ("jpg", "png", "pack")
+# quality scale of JPEGs, from 2 (best) to 31
+JPEG_QUALITY = 2
+
+
+def find_videos(paths: list[str]) -> list[str]:
+    """Return videos given directly or found in given directories, sorted."""
+    videos = set()
+    for path in paths:
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                videos.update(
+                    entry.path
+                    for entry in entries
+                    if entry.is_file()
+                    and entry.name.lower().endswith(videostream.VIDEO_EXTENSIONS)
+                )
+        else:
+            videos.add(path)
+    return sorted(videos)
+
+
+def file_hash(path: str) -> str:
+    """Return SHA-256 of the file contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def output_path(video_path: str, output_dir: str) -> str:
+    """Return the frames directory the video is extracted into."""
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(output_dir, name, FRAMES_DIR)
+
+
+def frame_paths(path: str) -> list[str]:
+    """Return extracted frames in order, listed the same way the viewer lists them."""
+    with os.scandir(path) as entries:
+        return sorted(entry.path for entry in entries if entry.is_file())
+
+
+def pack_path(path: str) -> str:
+    """Return the pack the viewer maps for frames extracted into path."""
+    folder_name = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return framepack.pack_path(settings.FRAME_PACK_DIR, folder_name)
+
+
+def has_valid_pack(path: str) -> bool:
+    """Check whether the pack is up to date with the frames, the way the viewer does."""
+    paths = frame_paths(path)
+    if not paths:
+        return False
+    _, width, height = read_image_header(paths[0])
+    return framepack.is_valid(
+        pack_path(path),
+        paths,
+        (width, height),
+        FRAME_BUFFER_FORMAT,
+        settings.FRAME_PYRAMID_LEVELS,
+    )
+
+
+def stamp_path(path: str) -> str:
+    """Return path of the file describing what the output was extracted from."""
+    return f"{path}.json"
+
+
+def is_up_to_date(video_path: str, path: str, options: dict) -> bool:
+    """Check whether the output was extracted from this video with the same options.
+
+    Video is compared by its modification time and size first. If only
+    the time differs, its contents are hashed, so touched videos are not
+    extracted again. Stamp of such video is updated to the new time.
+    """
+    try:
+        with open(stamp_path(path)) as file:
+            stamp = json.load(file)
+    except (OSError, ValueError):
+        return False
+    stat = os.stat(video_path)
+    if stamp.get("options") != options or not os.path.exists(path):
+        return False
+    if stamp["size"] != stat.st_size:
+        return False
+    if stamp["mtime_ns"] != stat.st_mtime_ns:
+        if stamp["sha256"] != file_hash(video_path):
+            return False
+        write_stamp(video_path, path, options, stamp["frames"], stamp["sha256"])
+    return True
 
-def video_to_jpegs(video_path, output_folder):
-    # Ensure the output folder exists
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
 
-    # Use ffmpeg to convert the video to a series of JPEGs
-    command = [
-        'ffmpeg',
-        '-i', video_path,          # Input file
-        '-qscale:v', '2',          # Quality scale for JPEGs (lower is better quality)
-        os.path.join(output_folder, '%03d.jpg')  # Output pattern
-    ]
+def write_stamp(
+    video_path: str,
+    path: str,
+    options: dict,
+    frames: int,
+    sha256: Optional[str] = None,
+):
+    """Describe the video the output was extracted from, once the output is complete."""
+    stat = os.stat(video_path)
+    stamp = {
+        "video": os.path.basename(video_path),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": sha256 or file_hash(video_path),
+        "options": options,
+        "frames": frames,
+    }
+    with open(stamp_path(path), "w") as file:
+        json.dump(stamp, file, indent=2)
+
+
+def extract_images(
+    video_path: str,
+    path: str,
+    size: Optional[tuple[int, int]],
+    output_format: str,
+    ffmpeg: str,
+    replace: bool = True,
+) -> int:
+    """Write every frame of the video as an image, return number of frames.
+
+    Frames are written to a temporary directory first, removed if ffmpeg
+    fails, so a failed extraction never leaves partial frames behind.
+
+    Args:
+        replace: whether the frames replace the whole output directory at once,
+            so frames of a previous extraction never stay behind. Otherwise
+            they're moved into it, keeping every other file.
+    """
+    index = videostream.read_index(video_path)
+    # numbers are padded to the same length, so frames sort by name
+    digits = max(len(str(index.frame_count)), 3)
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    command = [ffmpeg, "-nostdin", "-v", "error", "-i", video_path, "-map", "0:v:0"]
+    if size is not None:
+        command += ["-vf", f"scale={size[0]}:{size[1]}"]
+    if output_format == "jpg":
+        command += ["-qscale:v", str(JPEG_QUALITY)]
+    command.append(os.path.join(tmp_path, f"%0{digits}d.{output_format}"))
+    try:
+        subprocess.run(command, stdin=subprocess.DEVNULL, check=True)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    names = os.listdir(tmp_path)
+    if replace:
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+    else:
+        os.makedirs(path, exist_ok=True)
+        for name in names:
+            os.replace(os.path.join(tmp_path, name), os.path.join(path, name))
+        os.rmdir(tmp_path)
+    return len(names)
+
+
+def extract_pack(
+    video_path: str, path: str, size: Optional[tuple[int, int]], ffmpeg: str
+) -> int:
+    """Extract frames as JPEGs and pack them for the viewer, return number of frames.
+
+    Pack is built from the extracted frames the same way the viewer packs
+    them, named after the config folder and described by their manifest,
+    so the viewer maps it instead of packing the frames itself.
+    """
+    frames = extract_images(video_path, path, size, "jpg", ffmpeg)
+    paths = frame_paths(path)
+    if size is None:
+        _, width, height = read_image_header(paths[0])
+        size = (width, height)
+    os.makedirs(settings.FRAME_PACK_DIR, exist_ok=True)
+    # a single process per video, videos themselves are extracted in parallel
+    buffers = decode_frames(
+        paths, [size] * len(paths), workers=1, levels=settings.FRAME_PYRAMID_LEVELS
+    )
+    framepack.write_pack(
+        pack_path(path),
+        paths,
+        size,
+        FRAME_BUFFER_FORMAT,
+        buffers,
+        levels=settings.FRAME_PYRAMID_LEVELS,
+    )
+    return frames
+
+
+def extract(
+    video_path: str,
+    output_dir: str,
+    size: Optional[tuple[int, int]] = None,
+    output_format: str = "jpg",
+    force: bool = False,
+    ffmpeg: str = settings.FFMPEG,
+) -> Optional[int]:
+    """Extract frames of the video unless they're up to date.
+
+    Args:
+        video_path: path of the MP4 video.
+        output_dir: directory the config folders are written to.
+        size: size the frames are scaled to, size of the video if None.
+        output_format: one of FORMATS.
+        force: extract even if the output is up to date.
+        ffmpeg: ffmpeg executable.
+
+    Returns:
+        number of extracted frames, None if the video was skipped.
+    """
+    path = output_path(video_path, output_dir)
+    options = {"size": list(size) if size else None, "format": output_format}
+    if (
+        not force
+        and is_up_to_date(video_path, path, options)
+        and (output_format != "pack" or has_valid_pack(path))
+    ):
+        return None
+    if output_format == "pack":
+        frames = extract_pack(video_path, path, size, ffmpeg)
+    else:
+        frames = extract_images(video_path, path, size, output_format, ffmpeg)
+    write_stamp(video_path, path, options, frames)
+    return frames
+
+
+def video_to_jpegs(video_path: str, output_folder: str) -> int:
+    """Extract every frame of the video as JPEG into output_folder, numbered from 1.
+
+    Other files in the folder are kept, only frames of the same numbers
+    are overwritten. The video is extracted every time, no stamp is written.
+
+    Returns:
+        number of extracted frames.
+    """
+    return extract_images(
+        video_path, output_folder, None, "jpg", settings.FFMPEG, replace=False
+    )
+
+
+def timed_extract(*args) -> tuple[Optional[int], float]:
+    """Run extract, return its result and how long it took in seconds."""
+    start = time.perf_counter()
+    frames = extract(*args)
+    return frames, time.perf_counter() - start
+
+
+def parse_size(text: str) -> tuple[int, int]:
+    try:
+        width, height = (int(value) for value in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"size has to be WIDTHxHEIGHT, not {text}")
+    return width, height
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Extract frames of videos into config folders, several at once."
+    )
+    parser.add_argument(
+        "videos",
+        nargs="*",
+        default=["videos"],
+        help="videos or directories containing them (default: videos)",
+    )
+    parser.add_argument(
+        "--output", default="frames", help="directory the frames are written to"
+    )
+    parser.add_argument(
+        "--size",
+        type=parse_size,
+        help="scale frames to WIDTHxHEIGHT, e.g. 600x600 displayed by the viewer",
+    )
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="jpg",
+        help="image format of the frames, pack writes JPEGs packed for the viewer"
+        " (default: jpg)",
+    )
+    parser.add_argument(
+        "--jobs", type=int, help="number of videos extracted at once (default: cores)"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="extract even up to date videos"
+    )
+    return parser.parse_args()
 
-    subprocess.run(command, check=True)
 
 if __name__ == "__main__":
-    video_path = 'videos/fakes_nocrop.mp4'  # Replace with your video file path
-    output_folder = 'mednerf_dataset/chest_nerfgan_aug_gen'  # Replace with your desired output folder
+    args = parse_args()
+    video_paths = find_videos(args.videos)
+    if not video_paths:
+        sys.exit(f"No videos found in {' '.join(args.videos)}")
+
+    start = time.perf_counter()
+    total_frames = 0
+    failed = False
+    with ThreadPoolExecutor(args.jobs or os.cpu_count() or 1) as executor:
+        jobs = {
+            executor.submit(
+                timed_extract,
+                video_path,
+                args.output,
+                args.size,
+                args.format,
+                args.force,
+            ): video_path
+            for video_path in video_paths
+        }
+        for job in as_completed(jobs):
+            video_path = jobs[job]
+            try:
+                frames, elapsed = job.result()
+            except (
+                OSError,
+                ValueError,
+                KeyError,
+                struct.error,
+                subprocess.CalledProcessError,
+            ) as error:
+                print(f"{video_path}: failed, {error}")
+                failed = True
+                continue
+            if frames is None:
+                print(f"{video_path}: up to date")
+                continue
+            print(
+                f"{video_path}: {frames} frames in {elapsed:.2f} s,"
+                f" {frames / elapsed:.1f} fps"
+            )
+            total_frames += frames
 
-    video_to_jpegs(video_path, output_folder)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{total_frames} frames of {len(video_paths)} videos in {elapsed:.2f} s,"
+        f" {total_frames / elapsed:.1f} fps"
+    )
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,403 @@
+"""Frames of MP4 videos decoded by ffmpeg and streamed over a pipe.
+
+Index of a video is read from the sample tables of the MP4 container only,
+without decoding anything: presentation time of every frame and which frames
+are keyframes, the ones decoding can start from.
+
+Stream spawns ffmpeg emitting raw frames already scaled to the display size,
+a reader thread keeps a bounded ring buffer filled with the frames following
+the requested one. Requesting a frame far from the buffered ones restarts
+ffmpeg at the last keyframe before it.
+"""
+
+import bisect
+import struct
+import subprocess
+import threading
+import warnings
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Callable, Iterator, Optional
+
+from telemetry import registry
+
+VIDEO_EXTENSIONS = (".mp4", ".m4v", ".mov")
+BOX_HEADER = struct.Struct(">I4s")
+# boxes on the path from the movie to the sample tables of its tracks
+CONTAINER_BOXES = {b"moov", b"trak", b"edts", b"mdia", b"minf", b"stbl"}
+MICROSECONDS = 1_000_000
+
+
+@dataclass
+class VideoIndex:
+    """Frames of a video in presentation order, described without decoding any."""
+
+    width: int
+    height: int
+    # presentation time of every frame, in microseconds from the first one
+    timestamps: list[int]
+    # indices of frames decoding can start from, ascending
+    keyframes: list[int]
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.timestamps)
+
+    def keyframe_before(self, idx: int) -> int:
+        """Return index of the last keyframe at or before the frame."""
+        position = bisect.bisect_right(self.keyframes, idx)
+        return self.keyframes[position - 1] if position else 0
+
+
+def iter_boxes(data: bytes, start: int, end: int) -> Iterator[tuple[bytes, int, int]]:
+    """Yield type, payload start and payload end of every box in data[start:end]."""
+    while start + BOX_HEADER.size <= end:
+        size, box_type = BOX_HEADER.unpack_from(data, start)
+        header_size = BOX_HEADER.size
+        if size == 1:
+            size = struct.unpack_from(">Q", data, start + header_size)[0]
+            header_size += 8
+        elif size == 0:
+            size = end - start
+        if size < header_size or start + size > end:
+            raise ValueError(f"corrupted {box_type!r} box")
+        yield box_type, start + header_size, start + size
+        start += size
+
+
+def read_movie_box(file: BinaryIO) -> bytes:
+    """Read payload of the moov box, skipping media data however large it is."""
+    while True:
+        header = file.read(BOX_HEADER.size)
+        if len(header) < BOX_HEADER.size:
+            raise ValueError("no moov box, not an MP4 video")
+        size, box_type = BOX_HEADER.unpack(header)
+        header_size = BOX_HEADER.size
+        if size == 1:
+            size = struct.unpack(">Q", file.read(8))[0]
+            header_size += 8
+        if box_type == b"moov":
+            return file.read(size - header_size) if size else file.read()
+        if size == 0:
+            raise ValueError("no moov box, not an MP4 video")
+        file.seek(size - header_size, 1)
+
+
+def find_boxes(data: bytes, start: int, end: int) -> dict[bytes, tuple[int, int]]:
+    """Find leaf boxes of a track, by type, descending into the container boxes."""
+    found = {}
+    for box_type, payload_start, payload_end in iter_boxes(data, start, end):
+        if box_type in CONTAINER_BOXES:
+            found.update(find_boxes(data, payload_start, payload_end))
+        else:
+            found.setdefault(box_type, (payload_start, payload_end))
+    return found
+
+
+def read_table(data: bytes, box: tuple[int, int], entry: str) -> list[tuple]:
+    """Read entries of a full box storing their count right after version and flags."""
+    start, _ = box
+    count = struct.unpack_from(">I", data, start + 4)[0]
+    return list(
+        struct.iter_unpack(entry, data[start + 8 :][: count * struct.calcsize(entry)])
+    )
+
+
+def media_start(data: bytes, boxes: dict[bytes, tuple[int, int]]) -> Optional[int]:
+    """Return media time the edit list starts presenting frames at, None if there's none."""
+    if b"elst" not in boxes:
+        return None
+    version = data[boxes[b"elst"][0]]
+    entry = ">QqI" if version == 1 else ">IiI"
+    for _, media_time, _ in read_table(data, boxes[b"elst"], entry):
+        # -1 marks an empty edit, delaying the start
+        if media_time >= 0:
+            return media_time
+    return None
+
+
+def read_track_index(data: bytes, boxes: dict[bytes, tuple[int, int]]) -> VideoIndex:
+    """Describe frames of a video track from its sample tables."""
+    mdhd = boxes[b"mdhd"][0]
+    if data[mdhd] == 1:
+        timescale = struct.unpack_from(">I", data, mdhd + 20)[0]
+    else:
+        timescale = struct.unpack_from(">I", data, mdhd + 12)[0]
+    # first sample entry: size, format and 24 bytes preceding the dimensions
+    width, height = struct.unpack_from(">HH", data, boxes[b"stsd"][0] + 8 + 8 + 24)
+
+    decode_times = []
+    time = 0
+    for count, delta in read_table(data, boxes[b"stts"], ">II"):
+        for _ in range(count):
+            decode_times.append(time)
+            time += delta
+    offsets = [0] * len(decode_times)
+    if b"ctts" in boxes:
+        sample = 0
+        for count, offset in read_table(data, boxes[b"ctts"], ">Ii"):
+            offsets[sample : sample + count] = [offset] * count
+            sample += count
+    presentation_times = [t + offset for t, offset in zip(decode_times, offsets)]
+    if b"stss" in boxes:
+        # sample numbers start from 1
+        sync_samples = [
+            number - 1 for number, in read_table(data, boxes[b"stss"], ">I")
+        ]
+    else:
+        sync_samples = list(range(len(decode_times)))
+
+    order = sorted(range(len(presentation_times)), key=presentation_times.__getitem__)
+    # frames presented before the edit list starts are decoded, but never output
+    first = media_start(data, boxes)
+    if first is None and order:
+        first = presentation_times[order[0]]
+    order = [sample for sample in order if presentation_times[sample] >= first]
+    rank = {sample: idx for idx, sample in enumerate(order)}
+    return VideoIndex(
+        width=width,
+        height=height,
+        timestamps=[
+            (presentation_times[sample] - first) * MICROSECONDS // timescale
+            for sample in order
+        ],
+        keyframes=sorted(rank[sample] for sample in sync_samples if sample in rank),
+    )
+
+
+def read_index(video_path: str) -> VideoIndex:
+    """Read index of the first video track of an MP4 file from its header only."""
+    with open(video_path, "rb") as file:
+        movie = read_movie_box(file)
+    for box_type, start, end in iter_boxes(movie, 0, len(movie)):
+        if box_type != b"trak":
+            continue
+        boxes = find_boxes(movie, start, end)
+        # handler type follows version, flags and 4 predefined bytes
+        if b"hdlr" in boxes and movie[boxes[b"hdlr"][0] + 8 :][:4] == b"vide":
+            return read_track_index(movie, boxes)
+    raise ValueError(f"{video_path} has no video track")
+
+
+def ffmpeg_command(
+    video_path: str,
+    size: tuple[int, int],
+    pixel_format: str,
+    start_us: int = 0,
+    ffmpeg: str = "ffmpeg",
+) -> list[str]:
+    """Build command writing raw frames of the video, starting at given time, to stdout.
+
+    ffmpeg seeks to the last keyframe before start_us and drops frames
+    presented before it, so the first frame written is exactly the one
+    presented at start_us.
+    """
+    # decoding from an open GOP keyframe reports missing references, expectedly
+    command = [ffmpeg, "-nostdin", "-v", "fatal"]
+    if start_us:
+        seconds, microseconds = divmod(start_us, MICROSECONDS)
+        command += ["-ss", f"{seconds}.{microseconds:06d}"]
+    width, height = size
+    command += ["-i", video_path, "-map", "0:v:0", "-vf", f"scale={width}:{height}"]
+    return command + ["-pix_fmt", pixel_format, "-f", "rawvideo", "-"]
+
+
+class VideoStream:
+    """Frames of a video decoded ahead of the requested one into a bounded ring buffer.
+
+    A reader thread, started on the first request, owns the ffmpeg process.
+    It reads frames following the last buffered one while there's room,
+    then drops the oldest ones, always keeping a quarter of the buffer behind
+    the requested frame for stepping back. When nothing is requested for
+    idle_timeout seconds, ffmpeg is stopped until it's needed again.
+
+    Requesting a frame before the buffered ones, or far enough ahead that
+    restarting is faster than decoding up to it, restarts ffmpeg at the last
+    keyframe before the frame.
+    """
+
+    def __init__(
+        self,
+        video_path: str,
+        index: VideoIndex,
+        size: tuple[int, int],
+        wrap: Callable[[bytes], Any],
+        budget_bytes: int,
+        pixel_format: str = "bgra",
+        ffmpeg: str = "ffmpeg",
+        idle_timeout: float = 5.0,
+    ) -> None:
+        """
+        Args:
+            video_path: path of the MP4 file.
+            index: already read index of the video.
+            size: size the frames are scaled to.
+            wrap: creates frame from its raw pixels, called by the reader thread.
+            budget_bytes: maximum number of bytes of buffered raw pixels,
+                at least 4 frames are buffered regardless.
+            pixel_format: ffmpeg name of the raw pixels layout, 4 bytes per pixel.
+            ffmpeg: ffmpeg executable.
+            idle_timeout: seconds the buffer stays full before ffmpeg is stopped.
+        """
+        self.video_path = video_path
+        self.index = index
+        self.size = size
+        self.wrap = wrap
+        self.pixel_format = pixel_format
+        self.ffmpeg = ffmpeg
+        self.idle_timeout = idle_timeout
+        self.frame_nbytes = size[0] * size[1] * 4
+        self.capacity = max(budget_bytes // self.frame_nbytes, 4)
+        self.behind = self.capacity // 4
+        self.frames: deque = deque()
+        # index of the oldest buffered frame
+        self.start = 0
+        self.target = 0
+        self.eof = False
+        self.closed = False
+        self.error: Optional[OSError] = None
+        self.process: Optional[subprocess.Popen] = None
+        self.thread: Optional[threading.Thread] = None
+        self.condition = threading.Condition()
+
+    @property
+    def end(self) -> int:
+        """Index of the frame following the last buffered one."""
+        return self.start + len(self.frames)
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes of buffered raw pixels."""
+        return len(self.frames) * self.frame_nbytes
+
+    def get(self, idx: int) -> Optional[Any]:
+        """Return frame with given index if it's buffered."""
+        with self.condition:
+            if self.start <= idx < self.end:
+                return self.frames[idx - self.start]
+            return None
+
+    def request(self, idx: int) -> Optional[Any]:
+        """Make the stream decode from given frame onwards, return it if it's buffered."""
+        with self.condition:
+            if self.target != idx:
+                self.target = idx
+                self.condition.notify_all()
+            if self.thread is None and not self.closed:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            return self.get(idx)
+
+    def read(self, idx: int) -> Any:
+        """Return frame with given index, waiting until it's decoded.
+
+        Raises:
+            OSError: if ffmpeg can't be started.
+            IndexError: if the video ends before the frame.
+        """
+        with self.condition:
+            frame = self.request(idx)
+            while frame is None:
+                if self.error is not None:
+                    raise self.error
+                if self.eof and not self.needs_seek():
+                    raise IndexError(f"Frame {idx} not found in {self.video_path}")
+                self.condition.wait()
+                frame = self.get(idx)
+            return frame
+
+    def needs_seek(self) -> bool:
+        """Check whether ffmpeg has to restart to get to the requested frame."""
+        target = self.target
+        if self.start <= target < self.end:
+            return False
+        if target < self.start:
+            return True
+        if self.eof:
+            # nothing follows the buffered frames
+            return False
+        if self.process is None:
+            return True
+        return self.index.keyframe_before(target) > self.end
+
+    def seek(self):
+        """Restart ffmpeg at the last keyframe before the requested frame."""
+        self.stop_process()
+        self.frames.clear()
+        self.start = self.index.keyframe_before(self.target)
+        self.eof = False
+        self.process = subprocess.Popen(
+            ffmpeg_command(
+                self.video_path,
+                self.size,
+                self.pixel_format,
+                self.index.timestamps[self.start] if self.start else 0,
+                self.ffmpeg,
+            ),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+        )
+        registry.count("video.seeks")
+
+    def stop_process(self):
+        if self.process is None:
+            return
+        self.process.kill()
+        self.process.stdout.close()
+        self.process.wait()
+        self.process = None
+
+    def next_process(self) -> Optional[subprocess.Popen]:
+        """Wait until another frame should be decoded, return process decoding it.
+
+        Returns None once the stream is closed.
+        """
+        while not self.closed:
+            if self.needs_seek():
+                self.seek()
+                return self.process
+            if self.process is not None:
+                if len(self.frames) < self.capacity:
+                    return self.process
+                if self.target - self.start > self.behind:
+                    self.frames.popleft()
+                    self.start += 1
+                    return self.process
+            if not self.condition.wait(self.idle_timeout) and self.process is not None:
+                # the buffer stayed full, free the process until it's needed
+                self.stop_process()
+        return None
+
+    def run(self):
+        """Fill the buffer with frames read from ffmpeg until the stream is closed."""
+        try:
+            while True:
+                with self.condition:
+                    process = self.next_process()
+                    if process is None:
+                        return
+                buffer = process.stdout.read(self.frame_nbytes)
+                frame = self.wrap(buffer) if len(buffer) == self.frame_nbytes else None
+                with self.condition:
+                    if frame is None:
+                        self.eof = True
+                        self.stop_process()
+                    else:
+                        self.frames.append(frame)
+                        registry.count("video.frames")
+                    self.condition.notify_all()
+        except OSError as error:
+            warnings.warn(f"Streaming {self.video_path} failed: {error!r}")
+            with self.condition:
+                self.error = error
+                self.condition.notify_all()
+        finally:
+            with self.condition:
+                self.stop_process()
+
+    def close(self):
+        """Stop ffmpeg and the reader thread, drop buffered frames."""
+        with self.condition:
+            self.closed = True
+            self.frames.clear()
+            self.condition.notify_all()
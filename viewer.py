@@ -0,0 +1,725 @@
+"""Viewer running every project as a scene of a single event loop.
+
+Every project is a Scene holding its own state, widgets and views.
+Switching projects only changes which scene the loop updates and draws,
+so it takes the same short time no matter how many times it's done.
+Frames of all the scenes are decoded into one shared cache, switching back
+to a scene displays its frames right away.
+
+Frame packs and metrics are prepared by a Loader, in background
+while the viewer already runs, starting with the displayed config.
+"""
+
+import threading
+import time
+import warnings
+from typing import Callable, Optional
+
+import pygame
+
+import settings
+from heatmap import HeatmapView
+from interpolation import InterpolatedView
+from layout import FRAME_X, LEFT_THIRD, MID_X, RIGHT_THIRD, Layout
+from metrics import compute_metrics, format_metrics
+from profiling import profiler
+from telemetry import phases, registry
+from helpers import (
+    Button,
+    ButtonLayout,
+    CheckBoxLayout,
+    FrameProvider,
+    FrameScheduler,
+    FrameView,
+    GridView,
+    Indexing,
+    Orientation,
+    PlaybackMode,
+    Prefetcher,
+    ProgressBar,
+    Renderer,
+    Text,
+    ZoomView,
+    create_executor,
+    perf_overlay,
+    set_idx,
+    handle_arrows,
+    handle_diff_flag,
+    handle_overlay_flag,
+    handle_profile_flag,
+    handle_grid_flag,
+    handle_play_flag,
+)
+
+
+def initialize_media_buttons(layout: Layout, y: float):
+    """Create buttons controlling playback and views, shared by every project.
+
+    Args:
+        layout: layout of the window.
+        y: position of the buttons on the y coordinate, in design units.
+    """
+    small_button_width = layout.size(70)
+    height = layout.size(50)
+    y = layout.y(y)
+    arrows = ButtonLayout(
+        ["<", ">"],
+        active_ids=[0, 1],
+        width=small_button_width,
+        height=height,
+        distance=layout.size(settings.HORIZONTAL_DISTANCE),
+        orientation=Orientation.HORIZONTAL,
+        x=layout.x(FRAME_X),
+        y=y,
+    )
+    play_button = Button(
+        text="Play",
+        y=y,
+        x=layout.x(LEFT_THIRD),
+        width=layout.size(200),
+        height=height,
+        active=True,
+    )
+    grid_button = Button(
+        text="Grid",
+        y=y,
+        x=layout.x(FRAME_X + 180),
+        width=layout.size(150),
+        height=height,
+    )
+    diff_button = Button(
+        text="Diff",
+        y=y,
+        x=layout.x(FRAME_X + 340),
+        width=layout.size(150),
+        height=height,
+    )
+    return arrows, play_button, grid_button, diff_button
+
+
+class Scene:
+    """Project displayed by the viewer, e.g. sampling ablations on lego.
+
+    Holds everything a project displays: current config, frame index, playback
+    state, widgets and views. All of it is kept while other scenes are displayed.
+    Subclasses create checkboxes choosing the config and describe its folders.
+    In smooth mode, playback displays frames interpolated in between the frames
+    of the folder, as many as fit the loop's frame rate, at the same orbit speed.
+    Widgets are placed in design units by the layout of the window, and placed
+    anew whenever the window changes its size.
+    """
+
+    # text of the checkbox displaying the scene
+    title = ""
+
+    def __init__(
+        self,
+        folders: FrameProvider,
+        folder_data: dict,
+        layout: Layout,
+        media_buttons_y: float,
+        labels_position: tuple[float, float],
+        play_speed: float = 0.07,
+    ) -> None:
+        """
+        Args:
+            folders: frames of the dataset, placed by the layout.
+            folder_data: parameters of the config displayed first.
+            layout: layout of the window.
+            media_buttons_y: position of the playback buttons on the y coordinate,
+                in design units.
+            labels_position: position of the metrics label in design units,
+                reference of the heatmap is described under it.
+            play_speed: how long every frame is displayed during playback, in seconds.
+        """
+        self.folders = folders
+        self.index = folders.index
+        self.folder_data = folder_data
+        self.layout = layout
+        self.media_buttons_y = media_buttons_y
+        self.labels_position = labels_position
+        self.play_speed = play_speed
+        self.prefetcher = Prefetcher(folders)
+        self.frame_view = FrameView(self.prefetcher)
+        self.zoom_view = ZoomView(self.frame_view)
+        # in-betweens after every frame, so smooth playback runs at the target rate
+        self.steps = max(round(play_speed * settings.TARGET_FPS) - 1, 0)
+        self.interpolated_view = InterpolatedView(self.frame_view, self.steps)
+        self.smooth = False
+        # in-between of the current frame displayed in smooth playback, 0 is the frame
+        self.step = 0
+        # 1 if playback goes forward, -1 if it goes back
+        self.direction = 1
+        self.create_media_widgets()
+        self.folder_name = self.index.folder_name(folder_data)
+        self.neighbours = self.neighbour_folder_names()
+        images = folders[self.folder_name]
+        self.grid_view = self.create_grid_view()
+        self.heatmap_view = HeatmapView(folders)
+        # filled by the Loader
+        self.folder_metrics = {}
+        self.reference_name: Optional[str] = None
+        self.image_idx = 0
+        self.max_idx = len(images) - 1
+        self.play = False
+        self.main_view = self.frame_view
+        self.update_folder = False
+        # when the last config change was made, until its frame is displayed
+        self.click_time: Optional[float] = None
+
+    @property
+    def frame_duration(self) -> float:
+        """How long every displayed frame lasts during playback, in-betweens included."""
+        if self.smooth:
+            return self.play_speed / (self.steps + 1)
+        return self.play_speed
+
+    @property
+    def positions(self) -> int:
+        """Number of positions of playback, every frame and its in-betweens."""
+        return (self.max_idx + 1) * (self.steps + 1 if self.smooth else 1)
+
+    @property
+    def position(self) -> int:
+        """Position of playback displayed now."""
+        if self.smooth:
+            return self.image_idx * (self.steps + 1) + self.step
+        return self.image_idx
+
+    def create_layouts(self, layout: Layout):
+        """Create the checkboxes choosing the config and other widgets of the scene."""
+        raise NotImplementedError
+
+    def update_layouts(self, event: pygame.event.EventType) -> bool:
+        """Pass event to the checkboxes choosing the config, return whether any changed."""
+        raise NotImplementedError
+
+    def read_layouts(self):
+        """Update folder_data with the config chosen by the checkboxes."""
+        raise NotImplementedError
+
+    def show_params(self, params: dict[str, str]):
+        """Check the checkboxes choosing config with given parameters."""
+        raise NotImplementedError
+
+    def neighbour_folder_names(self) -> list[str]:
+        """Return names of folders reachable from the current one with a single click."""
+        raise NotImplementedError
+
+    def grid_folders(self) -> tuple[list[str], list[str]]:
+        """Return folders compared in grid view and their labels."""
+        raise NotImplementedError
+
+    def describe_folder(self, folder_name: str) -> str:
+        """Return short description of the config stored in the folder."""
+        raise NotImplementedError
+
+    def metrics_references(self) -> dict[str, str]:
+        """Return name of the reference every folder is measured against."""
+        raise NotImplementedError
+
+    def get_layout_widgets(self) -> list:
+        """Return widgets of the scene other than the views and playback buttons."""
+        raise NotImplementedError
+
+    def create_media_widgets(self):
+        """Create playback buttons and metrics labels in the current layout."""
+        layout = self.layout
+        (
+            self.arrows_buttons,
+            self.play_button,
+            self.grid_button,
+            self.diff_button,
+        ) = initialize_media_buttons(layout, self.media_buttons_y)
+        labels_x, labels_y = self.labels_position
+        self.metrics_label = Text(
+            "", layout.x(labels_x), layout.y(labels_y), font=settings.label_font
+        )
+        self.reference_label = Text(
+            "", layout.x(labels_x), layout.y(labels_y + 50), font=settings.label_font
+        )
+
+    def create_grid_view(self) -> GridView:
+        """Create grid covering the frames, resampling cells from their packs."""
+        return GridView(
+            self.folders.dataset_dir,
+            self.index,
+            self.layout.frame_rect(),
+            packs=self.folders.packs,
+        )
+
+    def resize(self, layout: Layout):
+        """Place everything anew in a window of another size, keeping the state.
+
+        Widgets are created anew in the new layout and set to the state
+        of the old ones. Frames are resampled from the packs for the new
+        size, nothing is decoded from the images again.
+        """
+        self.prefetcher.cancel()
+        self.layout = layout
+        self.create_layouts(layout)
+        self.show_params(self.index.folders[self.folder_name].params)
+        self.read_layouts()
+        buttons = (self.play_button, self.grid_button, self.diff_button)
+        active = [button.active for button in buttons]
+        self.create_media_widgets()
+        buttons = (self.play_button, self.grid_button, self.diff_button)
+        for button, was_active in zip(buttons, active):
+            button.active = was_active
+        rect = layout.frame_rect()
+        self.folders.resize(rect.centerx, rect.centery, rect.width, rect.height)
+        self.grid_view.stop()
+        self.grid_view = self.create_grid_view()
+        self.heatmap_view.stop()
+        self.heatmap_view = HeatmapView(self.folders)
+        self.frame_view = FrameView(self.prefetcher)
+        self.zoom_view.set_frame_view(self.frame_view)
+        self.interpolated_view.set_frame_view(self.frame_view)
+        self.main_view = self.frame_view
+
+    def is_comparable(self, reference_name: str) -> bool:
+        """Check whether the current folder can be compared with the reference."""
+        return True
+
+    def update_metrics(self, compute: bool = False, workers: Optional[int] = None):
+        """Read stored metrics of every config, computing the missing ones if asked."""
+        self.folder_metrics.update(
+            compute_metrics(
+                self.index,
+                self.metrics_references(),
+                settings.FRAME_PACK_DIR,
+                workers,
+                stored_only=not compute,
+            )
+        )
+
+    def select_folder(self, folder_name: str):
+        """Display config stored in the folder, as if it was chosen with the checkboxes."""
+        self.show_params(self.index.folders[folder_name].params)
+        self.read_layouts()
+        self.folder_name = self.index.folder_name(self.folder_data)
+        self.neighbours = self.neighbour_folder_names()
+
+    def leave(self):
+        """Stop background work of the scene, another one is displayed now."""
+        self.prefetcher.cancel()
+        self.interpolated_view.stop()
+
+    def handle_event(self, event: pygame.event.EventType):
+        """Pass event to the widgets of the scene."""
+        index_direction = None
+
+        # .update() function in layouts returns True
+        # only if any of the checkbox or button was activated
+        # if that happened we know something changed, and can act on it later
+        if self.update_layouts(event):
+            self.update_folder = True
+
+        # play and play_button is passed
+        # because clicking any of the arrow
+        # stops the animation
+        self.play, index_direction = handle_arrows(
+            self.arrows_buttons, self.play, self.play_button, event
+        )
+        self.play = handle_play_flag(self.play_button, self.play, event)
+        handle_grid_flag(self.grid_button, event)
+        handle_diff_flag(self.diff_button, event)
+        # only the frame itself is magnified, not the grid or heatmap
+        if self.main_view in (self.frame_view, self.zoom_view, self.interpolated_view):
+            self.zoom_view.handle_event(event)
+
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_LEFT:
+                index_direction = Indexing.PREVIOUS
+            if event.key == pygame.K_RIGHT:
+                index_direction = Indexing.NEXT
+
+        if index_direction is not None:
+            self.step = 0
+            self.image_idx = set_idx(self.image_idx, self.max_idx, index_direction)
+
+    def update(self, loop_start: float, position: Optional[int] = None):
+        """Act upon the events handled since the last update.
+
+        Args:
+            loop_start: when the loop started processing the events.
+            position: position of playback to display, None if it stays.
+        """
+        if self.update_folder:
+            self.update_folder = False
+            self.click_time = loop_start
+            self.read_layouts()
+            self.folder_name = self.index.folder_name(self.folder_data)
+            self.neighbours = self.neighbour_folder_names()
+
+        if position is not None:
+            # shorter way around tells the direction, even across the ends
+            moved = (position - self.position) % self.positions
+            self.direction = 1 if moved <= self.positions / 2 else -1
+            if self.smooth:
+                self.image_idx, self.step = divmod(position, self.steps + 1)
+            else:
+                self.image_idx = position
+        if not self.play:
+            self.step = 0
+
+        # folder displayed when the heatmap is turned on becomes the reference
+        if self.reference_name is not None and not self.is_comparable(
+            self.reference_name
+        ):
+            self.diff_button.active = False
+        if not self.diff_button.active:
+            self.reference_name = None
+        elif self.reference_name is None:
+            self.reference_name = self.folder_name
+
+        if self.grid_button.active:
+            self.grid_view.set_folders(*self.grid_folders())
+            self.grid_view.set_frame(self.image_idx)
+            self.main_view = self.grid_view
+        elif self.diff_button.active:
+            self.heatmap_view.set_frame(
+                self.folder_name, self.reference_name, self.image_idx
+            )
+            self.main_view = self.heatmap_view
+        elif self.zoom_view.active:
+            self.zoom_view.set_frame(self.folder_name, self.image_idx, self.neighbours)
+            self.main_view = self.zoom_view
+        elif self.smooth and self.play:
+            self.frame_view.set_frame(self.folder_name, self.image_idx, self.neighbours)
+            self.interpolated_view.set_frame(
+                self.folder_name, self.image_idx, self.step, self.direction
+            )
+            self.main_view = self.interpolated_view
+        else:
+            self.frame_view.set_frame(self.folder_name, self.image_idx, self.neighbours)
+            self.main_view = self.frame_view
+        self.metrics_label.text = (
+            format_metrics(self.folder_metrics[self.folder_name])
+            if self.folder_name in self.folder_metrics
+            else "PSNR / SSIM: not computed"
+        )
+        self.reference_label.text = (
+            f"Difference to: {self.describe_folder(self.reference_name)}"
+            if self.reference_name
+            else ""
+        )
+
+    def get_widgets(self) -> list:
+        """Return everything the scene displays, in drawing order."""
+        return [
+            self.main_view,
+            self.play_button,
+            self.grid_button,
+            self.diff_button,
+            *self.arrows_buttons.get_widgets(),
+            self.metrics_label,
+            self.reference_label,
+            *self.get_layout_widgets(),
+        ]
+
+
+class Viewer:
+    """Display one scene at a time, switched with the project checkboxes.
+
+    A single loop, scheduler and renderer serve every scene. Widgets of the
+    previous scene are cleared by the renderer like any other widget that
+    disappeared, so a switch redraws only what differs between the scenes.
+    When the window changes its size, every scene is laid out anew, once
+    per loop iteration no matter how many resize events arrived.
+    S key turns smooth playback of every scene on and off. Playback follows
+    the clock of the scheduler, [ and ] keys change its speed, R plays
+    backwards and P back and forth.
+    """
+
+    def __init__(
+        self,
+        screen: pygame.SurfaceType,
+        scenes: list[Scene],
+        layout: Optional[Layout] = None,
+    ) -> None:
+        """
+        Args:
+            screen: display surface.
+            scenes: scenes in order of their checkboxes, the first one is displayed.
+            layout: layout the scenes were created in, of the screen by default.
+        """
+        self.screen = screen
+        self.scenes = {scene.title: scene for scene in scenes}
+        self.scene = scenes[0]
+        self.layout = layout or Layout(*screen.get_size())
+        self.create_widgets()
+        self.renderer = Renderer()
+        self.scheduler = FrameScheduler(self.scene.frame_duration)
+        self.loader: Optional[Loader] = None
+        self.resized = False
+        self.running = False
+
+    def create_widgets(self):
+        """Create project checkboxes and progress bar in the current layout."""
+        layout = self.layout
+        self.project_checkboxes = CheckBoxLayout(
+            list(self.scenes),
+            active_ids=[list(self.scenes).index(self.scene.title)],
+            width=layout.size(350),
+            height=layout.size(50),
+            distance=layout.size(settings.VERTICAL_DISTANCE),
+            x=layout.x(RIGHT_THIRD),
+            y=layout.y(100),
+            orientation=Orientation.VERTICAL,
+        )
+        self.progress_bar = ProgressBar(
+            x=layout.x(MID_X - 300),
+            y=layout.y(settings.DESIGN_SIZE[1] - 60),
+            width=layout.size(600),
+            height=layout.size(10),
+        )
+
+    def resize(self):
+        """Lay out every scene anew in the current size of the window."""
+        self.resized = False
+        self.screen = pygame.display.get_surface() or self.screen
+        layout = Layout(*self.screen.get_size())
+        if layout == self.layout:
+            return
+        self.layout = layout
+        settings.set_font_scale(layout.scale)
+        for scene in self.scenes.values():
+            scene.resize(layout)
+        self.create_widgets()
+        self.renderer.invalidate()
+        registry.count("viewer.resizes")
+
+    def select_folder(self, folder_name: str):
+        """Display config stored in the folder, in the scene of its dataset.
+
+        Raises:
+            KeyError: no scene has such folder.
+        """
+        for scene in self.scenes.values():
+            if folder_name in scene.index:
+                scene.select_folder(folder_name)
+                self.project_checkboxes.deactivate_all_checkboxes()
+                self.project_checkboxes[scene.title].active = True
+                self.switch(scene.title)
+                return
+        raise KeyError(f"No scene has folder {folder_name}")
+
+    def set_smooth(self, smooth: bool):
+        """Turn playback interpolated in between the frames on or off."""
+        for scene in self.scenes.values():
+            scene.smooth = smooth
+        self.scheduler.set_frame_duration(self.scene.frame_duration)
+
+    def handle_playback_key(self, key: int):
+        """Change how playback runs, with keys shared by every scene."""
+        if key == pygame.K_s:
+            self.set_smooth(not self.scene.smooth)
+        elif key == pygame.K_LEFTBRACKET:
+            self.scheduler.change_speed(-1)
+        elif key == pygame.K_RIGHTBRACKET:
+            self.scheduler.change_speed(1)
+        elif key == pygame.K_r:
+            self.scheduler.toggle_mode(PlaybackMode.REVERSE)
+        elif key == pygame.K_p:
+            self.scheduler.toggle_mode(PlaybackMode.PING_PONG)
+
+    def start_loading(self, loader: "Loader"):
+        """Prepare the scenes in background, displaying progress until it's done."""
+        self.loader = loader
+        loader.start()
+
+    def switch(self, title: str):
+        """Display scene with given title, as it was when it was left."""
+        scene = self.scenes[title]
+        if scene is self.scene:
+            return
+        self.scene.leave()
+        self.scene = scene
+        self.scheduler.set_frame_duration(scene.frame_duration)
+        registry.count("viewer.scene_switches")
+
+    def handle_event(self, event: pygame.event.EventType, loop_start: float):
+        """Handle events of the viewer itself, pass the rest to the current scene."""
+        if self.project_checkboxes.update(event):
+            self.switch(self.project_checkboxes.get_active_checkboxes()[0].text)
+            self.scene.click_time = loop_start
+        handle_overlay_flag(perf_overlay, event)
+        handle_profile_flag(profiler, event)
+        if event.type == pygame.KEYDOWN:
+            self.handle_playback_key(event.key)
+        if event.type in (pygame.VIDEORESIZE, pygame.WINDOWSIZECHANGED):
+            self.resized = True
+        if event.type == pygame.QUIT or (
+            event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE
+        ):
+            self.running = False
+        self.scene.handle_event(event)
+
+    def run(self):
+        """Process input and draw the current scene until the viewer is closed."""
+        self.running = True
+        self.renderer.invalidate()
+        while self.running:
+            # if user does not do any action (no mouse movement, no keyboard action)
+            # the loop sleeps until there is one, or until the next frame of playback is due
+            events = self.scheduler.wait_events(
+                busy=self.scene.main_view.waiting or self.renderer.full_redraw
+            )
+            loop_start = time.perf_counter()
+            phases.begin()
+            for event in events:
+                self.handle_event(event, loop_start)
+            if self.resized:
+                self.resize()
+
+            phases.lap("events")
+            scene = self.scene
+            self.scheduler.set_playing(scene.play, scene.position, scene.positions)
+            scene.update(loop_start, self.scheduler.advance())
+            # only the widgets that changed since the last iteration are redrawn
+            widgets = [*scene.get_widgets(), *self.project_checkboxes.get_widgets()]
+            registry.observe(
+                "loop.events_ms", (time.perf_counter() - loop_start) * 1000
+            )
+            phases.lap("state")
+            if self.loader is not None and not self.loader.finished:
+                self.progress_bar.set_progress(
+                    self.loader.done, self.loader.total, self.loader.description
+                )
+                widgets.append(self.progress_bar)
+            if perf_overlay.visible:
+                perf_overlay.update()
+                widgets.append(perf_overlay)
+            if self.renderer.render(self.screen, widgets):
+                registry.observe(
+                    "loop.frame_ms", (time.perf_counter() - loop_start) * 1000
+                )
+            if scene.click_time is not None and not scene.main_view.waiting:
+                registry.observe(
+                    "input.click_to_photon_ms",
+                    (time.perf_counter() - scene.click_time) * 1000,
+                )
+                scene.click_time = None
+            profiler.frame()
+
+
+class Loader:
+    """Prepare frame packs and metrics of every scene, the displayed config first.
+
+    Packs are synced one folder at a time, always picking the folder closest
+    to the one displayed at that moment, so whatever the user looks at during
+    loading is ready first. Meanwhile, frames that aren't packed yet are
+    decoded from the images on demand, as usual.
+    """
+
+    def __init__(
+        self,
+        viewer: Viewer,
+        packs: bool = True,
+        preload: bool = False,
+        metrics: bool = False,
+        workers: Optional[int] = settings.DECODE_WORKERS,
+    ) -> None:
+        """
+        Args:
+            viewer: viewer of the scenes.
+            packs: whether to sync frame packs of every folder.
+            preload: whether to decode all frames into the cache afterwards.
+            metrics: whether to compute missing metrics, stored ones are always read.
+            workers: number of processes decoding frames and computing metrics.
+        """
+        self.viewer = viewer
+        self.workers = workers
+        self.pending_packs: set[tuple[str, str]] = set()
+        if packs:
+            self.pending_packs = {
+                (scene.title, folder_name)
+                for scene in viewer.scenes.values()
+                for folder_name in scene.folders
+            }
+        self.steps: list[tuple[str, Callable[[], None]]] = []
+        for scene in viewer.scenes.values():
+            self.steps.append(
+                (
+                    f"{scene.title}: metrics",
+                    lambda scene=scene: scene.update_metrics(metrics, workers),
+                )
+            )
+        if preload:
+            for scene in viewer.scenes.values():
+                self.steps.append(
+                    (
+                        f"{scene.title}: decoding frames",
+                        lambda scene=scene: scene.folders.preload(workers=workers),
+                    )
+                )
+        self.total = len(self.pending_packs) + len(self.steps)
+        self.done = 0
+        self.description = ""
+        self.error: Optional[Exception] = None
+        self.thread: Optional[threading.Thread] = None
+        # posted after every step, wakes the loop to display progress
+        self.event_type = pygame.event.custom_type()
+
+    @property
+    def finished(self) -> bool:
+        return self.done == self.total or self.error is not None
+
+    def rank(self, pack: tuple[str, str]) -> tuple:
+        """Order packs by how close they are to the displayed config."""
+        title, folder_name = pack
+        scenes = list(self.viewer.scenes.values())
+        scene = self.viewer.scenes[title]
+        scene_rank = -1 if scene is self.viewer.scene else scenes.index(scene)
+        if folder_name == scene.folder_name:
+            folder_rank = 0
+        elif folder_name in scene.neighbours:
+            folder_rank = 1 + scene.neighbours.index(folder_name)
+        else:
+            folder_rank = len(scene.neighbours) + 1
+        return scene_rank, folder_rank, folder_name
+
+    def advance(self):
+        self.done += 1
+        if pygame.display.get_init():
+            pygame.event.post(pygame.event.Event(self.event_type))
+
+    def run(self):
+        """Do all the work in the calling thread."""
+        executor = None
+        try:
+            while self.pending_packs:
+                pack = min(self.pending_packs, key=self.rank)
+                self.pending_packs.remove(pack)
+                title, folder_name = pack
+                self.description = f"{title}: loading {folder_name}"
+                folder = self.viewer.scenes[title].folders[folder_name]
+                if executor is None and not folder.has_valid_pack(
+                    settings.FRAME_PACK_DIR
+                ):
+                    executor = create_executor(self.workers)
+                folder.sync_pack(settings.FRAME_PACK_DIR, self.workers, executor)
+                self.advance()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        for description, step in self.steps:
+            self.description = description
+            step()
+            self.advance()
+
+    def work(self):
+        try:
+            self.run()
+        except Exception as error:
+            # the viewer keeps decoding frames from the images
+            self.error = error
+            warnings.warn(f"Loading in background failed: {error!r}")
+            if pygame.display.get_init():
+                pygame.event.post(pygame.event.Event(self.event_type))
+
+    def start(self):
+        """Do all the work in a background thread."""
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()